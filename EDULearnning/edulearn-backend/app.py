@@ -1,20 +1,36 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, request
 import os
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import Config
 from extensions import mongo
+from utils.indexes import reconcile_indexes, register_index_commands
+from utils.message_bus import start_change_stream_listener
+from utils.identity import configure_identity_cache
+from utils.passwords import configure_password_hasher, PasswordHasherBusy
+from utils.metrics import configure_metrics
+from utils.query_detector import configure_query_detector
+from utils.search_keys import register_search_commands
+from utils.regrade import configure_regrade_worker, register_regrade_commands, register_progress_commands
+from utils.certificate_verifier import configure_certificate_verifier
+from utils.static_manifest import StaticManifest
 
 def create_app() -> Flask:
     app = Flask(__name__)
     app.config.from_object(Config)
 
-    # Initialize shared Mongo and JWT
-    mongo.init_app(app)
+    # Initialize shared Mongo and JWT; the metrics and N+1 command listeners have
+    # to be handed to the client when it is created
+    mongo.init_app(app, event_listeners=configure_metrics(app) + configure_query_detector(app))
     JWTManager(app)
+    configure_identity_cache(app)
+    configure_password_hasher(app)
+    configure_regrade_worker(app)
+    configure_certificate_verifier(app)
 
     # Enable CORS for API routes
-    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True,
+         expose_headers=["X-Next-Cursor", "X-Total-Count"])
 
     # Import and register blueprints with URL prefixes
     from routes.auth import auth as auth_bp
@@ -35,44 +51,77 @@ def create_app() -> Flask:
     app.register_blueprint(admin_bp, url_prefix="/api/admin")
     app.register_blueprint(messages_bp, url_prefix="/api/messages")
 
-    # Serve frontend
+    # Cross-worker delivery for the messaging event stream
+    if app.config.get('MESSAGE_CHANGE_STREAM'):
+        from routes.messages import publish_new_message
+        start_change_stream_listener(app, 'messages', publish_new_message)
+
+    # Index management: `flask indexes sync` / `flask indexes audit`
+    register_index_commands(app)
+    # User search keys for existing users: `flask users backfill-search-keys`
+    register_search_commands(app)
+    # Re-grade jobs: `flask regrade enqueue|retry|run|status`
+    register_regrade_commands(app)
+    # Per-user assessment progress from the attempt history: `flask progress rebuild`
+    register_progress_commands(app)
+    if app.config.get('ENSURE_INDEXES'):
+        with app.app_context():
+            report = reconcile_indexes(mongo.db)
+        for collection, entry in report.items():
+            for name in entry['created']:
+                app.logger.info('Created index %s.%s', collection, name)
+            for name in entry['extra']:
+                app.logger.warning('Undeclared index %s.%s', collection, name)
+
+    # Serve frontend from a manifest built once at startup: content-hash ETags and
+    # precompressed gzip/brotli variants, answered without touching the disk
     FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    BACKEND_DIR = os.path.abspath(os.path.dirname(__file__))
+    static_manifest = StaticManifest(
+        FRONTEND_DIR,
+        app.config['STATIC_CACHE_DIR'],
+        exclude_dirs=[BACKEND_DIR],
+        memory_max_bytes=app.config['STATIC_MEMORY_MAX_BYTES'],
+        accel_redirect_prefix=app.config.get('STATIC_ACCEL_REDIRECT_PREFIX'),
+        check_mtime=app.config.get('STATIC_CHECK_MTIME', False)
+    ).build()
+    app.extensions['static_manifest'] = static_manifest
+
+    def serve_frontend(filename):
+        response = static_manifest.serve(filename, request)
+        if response is None:
+            return jsonify({"message": "Not found"}), 404
+        return response
 
     @app.route('/')
     def serve_homepage():
-        return send_from_directory(FRONTEND_DIR, 'homepage.html')
+        return serve_frontend('homepage.html')
 
     @app.route('/js/<path:filename>')
     def serve_js(filename):
-        return send_from_directory(os.path.join(FRONTEND_DIR, 'js'), filename)
+        return serve_frontend('js/' + filename)
 
-    # Serve any existing file under project root (html, css, images, etc.)
+    # Serve any frontend file under project root (html, css, images, etc.)
     @app.route('/<path:filename>')
     def serve_static_any(filename):
-        target = os.path.join(FRONTEND_DIR, filename)
-        if os.path.isfile(target):
-            directory = os.path.dirname(filename)
-            basename = os.path.basename(filename)
-            base_dir = os.path.join(FRONTEND_DIR, directory) if directory else FRONTEND_DIR
-            return send_from_directory(base_dir, basename)
-        return jsonify({"message": "Not found"}), 404
+        return serve_frontend(filename)
 
     # Short routes
     @app.route('/login')
     def route_login():
-        return send_from_directory(FRONTEND_DIR, 'login.html')
+        return serve_frontend('login.html')
 
     @app.route('/signup')
     def route_signup():
-        return send_from_directory(FRONTEND_DIR, 'studentSignUp.html')
+        return serve_frontend('studentSignUp.html')
 
     @app.route('/teacher/login')
     def route_teacher_login():
-        return send_from_directory(FRONTEND_DIR, 'teacherlogin.html')
+        return serve_frontend('teacherlogin.html')
 
     @app.route('/teacher/signup')
     def route_teacher_signup():
-        return send_from_directory(FRONTEND_DIR, 'teacherSignUp.html')
+        return serve_frontend('teacherSignUp.html')
 
     # Error handlers
     @app.errorhandler(404)
@@ -83,9 +132,15 @@ def create_app() -> Flask:
     def server_error(_e):
         return jsonify({"message": "Internal server error"}), 500
 
-    return app
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(e):
+        return jsonify({"message": str(e)}), 503, {"Retry-After": "1"}
 
-app = create_app()
+    return app
 
+# Created only when run directly: the spawned certificate export processes
+# import this file as __mp_main__. `flask run` and gunicorn "app:create_app()"
+# use the factory.
 if __name__ == "__main__":
+    app = create_app()
     app.run(debug=True)
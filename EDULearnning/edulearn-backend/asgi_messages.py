@@ -0,0 +1,425 @@
+"""
+ASGI variant of the messaging API (/api/messages/*) on Motor.
+
+Serves the same routes, JWT validation and response bodies as
+routes/messages.py, but every request runs on one event loop, so an open
+chat or event stream costs a coroutine instead of a worker thread.
+Run it next to the Flask app and route /api/messages/ to it:
+
+    uvicorn asgi_messages:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+from bson import ObjectId
+from flask import Flask
+from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt_identity
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from config import Config
+from modles.message import Message, Conversation, PROFILE_FIELDS
+from modles.user import User
+from routes.messages import (
+    STREAM_KEEPALIVE_SECONDS, SEARCH_LIMIT, format_conversation, format_participant,
+    format_recipient, format_message, format_message_event, format_search_user
+)
+from utils.message_bus import AsyncMessageBus, format_sse, watch_inserts
+from utils.pagination import parse_limit
+from utils.search_keys import rank_results
+
+logger = logging.getLogger(__name__)
+
+# Flask app used only for its config, JWT checks and JSON encoder, so tokens are
+# accepted/rejected and errors worded exactly as in the Flask API
+shared_app = Flask(__name__)
+shared_app.config.from_object(Config)
+JWTManager(shared_app)
+
+PROFILE_PROJECTION = {field: 1 for field in PROFILE_FIELDS}
+
+
+def json_response(payload, status_code=200):
+    return Response(shared_app.json.dumps(payload), status_code=status_code, media_type='application/json')
+
+
+def authenticate(request, locations=('headers',)):
+    """Return (user_id, None) for a valid token, or (None, error response)"""
+    with shared_app.test_request_context(
+        request.url.path,
+        headers=list(request.headers.items()),
+        query_string=request.url.query
+    ):
+        try:
+            verify_jwt_in_request(locations=list(locations))
+            return get_jwt_identity(), None
+        except Exception as e:
+            error = shared_app.make_response(shared_app.handle_user_exception(e))
+            return None, Response(error.get_data(), status_code=error.status_code, media_type=error.mimetype)
+
+
+async def publish_new_message(request, message):
+    """Push a new message and the recipient's unread count to their open streams"""
+    bus = request.app.state.bus
+    recipient_id = str(message['recipient_id'])
+    if not bus.has_subscribers(recipient_id):
+        return
+    bus.publish(recipient_id, 'message', format_message_event(message))
+    unread = await request.app.state.db.messages.count_documents(Message.unread_filter(recipient_id))
+    bus.publish(recipient_id, 'unread', {'unreadCount': unread})
+
+
+async def get_conversations(request):
+    """Get all conversations for the current user"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        db = request.app.state.db
+        conversations = []
+        backfill = []
+        async for conv in db.conversations.aggregate(Conversation.inbox_pipeline(current_user_id)):
+            update = Conversation.fill_missing_profiles(conv)
+            if update is not None:
+                backfill.append(update)
+            conversations.append(conv)
+        if backfill:
+            await db.conversations.bulk_write(backfill, ordered=False)
+
+        result = []
+        for conv in conversations:
+            formatted = format_conversation(conv, current_user_id)
+            if formatted:
+                result.append(formatted)
+
+        return json_response({'success': True, 'conversations': result})
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error fetching conversations: {str(e)}'}, 500)
+
+
+async def get_conversation_messages(request):
+    """Get messages in a conversation, most recent page first (same query args as the Flask route)"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        db = request.app.state.db
+        conversation_id = request.path_params['conversation_id']
+        before = request.query_params.get('before')
+        since = request.query_params.get('since')
+        limit = parse_limit(request.query_params.get('limit'), default=50)
+
+        position, op = (since, '$gt') if since else (before, '$lt')
+        cursor, cursor_error = None, None
+        if position:
+            try:
+                cursor = Message.parse_cursor(position)
+            except ValueError as e:
+                cursor_error = e
+
+        # The conversation and the cursor's anchor message are independent lookups
+        anchor_lookup = None
+        if isinstance(cursor, ObjectId):
+            anchor_lookup = db.messages.find_one(Message.anchor_query(conversation_id, cursor), {'timestamp': 1})
+        conversation, anchor = await asyncio.gather(
+            db.conversations.find_one({'_id': ObjectId(conversation_id)}),
+            anchor_lookup if anchor_lookup is not None else _none()
+        )
+
+        if not conversation:
+            return json_response({'success': False, 'message': 'Conversation not found'}, 404)
+
+        participants = [str(p) for p in conversation.get('participants', [])]
+        if current_user_id not in participants:
+            return json_response({'success': False, 'message': 'Unauthorized access to conversation'}, 403)
+
+        if anchor_lookup is not None and not anchor:
+            cursor_error = ValueError('Unknown message cursor')
+        if cursor_error:
+            return json_response({'success': False, 'message': str(cursor_error)}, 400)
+
+        keyset = None
+        if anchor:
+            keyset = Message.keyset_condition(op, anchor['timestamp'], anchor['_id'])
+        elif cursor is not None:
+            keyset = Message.keyset_condition(op, cursor)
+        query, sort = Message.page_query(conversation_id, keyset, newest_first=not since)
+
+        other_participant_id = Conversation.get_other_participant(
+            conversation_id,
+            current_user_id,
+            conversation=conversation
+        )
+        other_user = None
+        if other_participant_id:
+            other_user = Conversation.get_participant_profile(conversation, other_participant_id)
+
+        # The page and a fallback profile lookup for legacy conversations run together
+        messages_list, looked_up = await asyncio.gather(
+            db.messages.find(query).sort(sort).limit(limit + 1).to_list(None),
+            db.users.find_one({'_id': ObjectId(other_participant_id)}, PROFILE_PROJECTION)
+            if other_participant_id and not other_user else _none()
+        )
+        messages_list, has_more = Message.finish_page(messages_list, limit, newest_first=not since)
+        other_user = other_user or looked_up
+
+        # Mark messages as read (scrolling back only shows already-seen history)
+        if not before:
+            await db.messages.update_many(
+                Message.unread_filter(current_user_id, conversation_id),
+                {'$set': {'is_read': True}}
+            )
+            bus = request.app.state.bus
+            if bus.has_subscribers(current_user_id):
+                unread = await db.messages.count_documents(Message.unread_filter(current_user_id))
+                bus.publish(current_user_id, 'unread', {'unreadCount': unread})
+
+        return json_response({
+            'success': True,
+            'messages': [format_message(msg, current_user_id) for msg in messages_list],
+            'hasMore': has_more,
+            'participant': format_participant(other_participant_id, other_user)
+        })
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error fetching messages: {str(e)}'}, 500)
+
+
+async def send_message(request):
+    """Send a new message"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        db = request.app.state.db
+        data = await request.json()
+
+        conversation_id = data.get('conversationId')
+        text = data.get('text', '').strip()
+
+        if not conversation_id or not text:
+            return json_response({
+                'success': False,
+                'message': 'Conversation ID and message text are required'
+            }, 400)
+
+        conversation = await db.conversations.find_one({'_id': ObjectId(conversation_id)})
+        if not conversation:
+            return json_response({'success': False, 'message': 'Conversation not found'}, 404)
+
+        participants = [str(p) for p in conversation.get('participants', [])]
+        if current_user_id not in participants:
+            return json_response({'success': False, 'message': 'Unauthorized access to conversation'}, 403)
+
+        recipient_id = next((pid for pid in participants if pid != current_user_id), None)
+        if not recipient_id:
+            return json_response({'success': False, 'message': 'Recipient not found'}, 400)
+
+        # insert_one fills in _id, so the stored document needs no re-read
+        message = Message.new_message_document(current_user_id, recipient_id, conversation_id, text)
+        await asyncio.gather(
+            db.messages.insert_one(message),
+            db.conversations.update_one({'_id': ObjectId(conversation_id)},
+                                        Conversation.last_message_update(text))
+        )
+
+        # With a change stream every worker publishes from the stream instead
+        if not shared_app.config.get('MESSAGE_CHANGE_STREAM'):
+            await publish_new_message(request, message)
+
+        return json_response({
+            'success': True,
+            'message': 'Message sent successfully',
+            'data': format_message(message, current_user_id)
+        }, 201)
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error sending message: {str(e)}'}, 500)
+
+
+async def create_conversation(request):
+    """Create a new conversation"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        db = request.app.state.db
+        data = await request.json()
+
+        recipient_id = data.get('recipientId')
+        if not recipient_id:
+            return json_response({'success': False, 'message': 'Recipient ID is required'}, 400)
+
+        participant_ids = [current_user_id, recipient_id]
+        # Both profiles and an existing conversation are fetched in parallel
+        users, existing = await asyncio.gather(
+            db.users.find({'_id': {'$in': [ObjectId(pid) for pid in participant_ids]}},
+                          PROFILE_PROJECTION).to_list(None),
+            db.conversations.find_one(Conversation.existing_conversation_filter(participant_ids))
+        )
+
+        recipient = next((user for user in users if str(user['_id']) == recipient_id), None)
+        if not recipient:
+            return json_response({'success': False, 'message': 'Recipient not found'}, 404)
+
+        if existing:
+            conversation_id = str(existing['_id'])
+        else:
+            conversation = Conversation.new_conversation_document(
+                participant_ids, current_user_id, [Conversation._profile(user) for user in users]
+            )
+            result = await db.conversations.insert_one(conversation)
+            conversation_id = str(result.inserted_id)
+
+        return json_response({
+            'success': True,
+            'message': 'Conversation created successfully',
+            'conversationId': conversation_id,
+            'participant': format_recipient(recipient_id, recipient)
+        }, 201)
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error creating conversation: {str(e)}'}, 500)
+
+
+async def get_unread_count(request):
+    """Get unread message count for current user"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        count = await request.app.state.db.messages.count_documents(Message.unread_filter(current_user_id))
+        return json_response({'success': True, 'unreadCount': count})
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error fetching unread count: {str(e)}'}, 500)
+
+
+async def stream_events(request):
+    """Server-Sent Events stream of new messages and unread count changes (token may be ?jwt=)"""
+    current_user_id, error = authenticate(request, locations=('headers', 'query_string'))
+    if error:
+        return error
+
+    bus = request.app.state.bus
+    events = bus.subscribe(current_user_id)
+    try:
+        initial_unread = await request.app.state.db.messages.count_documents(
+            Message.unread_filter(current_user_id))
+    except Exception:
+        bus.unsubscribe(current_user_id, events)
+        raise
+
+    async def generate():
+        try:
+            yield format_sse('unread', {'unreadCount': initial_unread})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event, data)
+        finally:
+            bus.unsubscribe(current_user_id, events)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def search_users(request):
+    """Search for users to start a conversation with"""
+    current_user_id, error = authenticate(request)
+    if error:
+        return error
+    try:
+        search_query = request.query_params.get('q', '').strip()
+        if not search_query:
+            return json_response({'success': False, 'message': 'Search query is required'}, 400)
+
+        filters = User.search_filters(search_query, exclude_id=current_user_id)
+        users = []
+        if filters is not None:
+            exact, prefix = await asyncio.gather(*(
+                request.app.state.db.users.find(query, User.SEARCH_PROJECTION).limit(SEARCH_LIMIT).to_list(None)
+                for query in filters))
+            users = rank_results(exact, prefix, SEARCH_LIMIT)
+
+        return json_response({'success': True, 'users': [format_search_user(user) for user in users]})
+
+    except Exception as e:
+        return json_response({'success': False, 'message': f'Error searching users: {str(e)}'}, 500)
+
+
+async def _none():
+    return None
+
+
+async def not_found(_request, _exc):
+    return json_response({'message': 'Not found'}, 404)
+
+
+def create_asgi_app(db=None):
+    """
+    Build the ASGI messaging app. db is a Motor database; by default one is
+    opened on MONGO_URI when the app starts.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        client = None
+        app.state.db = db
+        if app.state.db is None:
+            client = AsyncIOMotorClient(shared_app.config['MONGO_URI'],
+                                        maxPoolSize=shared_app.config['ASGI_MONGO_MAX_POOL_SIZE'])
+            app.state.db = client.get_default_database()
+        app.state.bus = AsyncMessageBus()
+
+        watcher = None
+        if shared_app.config.get('MESSAGE_CHANGE_STREAM'):
+            async def on_insert(message):
+                recipient_id = str(message['recipient_id'])
+                if not app.state.bus.has_subscribers(recipient_id):
+                    return
+                app.state.bus.publish(recipient_id, 'message', format_message_event(message))
+                unread = await app.state.db.messages.count_documents(Message.unread_filter(recipient_id))
+                app.state.bus.publish(recipient_id, 'unread', {'unreadCount': unread})
+
+            watcher = asyncio.create_task(watch_inserts(app.state.db.messages, on_insert, logger))
+        try:
+            yield
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if client is not None:
+                client.close()
+
+    routes = [
+        Route('/conversations', get_conversations, methods=['GET']),
+        Route('/conversation/create', create_conversation, methods=['POST']),
+        Route('/conversation/{conversation_id}', get_conversation_messages, methods=['GET']),
+        Route('/send', send_message, methods=['POST']),
+        Route('/unread-count', get_unread_count, methods=['GET']),
+        Route('/stream', stream_events, methods=['GET']),
+        Route('/users/search', search_users, methods=['GET']),
+    ]
+
+    return Starlette(
+        routes=[Mount('/api/messages', routes=routes)],
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_credentials=True,
+                               allow_methods=['*'], allow_headers=['*'])],
+        exception_handlers={404: not_found},
+        lifespan=lifespan
+    )
+
+
+app = create_asgi_app()
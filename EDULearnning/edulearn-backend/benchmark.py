@@ -0,0 +1,521 @@
+"""
+HTTP benchmark of every route of the Flask app.
+
+Boots create_app() against a local mongod (a dedicated database, seeded
+with generate_data.py) or an in-process fake (--fake, needs mongomock),
+then drives each registered route on its own and all of them together in a
+weighted mix, from --concurrency client threads. Reports requests/s and
+p50/p95/p99 per endpoint and saves the numbers as JSON; --compare prints
+the change against an earlier run and exits 1 on regressions.
+
+    python benchmark.py --fake --out before.json
+    python benchmark.py --fake --out after.json --compare before.json
+
+Endpoints that need server features mongomock lacks are listed in
+REAL_MONGO_ONLY and left out under --fake; use a real mongod for those.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every route of the EduLearn API')
+    parser.add_argument('--uri', default='mongodb://localhost:27017/edulearn_bench',
+                        help='MongoDB URI of a scratch database (it is dropped and re-seeded)')
+    parser.add_argument('--fake', action='store_true', help='use an in-process mongomock database')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=50)
+    parser.add_argument('--conversations', type=int, default=500)
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint when run alone')
+    parser.add_argument('--mixed-requests', type=int, default=3000, help='requests in the mixed run')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--verbose', action='store_true', help="show the app's error log")
+    parser.add_argument('--only', help='comma-separated substrings of the endpoints to run')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative p95 increase counted as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ignore p95 changes smaller than this')
+    return parser.parse_args(argv)
+
+
+class Request:
+    def __init__(self, method, path, token=None, json=None, query=None, stream=False):
+        self.method = method
+        self.path = path
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.json = json
+        self.query = query
+        self.stream = stream
+
+
+class Context:
+    """Seeded ids, tokens and throwaway documents the scenarios draw from"""
+
+    def __init__(self, app, db, args):
+        from flask_jwt_extended import create_access_token
+        self.app = app
+        self.db = db
+        self.args = args
+        self._create_token = create_access_token
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+        users = list(db.users.find({}, {'email': 1, 'role': 1}).limit(5000))
+        self.admin = next(str(u['_id']) for u in users if u.get('role') == 'admin')
+        self.students = [str(u['_id']) for u in users if u.get('role') == 'student'][:500]
+        self.emails = [u['email'] for u in users][:500]
+
+        self.courses = list(db.courses.find({}, {'instructor': 1, 'modules.id': 1}).limit(500))
+        self.instructor_of = {str(c['_id']): c.get('instructor') for c in self.courses}
+        self.assessments = list(db.assessments.find({'type': 'mcq'}).limit(500))
+        assignment_ids = [str(a['_id']) for a in db.assessments.find({'type': 'assignment'}, {'_id': 1}).limit(200)]
+        self.assignment_results = list(db.test_results.find(
+            {'assessmentId': {'$in': assignment_ids}}, {'courseId': 1}).limit(500))
+        self.results = list(db.test_results.find({}, {'userId': 1, 'assessmentId': 1, 'courseId': 1}).limit(2000))
+        self.certificates = list(db.certificates.find(
+            {}, {'certificateId': 1, 'verificationCode': 1, 'userId': 1, 'courseId': 1}).limit(1000))
+        self.conversations = list(db.conversations.find({}, {'participants': 1}).limit(1000))
+
+        manifest = app.extensions['static_manifest']
+        self.pages = [p for p in manifest.entries if p.endswith('.html') and '/' not in p]
+        self.scripts = [p[len('js/'):] for p in manifest.entries if p.startswith('js/')]
+
+        # Documents the delete scenarios consume, created up front so deletes always hit
+        budget = args.requests + args.mixed_requests
+        course = self.courses[0]
+        inserted = db.assessments.insert_many([{
+            'courseId': str(course['_id']), 'moduleId': 'module1', 'title': f'Throwaway {i}', 'type': 'mcq',
+            'questions': [], 'passingScore': 50, 'timeLimit': None, 'instructions': None,
+            'createdAt': datetime.utcnow(), 'updatedAt': datetime.utcnow()
+        } for i in range(budget)])
+        self.throwaway_assessments = [(str(i), course.get('instructor')) for i in inserted.inserted_ids]
+        inserted = db.users.insert_many([{
+            'fullName': f'Throwaway {i}', 'email': f'throwaway-{uuid.uuid4().hex}@example.test',
+            'password': '', 'role': 'student'
+        } for i in range(budget)])
+        self.throwaway_users = [str(i) for i in inserted.inserted_ids]
+
+    def token(self, user_id):
+        token = self._tokens.get(user_id)
+        if token is None:
+            with self.app.app_context():
+                token = self._tokens[user_id] = self._create_token(identity=str(user_id))
+        return token
+
+    def pop(self, items):
+        with self._lock:
+            return items.pop() if items else None
+
+
+def _submit_answers(assessment, rng):
+    return [{'questionId': q.get('id'), 'answer': rng.randint(0, 3)} for q in assessment.get('questions', [])]
+
+
+def _conversation_member(ctx, rng):
+    conv = rng.choice(ctx.conversations)
+    return str(conv['_id']), str(rng.choice(conv['participants']))
+
+
+def _batch_attempts(ctx, rng):
+    return [{'assessmentId': str(a['_id']), 'answers': _submit_answers(a, rng), 'timeSpent': 5,
+             'idempotencyKey': uuid.uuid4().hex} for a in rng.sample(ctx.assessments, min(5, len(ctx.assessments)))]
+
+
+def _throwaway_assessment(ctx):
+    item = ctx.pop(ctx.throwaway_assessments)
+    return item or (str(ObjectId()), ctx.admin)
+
+
+# endpoint -> (weight in the mixed run, request builder)
+SCENARIOS = {
+    'serve_homepage': (4, lambda ctx, rng: Request('GET', '/')),
+    'serve_static_any': (4, lambda ctx, rng: Request('GET', '/' + rng.choice(ctx.pages))),
+    'serve_js': (4, lambda ctx, rng: Request('GET', '/js/' + rng.choice(ctx.scripts))),
+    'route_login': (1, lambda ctx, rng: Request('GET', '/login')),
+    'route_signup': (1, lambda ctx, rng: Request('GET', '/signup')),
+    'route_teacher_login': (1, lambda ctx, rng: Request('GET', '/teacher/login')),
+    'route_teacher_signup': (1, lambda ctx, rng: Request('GET', '/teacher/signup')),
+
+    'auth.login': (3, lambda ctx, rng: Request('POST', '/api/auth/login', json={
+        'email': rng.choice(ctx.emails), 'password': ctx.args.password})),
+    'auth.student_signup': (1, lambda ctx, rng: Request('POST', '/api/auth/student/signup', json={
+        'fullName': 'Bench Student', 'email': f'bench-{uuid.uuid4().hex}@example.test', 'password': 'secret'})),
+    'auth.teacher_signup': (1, lambda ctx, rng: Request('POST', '/api/auth/teacher/signup', json={
+        'fullName': 'Bench Teacher', 'email': f'bench-{uuid.uuid4().hex}@example.test', 'password': 'secret',
+        'subject': 'Math', 'qualification': 'MSc', 'experience': '3'})),
+    'auth.admin_signup': (1, lambda ctx, rng: Request('POST', '/api/auth/admin/signup', json={
+        'fullName': 'Bench Admin', 'email': f'bench-{uuid.uuid4().hex}@example.test', 'password': 'secret'})),
+
+    'users.get_current_user': (5, lambda ctx, rng: Request(
+        'GET', '/api/users/me', ctx.token(rng.choice(ctx.students)))),
+    'users.update_user': (1, lambda ctx, rng: Request(
+        'PUT', '/api/users/me', ctx.token(rng.choice(ctx.students)), json={'fullName': f'Student {rng.randint(1, 999)}'})),
+
+    'courses.list_courses': (20, lambda ctx, rng: Request('GET', '/api/courses/', query={'limit': 20})),
+    'courses.get_course': (15, lambda ctx, rng: Request('GET', f"/api/courses/{rng.choice(ctx.courses)['_id']}")),
+    'courses.get_my_courses': (2, lambda ctx, rng: Request(
+        'GET', '/api/courses/my', ctx.token(rng.choice(ctx.courses).get('instructor')))),
+    'courses.get_user_courses': (3, lambda ctx, rng: Request(
+        'GET', '/api/courses/user', ctx.token(rng.choice(ctx.students)))),
+    'courses.create_course': (1, lambda ctx, rng: Request(
+        'POST', '/api/courses/', ctx.token(rng.choice(ctx.courses).get('instructor')),
+        json={'title': 'Bench Course', 'description': 'Created by the benchmark', 'category': 'Bench', 'price': 9.99})),
+
+    'assessments.get_course_assessments': (5, lambda ctx, rng: Request(
+        'GET', f"/api/assessments/course/{rng.choice(ctx.assessments)['courseId']}")),
+    'assessments.get_module_assessments': (3, lambda ctx, rng: (lambda a: Request(
+        'GET', f"/api/assessments/module/{a['courseId']}/{a['moduleId']}"))(rng.choice(ctx.assessments))),
+    'assessments.get_assessment': (5, lambda ctx, rng: Request(
+        'GET', f"/api/assessments/{rng.choice(ctx.assessments)['_id']}")),
+    'assessments.get_all_assessments': (1, lambda ctx, rng: Request(
+        'GET', '/api/assessments/all', ctx.token(ctx.admin))),
+    'assessments.create_assessment': (1, lambda ctx, rng: (lambda c: Request(
+        'POST', '/api/assessments/', ctx.token(c.get('instructor')), json={
+            'courseId': str(c['_id']), 'moduleId': 'module1', 'title': 'Bench Quiz', 'type': 'mcq',
+            'questions': [{'id': 'q1', 'text': '1 + 1?', 'options': ['1', '2'], 'correctAnswer': 1}],
+            'passingScore': 50}))(rng.choice(ctx.courses))),
+    'assessments.update_assessment': (1, lambda ctx, rng: (lambda a: Request(
+        'PUT', f"/api/assessments/{a['_id']}", ctx.token(ctx.instructor_of.get(a['courseId'])),
+        json={'title': a['title']}))(rng.choice(ctx.assessments))),
+    # Mostly answered with 404: the benchmark's updates don't touch grading fields
+    'assessments.get_regrade_status': (1, lambda ctx, rng: (lambda a: Request(
+        'GET', f"/api/assessments/{a['_id']}/regrade", ctx.token(ctx.instructor_of.get(a['courseId']))))(
+        rng.choice(ctx.assessments))),
+    'assessments.delete_assessment': (1, lambda ctx, rng: (lambda item: Request(
+        'DELETE', f'/api/assessments/{item[0]}', ctx.token(item[1])))(_throwaway_assessment(ctx))),
+
+    'test_results.submit_test': (6, lambda ctx, rng: (lambda a: Request(
+        'POST', '/api/test-results/submit', ctx.token(rng.choice(ctx.students)),
+        json={'assessmentId': str(a['_id']), 'answers': _submit_answers(a, rng), 'timeSpent': 5}))(
+        rng.choice(ctx.assessments))),
+    'test_results.submit_test_batch': (2, lambda ctx, rng: Request(
+        'POST', '/api/test-results/submit-batch', ctx.token(rng.choice(ctx.students)),
+        json={'attempts': _batch_attempts(ctx, rng)})),
+    'test_results.get_user_course_results': (3, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/user/{r['userId']}/course/{r['courseId']}", ctx.token(r['userId'])))(
+        rng.choice(ctx.results))),
+    'test_results.get_assessment_results': (3, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/assessment/{r['assessmentId']}", ctx.token(r['userId'])))(
+        rng.choice(ctx.results))),
+    'test_results.get_best_score': (3, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/best-score/{r['assessmentId']}", ctx.token(r['userId'])))(
+        rng.choice(ctx.results))),
+    'test_results.get_course_summary': (4, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/course-summary/{r['courseId']}", ctx.token(r['userId'])))(
+        rng.choice(ctx.results))),
+    'test_results.check_certificate_eligibility': (2, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/check-eligibility/{r['courseId']}", ctx.token(r['userId'])))(
+        rng.choice(ctx.results))),
+    'test_results.get_result_details': (2, lambda ctx, rng: (lambda r: Request(
+        'GET', f"/api/test-results/{r['_id']}", ctx.token(r['userId'])))(rng.choice(ctx.results))),
+    'test_results.grade_assignment': (1, lambda ctx, rng: (lambda r: Request(
+        'PUT', f"/api/test-results/grade-assignment/{r['_id']}", ctx.token(ctx.instructor_of.get(r['courseId'])),
+        json={'score': rng.randint(40, 100), 'feedback': 'Benchmark grade'}))(
+        rng.choice(ctx.assignment_results or ctx.results))),
+
+    'certificates.get_certificate': (3, lambda ctx, rng: Request(
+        'GET', f"/api/certificates/{rng.choice(ctx.certificates)['_id']}")),
+    'certificates.download_certificate_pdf': (2, lambda ctx, rng: (lambda c: Request(
+        'GET', f"/api/certificates/{c['_id']}/pdf", ctx.token(c['userId'])))(rng.choice(ctx.certificates))),
+    'certificates.get_user_certificates': (3, lambda ctx, rng: (lambda c: Request(
+        'GET', f"/api/certificates/user/{c['userId']}", ctx.token(c['userId'])))(rng.choice(ctx.certificates))),
+    'certificates.verify_certificate': (3, lambda ctx, rng: (lambda c: Request(
+        'POST', '/api/certificates/verify', json={'certificateId': c['certificateId'],
+                                                  'verificationCode': c['verificationCode']}))(
+        rng.choice(ctx.certificates))),
+    'certificates.check_eligibility': (2, lambda ctx, rng: (lambda c: Request(
+        'GET', f"/api/certificates/check-eligibility/{c['courseId']}", ctx.token(c['userId'])))(
+        rng.choice(ctx.certificates))),
+    'certificates.generate_certificate': (1, lambda ctx, rng: (lambda c: Request(
+        'POST', '/api/certificates/generate', ctx.token(c['userId']), json={'courseId': c['courseId']}))(
+        rng.choice(ctx.certificates))),
+    # Certifies the course's eligible students on the first call, then finds nobody left
+    'certificates.issue_course_certificates': (1, lambda ctx, rng: (lambda c: Request(
+        'POST', f"/api/certificates/course/{c['_id']}/issue", ctx.token(c.get('instructor'))))(
+        rng.choice(ctx.courses))),
+    'certificates.get_all_certificates': (1, lambda ctx, rng: Request(
+        'GET', '/api/certificates/all', ctx.token(ctx.admin))),
+    'certificates.export_certificates': (1, lambda ctx, rng: Request(
+        'GET', '/api/certificates/export', ctx.token(ctx.admin),
+        query={'userId': rng.choice(ctx.certificates)['userId']})),
+
+    'messages.get_conversations': (8, lambda ctx, rng: Request(
+        'GET', '/api/messages/conversations', ctx.token(_conversation_member(ctx, rng)[1]))),
+    'messages.get_conversation_messages': (10, lambda ctx, rng: (lambda cm: Request(
+        'GET', f'/api/messages/conversation/{cm[0]}', ctx.token(cm[1])))(_conversation_member(ctx, rng))),
+    'messages.send_message': (5, lambda ctx, rng: (lambda cm: Request(
+        'POST', '/api/messages/send', ctx.token(cm[1]), json={'conversationId': cm[0], 'text': 'Benchmark hello'}))(
+        _conversation_member(ctx, rng))),
+    'messages.create_conversation': (1, lambda ctx, rng: Request(
+        'POST', '/api/messages/conversation/create', ctx.token(rng.choice(ctx.students)),
+        json={'recipientId': rng.choice(ctx.students)})),
+    'messages.get_unread_count': (10, lambda ctx, rng: Request(
+        'GET', '/api/messages/unread-count', ctx.token(_conversation_member(ctx, rng)[1]))),
+    'messages.search_users': (2, lambda ctx, rng: Request(
+        'GET', '/api/messages/users/search', ctx.token(rng.choice(ctx.students)),
+        query={'q': rng.choice(['an', 'Smith', 'user1', 'Chen'])})),
+    # Time to the first event of a new stream
+    'messages.stream_events': (1, lambda ctx, rng: Request(
+        'GET', '/api/messages/stream', ctx.token(rng.choice(ctx.students)), stream=True)),
+
+    'admin.get_admin_stats': (1, lambda ctx, rng: Request('GET', '/api/admin/stats', ctx.token(ctx.admin))),
+    'admin.get_all_users': (2, lambda ctx, rng: Request(
+        'GET', '/api/admin/users', ctx.token(ctx.admin), query={'limit': 20, 'role': 'student'})),
+    'admin.get_user': (1, lambda ctx, rng: Request(
+        'GET', f'/api/admin/users/{rng.choice(ctx.students)}', ctx.token(ctx.admin))),
+    'admin.update_user': (1, lambda ctx, rng: Request(
+        'PUT', f'/api/admin/users/{rng.choice(ctx.students)}', ctx.token(ctx.admin), json={'role': 'student'})),
+    'admin.delete_user': (1, lambda ctx, rng: Request(
+        'DELETE', f'/api/admin/users/{ctx.pop(ctx.throwaway_users) or ctx.students[0]}', ctx.token(ctx.admin))),
+    'admin.get_identity_cache_stats': (1, lambda ctx, rng: Request(
+        'GET', '/api/admin/identity-cache', ctx.token(ctx.admin))),
+    'admin.get_password_hashing_stats': (1, lambda ctx, rng: Request(
+        'GET', '/api/admin/password-hashing', ctx.token(ctx.admin))),
+    'admin.get_metrics': (1, lambda ctx, rng: Request('GET', '/api/admin/metrics', ctx.token(ctx.admin))),
+}
+
+# Registered endpoints that are deliberately not driven
+SKIPPED = {
+    'static': "Flask's default static folder does not exist in this app",
+}
+
+# Endpoints that fail, or skip part of their work, on mongomock; not driven under --fake
+BULK_UPDATE = ('bulk_write(UpdateOne) of the progress projection (mongomock rejects the sort option of '
+               'pymongo >= 4.11); the failure is only logged, so timings would leave that write out')
+REAL_MONGO_ONLY = {
+    'messages.get_conversations': '$lookup with a sub-pipeline',
+    'users.update_user': 'arrayFilters when refreshing conversation participant names',
+    'test_results.submit_test': BULK_UPDATE,
+    'test_results.submit_test_batch': BULK_UPDATE,
+    'test_results.grade_assignment': BULK_UPDATE,
+}
+
+
+def run_phase(ctx, endpoints, concurrency, seed):
+    """Issue one request per entry of endpoints; returns ({endpoint: samples}, wall seconds)"""
+    samples = {endpoint: [] for endpoint in set(endpoints)}
+    position = iter(range(len(endpoints)))
+    lock = threading.Lock()
+
+    def worker(number):
+        client = ctx.app.test_client()
+        rng = random.Random(seed * 1000 + number)
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            endpoint = endpoints[i]
+            request = SCENARIOS[endpoint][1](ctx, rng)
+            started = time.perf_counter()
+            try:
+                response = client.open(request.path, method=request.method, headers=request.headers,
+                                       json=request.json, query_string=request.query,
+                                       buffered=not request.stream)
+                if request.stream:
+                    size = len(next(iter(response.response), b''))
+                    response.close()
+                else:
+                    size = len(response.get_data())
+                status = response.status_code
+            except Exception:
+                size, status = 0, 'exception'
+            elapsed = time.perf_counter() - started
+            samples[endpoint].append((elapsed, status, size))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def summarize(samples, wall):
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == 'exception' or int(status) >= 500)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'statuses': statuses,
+        'throughput': len(samples) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+        'max_ms': latencies[-1] if latencies else 0.0,
+        'mean_bytes': sum(s[2] for s in samples) / len(samples) if samples else 0.0,
+    }
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"{'endpoint':<46}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for endpoint, r in sorted(results.items()):
+        print(f"{endpoint:<46}{r['throughput']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['errors']:>8}")
+
+
+def compare(current, baseline, threshold, min_delta_ms):
+    """Print p95/throughput changes per endpoint; returns the regressed (phase, endpoint) pairs"""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('startedAt')})")
+    print(f"{'phase/endpoint':<56}{'p95 ms':>18}{'change':>9}{'req/s change':>14}")
+    for phase, results in current['results'].items():
+        for endpoint, r in sorted(results.items()):
+            old = baseline['results'].get(phase, {}).get(endpoint)
+            if not old:
+                continue
+            delta = r['p95_ms'] - old['p95_ms']
+            change = delta / old['p95_ms'] if old['p95_ms'] else 0.0
+            rate = (r['throughput'] - old['throughput']) / old['throughput'] if old['throughput'] else 0.0
+            regressed = change > threshold and delta > min_delta_ms
+            if regressed:
+                regressions.append((phase, endpoint))
+            print(f"{phase + '/' + endpoint:<56}{old['p95_ms']:>8.2f} -> {r['p95_ms']:<7.2f}{change:>+9.0%}"
+                  f"{rate:>+14.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    args = parse_args()
+
+    # Configure before config.py is imported; keep caches out of the working tree
+    os.environ['MONGO_URI'] = args.uri
+    scratch = tempfile.mkdtemp(prefix='edulearn-bench-')
+    os.environ.setdefault('CERTIFICATE_PDF_CACHE_DIR', os.path.join(scratch, 'certificates'))
+    os.environ.setdefault('STATIC_CACHE_DIR', os.path.join(scratch, 'static'))
+
+    from app import create_app
+    from extensions import mongo
+    import generate_data
+
+    app = create_app()
+    if not args.verbose:
+        # Failed requests are counted per endpoint; their tracebacks would drown the report
+        app.logger.disabled = True
+    if args.fake:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('--fake needs mongomock (pip install mongomock)')
+        client = mongomock.MongoClient()
+        mongo.cx, mongo.db = client, client.get_database('edulearn_bench')
+    db = mongo.db
+
+    # Seed with the load-test generator, in this process so the fake sees the data
+    print(f'Seeding {args.users} users, {args.courses} courses, {args.conversations} conversations...')
+    for name in generate_data.COLLECTIONS + ('cache_versions', 'user_assessment_progress', 'user_course_progress'):
+        db.drop_collection(name)
+    gen_args = generate_data.parse_args([
+        '--seed', str(args.seed), '--users', str(args.users), '--courses', str(args.courses),
+        '--conversations', str(args.conversations), '--password', args.password
+    ])
+    gen_args.password_hash = generate_data.generate_password_hash(
+        args.password, method=app.config['PASSWORD_HASH_METHOD'])
+    plan = generate_data.Plan(gen_args)
+    generate_data._db = db
+    for job, total in (('users', plan.users), ('courses', plan.courses),
+                       ('activity', plan.students), ('conversations', plan.conversations)):
+        for start in range(0, total, gen_args.chunk):
+            generate_data.run_job(plan, job, start, min(start + gen_args.chunk, total), gen_args.batch_size)
+    from modles.assessment_progress import AssessmentProgress
+    AssessmentProgress.rebuild(db)
+    if not args.fake:
+        from utils.indexes import reconcile_indexes
+        reconcile_indexes(db)
+
+    ctx = Context(app, db, args)
+
+    registered = {rule.endpoint for rule in app.url_map.iter_rules()}
+    uncovered = sorted(registered - set(SCENARIOS) - set(SKIPPED))
+    if uncovered:
+        print(f'Warning: no scenario for {", ".join(uncovered)}')
+
+    endpoints = sorted(e for e in SCENARIOS if e in registered)
+    if args.fake:
+        print(f'--fake: not running {", ".join(sorted(REAL_MONGO_ONLY))} (see REAL_MONGO_ONLY)')
+        endpoints = [e for e in endpoints if e not in REAL_MONGO_ONLY]
+    if args.only:
+        wanted = [w.strip() for w in args.only.split(',')]
+        endpoints = [e for e in endpoints if any(w in e for w in wanted)]
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'startedAt': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'database': 'mongomock' if args.fake else db.name,
+            'dataset': {'seed': args.seed, 'users': args.users, 'courses': args.courses,
+                        'conversations': args.conversations},
+            'concurrency': args.concurrency,
+            'uncovered': uncovered,
+            'skipped': dict(SKIPPED, **REAL_MONGO_ONLY) if args.fake else SKIPPED,
+        },
+        'results': {'isolated': {}, 'mixed': {}},
+    }
+
+    # Each endpoint on its own
+    for endpoint in endpoints:
+        samples, wall = run_phase(ctx, [endpoint] * args.requests, args.concurrency, args.seed)
+        output['results']['isolated'][endpoint] = summarize(samples[endpoint], wall)
+    print_table('Isolated', output['results']['isolated'])
+
+    # All endpoints together, weighted by expected traffic
+    rng = random.Random(args.seed)
+    mix = rng.choices(endpoints, weights=[SCENARIOS[e][0] for e in endpoints], k=args.mixed_requests)
+    samples, wall = run_phase(ctx, mix, args.concurrency, args.seed + 1)
+    output['results']['mixed'] = {endpoint: summarize(s, wall) for endpoint, s in samples.items()}
+    output['meta']['mixedThroughput'] = len(mix) / wall
+    print_table(f'Mixed ({len(mix) / wall:.0f} req/s overall)', output['results']['mixed'])
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+        print(f'\nResults written to {args.out}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s)')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
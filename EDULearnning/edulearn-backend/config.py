@@ -3,4 +3,65 @@ import os
 class Config:
     MONGO_URI = os.environ.get('MONGO_URI') or '//mongodb url'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your_super_secret_key'
+    # Per-process cache of user role/isActive used by admin_required
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+    # Rendered certificate PDFs, keyed by certificate and template version
+    CERTIFICATE_PDF_CACHE_DIR = os.environ.get('CERTIFICATE_PDF_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'certificates')
+    # Bulk certificate export: render processes (default: CPU count) and max certificates per export
+    CERTIFICATE_EXPORT_WORKERS = int(os.environ.get('CERTIFICATE_EXPORT_WORKERS', 0))
+    CERTIFICATE_EXPORT_MAX = int(os.environ.get('CERTIFICATE_EXPORT_MAX', 5000))
+    # Cohort issuance: certificates per insert_many, and whether new PDFs are rendered ahead of download
+    CERTIFICATE_ISSUE_BATCH_SIZE = int(os.environ.get('CERTIFICATE_ISSUE_BATCH_SIZE', 500))
+    CERTIFICATE_PRERENDER = os.environ.get('CERTIFICATE_PRERENDER', 'true').lower() == 'true'
+    # Public verification: Bloom filter of issued ids/codes (false positive rate, background sync
+    # with other workers every SYNC seconds, full rebuild every REBUILD seconds) and recent-result LRU size
+    CERTIFICATE_VERIFY_FILTER = os.environ.get('CERTIFICATE_VERIFY_FILTER', 'true').lower() == 'true'
+    CERTIFICATE_VERIFY_FALSE_POSITIVE_RATE = float(os.environ.get('CERTIFICATE_VERIFY_FALSE_POSITIVE_RATE', 0.001))
+    CERTIFICATE_VERIFY_SYNC_SECONDS = float(os.environ.get('CERTIFICATE_VERIFY_SYNC_SECONDS', 1))
+    CERTIFICATE_VERIFY_REBUILD_SECONDS = int(os.environ.get('CERTIFICATE_VERIFY_REBUILD_SECONDS', 3600))
+    CERTIFICATE_VERIFY_CACHE_SIZE = int(os.environ.get('CERTIFICATE_VERIFY_CACHE_SIZE', 10000))
+    # Password hashing: werkzeug method string (algorithm and cost), pool size and max queued operations
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+    # Frontend static files: precompressed variants are written here (served by sendfile or the proxy)
+    STATIC_CACHE_DIR = os.environ.get('STATIC_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'static')
+    # Files up to this size are also kept in memory
+    STATIC_MEMORY_MAX_BYTES = int(os.environ.get('STATIC_MEMORY_MAX_BYTES', 256 * 1024))
+    # Internal nginx location aliased to STATIC_CACHE_DIR (e.g. /_static/); when set, files are sent via X-Accel-Redirect
+    STATIC_ACCEL_REDIRECT_PREFIX = os.environ.get('STATIC_ACCEL_REDIRECT_PREFIX') or None
+    # Reload frontend files that changed on disk (development only; stats the file on every request)
+    STATIC_CHECK_MTIME = os.environ.get('STATIC_CHECK_MTIME', 'false').lower() == 'true'
+    # Mongo connection pool per process of the ASGI messaging app (asgi_messages.py)
+    ASGI_MONGO_MAX_POOL_SIZE = int(os.environ.get('ASGI_MONGO_MAX_POOL_SIZE', 100))
+    # Request/Mongo command metrics at /api/admin/metrics. With several worker processes set METRICS_DIR
+    # to a directory they share (cleared on deploy); each worker writes its counters there every
+    # METRICS_FLUSH_SECONDS and the route adds them up
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR') or None
+    METRICS_FLUSH_SECONDS = int(os.environ.get('METRICS_FLUSH_SECONDS', 10))
+    # N+1 detector for development and test runs: 'warn' logs, 'raise' fails the request, when one request
+    # issues the same query shape (command, collection, filter keys) more than N_PLUS_ONE_THRESHOLD times
+    N_PLUS_ONE_MODE = os.environ.get('N_PLUS_ONE_MODE', 'off').lower()
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    # The admin dashboard counters (stats/users) are updated on every signup/role/activation change and
+    # recounted with one $facet aggregation when older than this, to correct any drift
+    USER_STATS_RECONCILE_SECONDS = int(os.environ.get('USER_STATS_RECONCILE_SECONDS', 3600))
+    # Re-grading of stored results after an assessment's questions/passingScore change: a background thread
+    # per process (REGRADE_WORKER=false leaves jobs to `flask regrade run`) re-scores REGRADE_BATCH_SIZE results
+    # at a time and writes them in chunks of REGRADE_WRITE_CHUNK, sleeping REGRADE_THROTTLE_SECONDS in between.
+    # A running job without a heartbeat for REGRADE_STALE_SECONDS is resumed by another worker
+    REGRADE_WORKER = os.environ.get('REGRADE_WORKER', 'true').lower() == 'true'
+    REGRADE_BATCH_SIZE = int(os.environ.get('REGRADE_BATCH_SIZE', 500))
+    REGRADE_WRITE_CHUNK = int(os.environ.get('REGRADE_WRITE_CHUNK', 100))
+    REGRADE_THROTTLE_SECONDS = float(os.environ.get('REGRADE_THROTTLE_SECONDS', 0.05))
+    REGRADE_POLL_SECONDS = float(os.environ.get('REGRADE_POLL_SECONDS', 5))
+    REGRADE_STALE_SECONDS = int(os.environ.get('REGRADE_STALE_SECONDS', 60))
+    # Reconcile model indexes when the app starts (also available as `flask indexes sync`)
+    ENSURE_INDEXES = os.environ.get('ENSURE_INDEXES', 'false').lower() == 'true'
+    # Feed /api/messages/stream from a MongoDB change stream so it works across workers (needs a replica set)
+    MESSAGE_CHANGE_STREAM = os.environ.get('MESSAGE_CHANGE_STREAM', 'false').lower() == 'true'
 
@@ -460,6 +460,8 @@ with app.app_context():
             mongo.db.courses.insert_one(course_data)
             print(f"Inserted course: {course_id}")
 
+        # Invalidate cached catalog responses
+        Course.bump_cache_version()
         print("Sample courses created successfully!")
 
     except Exception as e:
@@ -0,0 +1,470 @@
+"""
+Synthetic data generator for load testing.
+
+Generates users, courses with modules/lessons, assessments, attempt
+histories, certificates and conversations/messages, and bulk-loads them
+with insert_many(ordered=False) from a pool of worker processes.
+
+Everything is derived from --seed and the entity's index: ObjectIds,
+names, answers and dates. Any batch can therefore be built on its own,
+references between collections need no lookups, and a re-run with the same
+arguments inserts the same documents (already loaded ones are skipped as
+duplicate keys, so an interrupted load can simply be restarted).
+
+    python generate_data.py --users 1000000 --courses 5000 --workers 8 --drop
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import struct
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from werkzeug.security import generate_password_hash
+
+from config import Config
+from utils.search_keys import search_keys
+
+COLLECTIONS = ('users', 'courses', 'assessments', 'test_results', 'certificates', 'conversations', 'messages')
+
+# One byte of every generated ObjectId identifies the entity kind
+KIND_CODES = {'user': 1, 'course': 2, 'assessment': 3, 'result': 4, 'certificate': 5,
+              'conversation': 6, 'message': 7}
+
+BASE_DATE = datetime(2024, 1, 1)
+
+FIRST_NAMES = ['Aarav', 'Emma', 'Liam', 'Olivia', 'Noah', 'Ava', 'Mia', 'Lucas', 'Sofia', 'Arjun',
+               'Chen', 'Fatima', 'Mateo', 'Yuki', 'Amara', 'Ivan', 'Zara', 'Omar', 'Priya', 'Leah']
+LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Chen', 'Kim', 'Okafor', 'Novak', 'Rossi', 'Khan', 'Silva',
+              'Patel', 'Muller', 'Tanaka', 'Hughes', 'Ivanova', 'Haddad', 'Nguyen', 'Lopez', 'Singh', 'Brown']
+SUBJECTS = ['Data Science', 'Web Development', 'Mobile Development', 'Cloud Computing', 'Design',
+            'Business', 'Mathematics', 'Cyber Security', 'Machine Learning', 'Databases']
+LEVELS = ['Introduction to', 'Practical', 'Advanced', 'Mastering', 'Foundations of']
+TOPICS = ['Python', 'React', 'Statistics', 'Kubernetes', 'UX Research', 'SQL', 'Marketing', 'Algorithms',
+          'Deep Learning', 'Networking', 'Flutter', 'Linear Algebra', 'Django', 'Product Management']
+PHRASES = ['Hi, I have a question about the last module.', 'Thanks, that helped a lot!',
+           'When is the next assignment due?', 'Could you explain question 3 again?',
+           'I submitted my assignment, please take a look.', 'Great work on the quiz!',
+           'Sure, let us go over it in the next session.', 'The video for lesson 2 does not load.',
+           'Ok, I will check and get back to you.', 'See you in class.']
+
+
+class Plan:
+    """Entity counts and shape parameters derived from the command line"""
+
+    def __init__(self, args):
+        self.seed = args.seed
+        self.users = args.users
+        self.admins = min(args.admins, self.users)
+        self.teachers = max(1, min(int(self.users * args.teacher_ratio), self.users - self.admins - 1))
+        self.students = self.users - self.admins - self.teachers
+        self.courses = args.courses
+        self.modules = args.modules
+        self.lessons = args.lessons
+        self.questions = args.questions
+        self.max_enrollments = min(args.max_enrollments, self.courses)
+        self.conversations = min(args.conversations, self.students * self.teachers)
+        self.messages_per_conversation = args.messages_per_conversation
+        self.days = args.days
+        self.password_hash = args.password_hash
+
+    # Users: admins, then teachers, then students
+    def user_role(self, index):
+        if index < self.admins:
+            return 'admin'
+        return 'teacher' if index < self.admins + self.teachers else 'student'
+
+    def teacher_index(self, n):
+        return self.admins + n
+
+    def student_index(self, n):
+        return self.admins + self.teachers + n
+
+    def user_created(self, index):
+        # Sign-ups spread over the whole period, in index order
+        return BASE_DATE + timedelta(days=self.days * index / max(self.users, 1))
+
+    def course_created(self, index):
+        # The catalog is built during the first half of the period
+        return BASE_DATE + timedelta(days=self.days / 2 * index / max(self.courses, 1))
+
+
+def rng_for(seed, kind, index):
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+def make_id(kind, index, created):
+    """Deterministic ObjectId: creation time, kind byte, 7-byte index"""
+    return ObjectId(struct.pack('>IB', int(created.timestamp()), KIND_CODES[kind]) + index.to_bytes(7, 'big'))
+
+
+def skewed_index(rng, n, skew=2.0):
+    """Index in [0, n) with a power-law bias towards 0 (popular courses, busy teachers)"""
+    return min(n - 1, int(n * rng.random() ** skew))
+
+
+def user_id(plan, index):
+    return make_id('user', index, plan.user_created(index))
+
+
+def user_name(plan, index):
+    rng = rng_for(plan.seed, 'name', index)
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def course_id(plan, index):
+    return make_id('course', index, plan.course_created(index))
+
+
+def course_instructor(plan, index):
+    return plan.teacher_index(skewed_index(rng_for(plan.seed, 'instructor', index), plan.teachers, 1.5))
+
+
+def course_title(plan, index):
+    rng = rng_for(plan.seed, 'course', index)
+    return f'{rng.choice(LEVELS)} {rng.choice(TOPICS)} {index + 1}'
+
+
+def assessment_index(plan, course, module):
+    return course * plan.modules + module
+
+
+def assessment_id(plan, index):
+    return make_id('assessment', index, plan.course_created(index // plan.modules))
+
+
+def assessment_type(plan, index):
+    return 'assignment' if rng_for(plan.seed, 'assessment', index).random() < 0.1 else 'mcq'
+
+
+def correct_answer(plan, assessment, question):
+    return (assessment * 31 + question * 17 + plan.seed) % 4
+
+
+def passing_score(kind):
+    return 70 if kind == 'mcq' else 60
+
+
+def build_users(plan, start, stop):
+    docs = []
+    for index in range(start, stop):
+        rng = rng_for(plan.seed, 'user', index)
+        created = plan.user_created(index)
+        role = plan.user_role(index)
+        full_name = user_name(plan, index)
+        email = f'user{index}@example.test'
+        doc = {
+            '_id': user_id(plan, index),
+            'fullName': full_name,
+            'email': email,
+            'searchKeys': search_keys(full_name, email),
+            'password': plan.password_hash,
+            'role': role,
+            'isVerified': rng.random() < 0.8,
+            'createdAt': created,
+            'updatedAt': created,
+            'lastLogin': created + timedelta(days=rng.random() * 30)
+        }
+        if role == 'teacher':
+            doc['subject'] = rng.choice(SUBJECTS)
+            doc['qualification'] = rng.choice(['BSc', 'MSc', 'PhD', 'MBA'])
+            doc['experience'] = str(rng.randint(1, 25))
+        docs.append(doc)
+    return {'users': docs}
+
+
+def build_courses(plan, start, stop):
+    courses, assessments = [], []
+    for index in range(start, stop):
+        rng = rng_for(plan.seed, 'course', index)
+        created = plan.course_created(index)
+        cid = course_id(plan, index)
+        modules = []
+        for m in range(plan.modules):
+            modules.append({
+                'id': f'module{m + 1}',
+                'title': f'Module {m + 1}',
+                'lessons': [{
+                    'id': f'lesson{m * plan.lessons + l + 1}',
+                    'title': f'Lesson {m * plan.lessons + l + 1}',
+                    'videoUrl': f'https://videos.example.test/{index}/{m}/{l}',
+                    'duration': f'{rng.randint(5, 40)}:{rng.randint(0, 59):02d}',
+                    'completed': False
+                } for l in range(plan.lessons)]
+            })
+        courses.append({
+            '_id': cid,
+            'title': course_title(plan, index),
+            'description': f'A synthetic course about {rng.choice(TOPICS)}.',
+            'category': rng.choice(SUBJECTS),
+            'instructor': str(user_id(plan, course_instructor(plan, index))),
+            'price': round(rng.choice([0, 19.99, 49.99, 79.99, 99.99]), 2),
+            'isPublished': rng.random() < 0.9,
+            'modules': modules
+        })
+
+        for m in range(plan.modules):
+            a = assessment_index(plan, index, m)
+            kind = assessment_type(plan, a)
+            if kind == 'mcq':
+                questions = [{
+                    'id': f'q{q + 1}',
+                    'text': f'Question {q + 1} of module {m + 1}',
+                    'options': ['Option A', 'Option B', 'Option C', 'Option D'],
+                    'correctAnswer': correct_answer(plan, a, q)
+                } for q in range(plan.questions)]
+            else:
+                questions = [{'id': 'q1', 'text': f'Project for module {m + 1}'}]
+            assessments.append({
+                '_id': assessment_id(plan, a),
+                'courseId': str(cid),
+                'moduleId': f'module{m + 1}',
+                'title': f'Module {m + 1} {"Quiz" if kind == "mcq" else "Assignment"}',
+                'type': kind,
+                'questions': questions,
+                'passingScore': passing_score(kind),
+                'timeLimit': 10 + plan.questions if kind == 'mcq' else None,
+                'instructions': None,
+                'createdAt': created,
+                'updatedAt': created
+            })
+    return {'courses': courses, 'assessments': assessments}
+
+
+def build_activity(plan, start, stop):
+    """Attempt histories of students [start, stop), plus certificates for completed courses"""
+    results, certificates = [], []
+    for n in range(start, stop):
+        index = plan.student_index(n)
+        rng = rng_for(plan.seed, 'activity', index)
+        uid = str(user_id(plan, index))
+        skill = 0.35 + 0.6 * rng.random()
+        attempt_number = 0
+
+        enrollments = 1 + int(plan.max_enrollments * rng.random() ** 3)
+        enrolled = set()
+        for _ in range(enrollments * 3):
+            if len(enrolled) >= enrollments:
+                break
+            enrolled.add(skewed_index(rng, plan.courses))
+
+        for course in sorted(enrolled):
+            day = max(plan.user_created(index), plan.course_created(course)) + timedelta(days=rng.random() * 20)
+            progress = rng.randint(0, plan.modules)
+            completed = progress == plan.modules
+            for m in range(progress):
+                a = assessment_index(plan, course, m)
+                kind = assessment_type(plan, a)
+                best_passed = False
+                attempts = 1 + int(rng.expovariate(1.5))
+                for attempt in range(attempts):
+                    day += timedelta(hours=1 + rng.random() * 72)
+                    if kind == 'mcq':
+                        chance = min(0.98, skill + 0.1 * attempt)
+                        answers, correct = [], 0
+                        for q in range(plan.questions):
+                            right = correct_answer(plan, a, q)
+                            answer = right if rng.random() < chance else (right + rng.randint(1, 3)) % 4
+                            correct += answer == right
+                            answers.append({'questionId': f'q{q + 1}', 'answer': answer})
+                        # Same arithmetic as calculate_mcq_score
+                        score = round((correct / plan.questions) * 100, 2) if plan.questions else 0
+                    else:
+                        answers = [{'questionId': 'q1', 'answer': 'Submitted solution'}]
+                        score = rng.randint(40, 100)
+                    passed = score >= passing_score(kind)
+                    best_passed = best_passed or passed
+                    attempt_number += 1
+                    results.append({
+                        '_id': make_id('result', index * 4096 + attempt_number % 4096, day),
+                        'userId': uid,
+                        'assessmentId': str(assessment_id(plan, a)),
+                        'courseId': str(course_id(plan, course)),
+                        'answers': answers,
+                        'score': score,
+                        'passed': passed,
+                        'timeSpent': rng.randint(3, 60),
+                        'attemptDate': day
+                    })
+                    if passed and rng.random() < 0.8:
+                        break
+                completed = completed and best_passed
+
+            if completed and rng.random() < 0.9:
+                issued = day + timedelta(hours=rng.random() * 24)
+                cert_index = index * plan.courses + course
+                digest = hashlib.blake2b(f'{plan.seed}:cert:{cert_index}'.encode(), digest_size=16).hexdigest().upper()
+                certificates.append({
+                    '_id': make_id('certificate', cert_index, issued),
+                    'userId': uid,
+                    'courseId': str(course_id(plan, course)),
+                    'courseTitle': course_title(plan, course),
+                    'userName': user_name(plan, index),
+                    'instructorName': user_name(plan, course_instructor(plan, course)),
+                    'certificateId': f'CERT-{issued:%Y%m%d}-{cert_index:08X}',
+                    'verificationCode': digest[:12],
+                    'issueDate': issued,
+                    'createdAt': issued
+                })
+    return {'test_results': results, 'certificates': certificates}
+
+
+def build_conversations(plan, start, stop):
+    conversations, messages = [], []
+    for x in range(start, stop):
+        rng = rng_for(plan.seed, 'conversation', x)
+        # Injective (student, teacher) pairing, so no pair gets two conversations
+        student = plan.student_index(x % plan.students)
+        teacher = plan.teacher_index((x // plan.students + x) % plan.teachers)
+        participants = [student, teacher]
+        ids = {i: user_id(plan, i) for i in participants}
+        created = max(plan.user_created(student), plan.user_created(teacher)) + timedelta(days=rng.random() * 30)
+
+        count = int(rng.expovariate(1 / plan.messages_per_conversation)) if plan.messages_per_conversation else 0
+        timestamp = created
+        last_text = None
+        for k in range(count):
+            timestamp += timedelta(minutes=1 + rng.expovariate(1 / 240))
+            sender = participants[0] if rng.random() < 0.55 else participants[1]
+            recipient = participants[1] if sender == participants[0] else participants[0]
+            last_text = rng.choice(PHRASES)
+            messages.append({
+                '_id': make_id('message', x * 65536 + k % 65536, timestamp),
+                'sender_id': ids[sender],
+                'recipient_id': ids[recipient],
+                'conversation_id': make_id('conversation', x, created),
+                'text': last_text,
+                'timestamp': timestamp,
+                # Everything but the tail of a conversation has been read
+                'is_read': k < count - 2 or rng.random() < 0.5,
+                'created_at': timestamp
+            })
+
+        conversations.append({
+            '_id': make_id('conversation', x, created),
+            'participants': [ids[i] for i in participants],
+            'participant_profiles': [{'_id': ids[i], 'fullName': user_name(plan, i), 'role': plan.user_role(i)}
+                                     for i in participants],
+            'created_by': ids[student],
+            'created_at': created,
+            'last_message': last_text,
+            'last_message_time': timestamp,
+            'updated_at': timestamp
+        })
+    return {'conversations': conversations, 'messages': messages}
+
+
+BUILDERS = {'users': build_users, 'courses': build_courses,
+            'activity': build_activity, 'conversations': build_conversations}
+
+_db = None
+
+
+def _init_worker(uri):
+    global _db
+    _db = MongoClient(uri).get_default_database()
+
+
+def run_job(plan, job, start, stop, batch_size):
+    """Build one slice of entities and insert it; returns {collection: inserted}"""
+    counts = {}
+    for collection, docs in BUILDERS[job](plan, start, stop).items():
+        inserted = 0
+        for i in range(0, len(docs), batch_size):
+            try:
+                inserted += len(_db[collection].insert_many(docs[i:i + batch_size], ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                # Duplicate keys from an earlier run of the same seed are skipped
+                inserted += e.details['nInserted']
+        counts[collection] = inserted
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate and bulk-load synthetic EduLearn data')
+    parser.add_argument('--uri', default=Config.MONGO_URI, help='MongoDB URI (default: MONGO_URI)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--teacher-ratio', type=float, default=0.05)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--modules', type=int, default=4, help='modules (and assessments) per course')
+    parser.add_argument('--lessons', type=int, default=3, help='lessons per module')
+    parser.add_argument('--questions', type=int, default=10, help='questions per MCQ assessment')
+    parser.add_argument('--max-enrollments', type=int, default=8, help='most courses a student attempts')
+    parser.add_argument('--conversations', type=int, default=5000)
+    parser.add_argument('--messages-per-conversation', type=float, default=12, help='mean, exponentially skewed')
+    parser.add_argument('--days', type=int, default=365, help='time span of the generated history')
+    parser.add_argument('--password', default='password123', help='password of every generated user')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents per insert_many')
+    parser.add_argument('--chunk', type=int, default=2000, help='entities per worker job')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--drop', action='store_true', help='drop the generated collections first')
+    parser.add_argument('--indexes', action='store_true', help='create the declared indexes after loading')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    # Hash once; every user shares it, so any generated account can log in
+    args.password_hash = generate_password_hash(args.password, method=Config.PASSWORD_HASH_METHOD)
+    plan = Plan(args)
+
+    db = MongoClient(args.uri).get_default_database()
+    if args.drop:
+        for name in COLLECTIONS:
+            db.drop_collection(name)
+
+    print(f'{plan.users} users ({plan.admins} admins, {plan.teachers} teachers), {plan.courses} courses, '
+          f'{plan.courses * plan.modules} assessments, {plan.conversations} conversations')
+
+    # Users and courses first so a partially loaded database stays referentially sane
+    phases = [
+        [('users', plan.users), ('courses', plan.courses)],
+        [('activity', plan.students), ('conversations', plan.conversations)],
+    ]
+    totals = {name: 0 for name in COLLECTIONS}
+    started = time.monotonic()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=_init_worker, initargs=(args.uri,)) as pool:
+        for phase in phases:
+            futures = [pool.submit(run_job, plan, job, start, min(start + args.chunk, total), args.batch_size)
+                       for job, total in phase
+                       for start in range(0, total, args.chunk)]
+            for future in as_completed(futures):
+                for collection, inserted in future.result().items():
+                    totals[collection] += inserted
+                loaded = sum(totals.values())
+                elapsed = time.monotonic() - started
+                print(f'\r{loaded:,} documents in {elapsed:.0f}s ({loaded / max(elapsed, 1e-9):,.0f}/s)',
+                      end='', flush=True)
+    print()
+
+    for name in COLLECTIONS:
+        print(f'  {name}: {totals[name]:,}')
+
+    # Catalog responses are cached per version (see Course.cache_version)
+    from modles.course import Course
+    Course.bump_cache_version(db)
+    # The admin user counters don't include bulk-loaded users; drop them so the next read recounts
+    db.stats.delete_one({'_id': 'users'})
+    # Best scores and course rollups are maintained on submit; derive them from the loaded attempts
+    from modles.assessment_progress import AssessmentProgress
+    print(f'Progress rebuilt: {AssessmentProgress.rebuild(db):,} user/assessment documents')
+
+    if args.indexes:
+        from utils.indexes import reconcile_indexes
+        for collection, entry in reconcile_indexes(db).items():
+            for name in entry['created']:
+                print(f'Created index {collection}.{name}')
+
+
+if __name__ == '__main__':
+    main()
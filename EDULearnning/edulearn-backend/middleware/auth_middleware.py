@@ -1,15 +1,16 @@
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from functools import wraps
 from flask import jsonify
-from modles.user import User
+from utils.identity import resolve_identity
 
 def admin_required(fn):
+    """Allow only active admins; the role lookup is served from the identity cache"""
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
         current_user_id = get_jwt_identity()
-        user = User.find_by_id(current_user_id)
-        if user and user.get('role') == 'admin':
+        identity = resolve_identity(current_user_id)
+        if identity and identity['role'] == 'admin' and identity['isActive']:
             return fn(*args, **kwargs)
         return jsonify({'message': 'Admin access required'}), 403
     return wrapper
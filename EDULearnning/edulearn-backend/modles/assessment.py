@@ -1,8 +1,18 @@
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
 from extensions import mongo
 from datetime import datetime
 
 class Assessment:
+    COLLECTION = 'assessments'
+    INDEXES = [
+        IndexModel([('courseId', ASCENDING), ('moduleId', ASCENDING)], name='courseId_1_moduleId_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'courseId': 'course-id'}},
+        {'filter': {'courseId': 'course-id', 'moduleId': 'module-id'}},
+    ]
+
     def __init__(self, courseId, moduleId, title, type, questions, passingScore, timeLimit=None, instructions=None):
         self.courseId = courseId
         self.moduleId = moduleId
@@ -38,6 +48,15 @@ class Assessment:
         except:
             return None
 
+    @staticmethod
+    def find_by_ids(assessment_ids):
+        """Assessments by id in one query: {id string: assessment}"""
+        object_ids = [ObjectId(assessment_id) for assessment_id in assessment_ids]
+        if not object_ids:
+            return {}
+        return {str(assessment['_id']): assessment
+                for assessment in mongo.db.assessments.find({'_id': {'$in': object_ids}})}
+
     @staticmethod
     def find_by_course(course_id):
         return list(mongo.db.assessments.find({'courseId': course_id}))
@@ -0,0 +1,177 @@
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from extensions import mongo
+from datetime import datetime
+
+class AssessmentProgress:
+    """
+    Best score, passed flag and attempt count of a user on an assessment,
+    kept up to date on every submission instead of recomputed from the raw
+    attempt history.
+    """
+    COLLECTION = 'user_assessment_progress'
+    INDEXES = [
+        IndexModel([('userId', ASCENDING), ('assessmentId', ASCENDING)], name='userId_1_assessmentId_1', unique=True),
+        IndexModel([('userId', ASCENDING), ('courseId', ASCENDING)], name='userId_1_courseId_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'userId': 'user-id', 'courseId': 'course-id'}},
+    ]
+
+    @staticmethod
+    def record_attempts(results, count_attempts=True):
+        """
+        Fold stored test result documents into the progress of their users,
+        atomically with one pipeline update each: passed is taken from an
+        attempt only when it beats bestScore (the passed flag of the best
+        attempt, as refresh and rebuild compute it), bestScore and last
+        attempt by max, attempts by addition. The course rollup is then
+        aligned with the resulting passed flags.
+        """
+        if not results:
+            return
+        now = datetime.utcnow()
+        progress_ops = []
+        for result in results:
+            # Every expression of a $set stage sees the document before the stage
+            progress_ops.append(UpdateOne(
+                {'userId': result['userId'], 'assessmentId': result['assessmentId']},
+                [{'$set': {
+                    'passed': {'$cond': [{'$gt': [result['score'], {'$ifNull': ['$bestScore', None]}]},
+                                         bool(result['passed']), '$passed']},
+                    'bestScore': {'$max': ['$bestScore', result['score']]},
+                    'lastAttemptAt': {'$max': ['$lastAttemptAt', result['attemptDate']]},
+                    'attempts': {'$add': [{'$ifNull': ['$attempts', 0]}, 1 if count_attempts else 0]},
+                    'courseId': {'$ifNull': ['$courseId', result['courseId']]},
+                    'updatedAt': now
+                }}],
+                upsert=True
+            ))
+        mongo.db.user_assessment_progress.bulk_write(progress_ops, ordered=False)
+
+        # A better attempt can also clear passed (after a passing score was raised)
+        touched = {(result['userId'], result['assessmentId']) for result in results}
+        query = {'userId': {'$in': list({user_id for user_id, _ in touched})},
+                 'assessmentId': {'$in': list({assessment_id for _, assessment_id in touched})}}
+        rollup_ops = [
+            CourseProgress.passed_update(progress['userId'], progress['courseId'], progress['assessmentId'],
+                                         progress['passed'], now)
+            for progress in mongo.db.user_assessment_progress.find(
+                query, {'_id': 0, 'userId': 1, 'courseId': 1, 'assessmentId': 1, 'passed': 1})
+            if (progress['userId'], progress['assessmentId']) in touched
+        ]
+        if rollup_ops:
+            mongo.db.user_course_progress.bulk_write(rollup_ops, ordered=False)
+
+    @staticmethod
+    def refresh(assessment_id, user_ids):
+        """
+        Recompute progress on one assessment from test_results, for changes
+        $max can't express (a lower re-grade, a re-scored answer key).
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        pipeline = [
+            {'$match': {'assessmentId': assessment_id, 'userId': {'$in': user_ids}}},
+            {'$sort': {'score': -1}},
+            {'$group': {
+                '_id': '$userId',
+                'courseId': {'$first': '$courseId'},
+                'bestScore': {'$first': '$score'},
+                'passed': {'$first': '$passed'},
+                'attempts': {'$sum': 1},
+                'lastAttemptAt': {'$max': '$attemptDate'}
+            }}
+        ]
+        now = datetime.utcnow()
+        progress_ops, rollup_ops = [], []
+        for row in mongo.db.test_results.aggregate(pipeline):
+            passed = bool(row['passed'])
+            progress_ops.append(UpdateOne(
+                {'userId': row['_id'], 'assessmentId': assessment_id},
+                {'$set': {'courseId': row['courseId'], 'bestScore': row['bestScore'], 'passed': passed,
+                          'attempts': row['attempts'], 'lastAttemptAt': row['lastAttemptAt'], 'updatedAt': now}},
+                upsert=True
+            ))
+            rollup_ops.append(CourseProgress.passed_update(row['_id'], row['courseId'], assessment_id, passed, now))
+        if progress_ops:
+            mongo.db.user_assessment_progress.bulk_write(progress_ops, ordered=False)
+            mongo.db.user_course_progress.bulk_write(rollup_ops, ordered=False)
+
+    @staticmethod
+    def find_by_user_and_course(user_id, course_id):
+        """{assessmentId: progress} of a user in a course"""
+        return {progress['assessmentId']: progress
+                for progress in mongo.db.user_assessment_progress.find({'userId': user_id, 'courseId': course_id})}
+
+    @staticmethod
+    def rebuild(db=None):
+        """
+        Regenerate both collections from test_results. $out replaces each
+        collection in one step and keeps its indexes.
+        """
+        db = mongo.db if db is None else db
+        db.test_results.aggregate([
+            {'$sort': {'score': -1}},
+            {'$group': {
+                '_id': {'userId': '$userId', 'assessmentId': '$assessmentId'},
+                'courseId': {'$first': '$courseId'},
+                'bestScore': {'$first': '$score'},
+                'passed': {'$first': '$passed'},
+                'attempts': {'$sum': 1},
+                'lastAttemptAt': {'$max': '$attemptDate'}
+            }},
+            {'$project': {
+                '_id': 0,
+                'userId': '$_id.userId',
+                'assessmentId': '$_id.assessmentId',
+                'courseId': 1,
+                'bestScore': 1,
+                'passed': {'$eq': ['$passed', True]},
+                'attempts': 1,
+                'lastAttemptAt': 1,
+                'updatedAt': '$$NOW'
+            }},
+            {'$out': AssessmentProgress.COLLECTION}
+        ], allowDiskUse=True)
+        db.user_assessment_progress.aggregate([
+            {'$match': {'passed': True}},
+            {'$group': {
+                '_id': {'userId': '$userId', 'courseId': '$courseId'},
+                'passedAssessmentIds': {'$addToSet': '$assessmentId'}
+            }},
+            {'$project': {
+                '_id': 0,
+                'userId': '$_id.userId',
+                'courseId': '$_id.courseId',
+                'passedAssessmentIds': 1,
+                'updatedAt': '$$NOW'
+            }},
+            {'$out': CourseProgress.COLLECTION}
+        ], allowDiskUse=True)
+        return db.user_assessment_progress.estimated_document_count()
+
+
+class CourseProgress:
+    """Per-user course rollup: the ids of the course's assessments the user has passed"""
+    COLLECTION = 'user_course_progress'
+    INDEXES = [
+        IndexModel([('userId', ASCENDING), ('courseId', ASCENDING)], name='userId_1_courseId_1', unique=True),
+        IndexModel([('courseId', ASCENDING)], name='courseId_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'userId': 'user-id', 'courseId': 'course-id'}},
+        {'filter': {'courseId': 'course-id'}},
+    ]
+
+    @staticmethod
+    def passed_update(user_id, course_id, assessment_id, passed, now):
+        change = {'$addToSet' if passed else '$pull': {'passedAssessmentIds': assessment_id}}
+        return UpdateOne({'userId': user_id, 'courseId': course_id},
+                         dict(change, **{'$set': {'updatedAt': now}}), upsert=passed)
+
+    @staticmethod
+    def passed_ids(user_id, course_id):
+        rollup = mongo.db.user_course_progress.find_one({'userId': user_id, 'courseId': course_id},
+                                                        {'passedAssessmentIds': 1})
+        return set(rollup.get('passedAssessmentIds', [])) if rollup else set()
@@ -1,10 +1,41 @@
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from extensions import mongo
 from datetime import datetime
 import random
 import string
 
+DUPLICATE_KEY = 11000
+# One certificate per user and course, also under concurrent issuance
+USER_COURSE_INDEX = 'userId_1_courseId_1'
+VERIFICATION_PROJECTION = {'_id': 0, 'userName': 1, 'courseTitle': 1, 'issueDate': 1, 'certificateId': 1}
+
+def is_already_issued(error):
+    """True for a duplicate key error raised by the one-per-user-and-course index"""
+    if error.get('code') != DUPLICATE_KEY:
+        return False
+    if 'keyPattern' in error:
+        return 'courseId' in error['keyPattern']
+    return USER_COURSE_INDEX in error.get('errmsg', '')
+
 class Certificate:
+    COLLECTION = 'certificates'
+    INDEXES = [
+        IndexModel([('certificateId', ASCENDING)], name='certificateId_1', unique=True),
+        IndexModel([('verificationCode', ASCENDING)], name='verificationCode_1', unique=True),
+        IndexModel([('userId', ASCENDING), ('issueDate', DESCENDING)], name='userId_1_issueDate_-1'),
+        IndexModel([('userId', ASCENDING), ('courseId', ASCENDING)], name=USER_COURSE_INDEX, unique=True),
+        IndexModel([('courseId', ASCENDING), ('issueDate', ASCENDING)], name='courseId_1_issueDate_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'certificateId': 'CERT-00000000-XXXXXXXX'}},
+        {'filter': {'verificationCode': 'XXXXXXXXXXXX'}},
+        {'filter': {'userId': 'user-id'}, 'sort': [('issueDate', DESCENDING)]},
+        {'filter': {'userId': 'user-id', 'courseId': 'course-id'}},
+        {'filter': {'courseId': 'course-id'}, 'sort': [('issueDate', ASCENDING)]},
+    ]
+
     def __init__(self, userId, courseId, courseTitle, userName, instructorName, completionDate=None):
         self.userId = userId
         self.courseId = courseId
@@ -28,8 +59,8 @@ class Certificate:
         """Generate verification code for certificate authenticity"""
         return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
 
-    def save(self):
-        certificate_data = {
+    def to_document(self):
+        return {
             'userId': self.userId,
             'courseId': self.courseId,
             'courseTitle': self.courseTitle,
@@ -40,9 +71,35 @@ class Certificate:
             'issueDate': self.issueDate,
             'createdAt': self.createdAt
         }
-        result = mongo.db.certificates.insert_one(certificate_data)
+
+    def save(self):
+        """Insert the certificate; returns None if the user already has one for the course"""
+        try:
+            result = mongo.db.certificates.insert_one(self.to_document())
+        except DuplicateKeyError as e:
+            if not is_already_issued(e.details or {}):
+                raise
+            return None
         return str(result.inserted_id)
 
+    @staticmethod
+    def insert_many(documents):
+        """
+        Insert certificate documents in one unordered batch. Returns the
+        positions rejected because the user already has a certificate for the
+        course; every other document has its _id set.
+        """
+        if not documents:
+            return set()
+        try:
+            mongo.db.certificates.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if not all(is_already_issued(error) for error in errors):
+                raise
+            return {error['index'] for error in errors}
+        return set()
+
     @staticmethod
     def find_by_id(cert_id):
         try:
@@ -103,29 +160,133 @@ class Certificate:
         )
         
         cert_id = certificate.save()
+        if not cert_id:
+            # Issued by a concurrent request or a cohort run since the check
+            return None, "Certificate already issued for this course"
         return cert_id, "Certificate generated successfully"
 
+    @staticmethod
+    def find_eligible_cohort(course_id, assessment_ids):
+        """
+        Users who passed every assessment of a course and have no certificate
+        for it yet, with their names, in one aggregation over the course
+        progress rollups.
+        """
+        match = {'courseId': course_id}
+        if assessment_ids:
+            match['passedAssessmentIds'] = {'$all': list(assessment_ids)}
+        pipeline = [
+            {'$match': match},
+            {'$lookup': {'from': 'certificates', 'localField': 'userId',
+                         'foreignField': 'userId', 'as': 'certificates'}},
+            {'$match': {'certificates.courseId': {'$ne': course_id}}},
+            # A malformed userId drops that row instead of failing the whole run
+            {'$addFields': {'userObjectId': {'$convert': {'input': '$userId', 'to': 'objectId',
+                                                          'onError': None, 'onNull': None}}}},
+            {'$match': {'userObjectId': {'$ne': None}}},
+            {'$lookup': {'from': 'users', 'localField': 'userObjectId', 'foreignField': '_id', 'as': 'user'}},
+            {'$unwind': '$user'},
+            {'$project': {'_id': 0, 'userId': 1, 'userName': {'$ifNull': ['$user.fullName', 'Student']}}},
+            {'$sort': {'userId': 1}}
+        ]
+        return list(mongo.db.user_course_progress.aggregate(pipeline))
+
+    @staticmethod
+    def issue_for_course(course_id, course_title, instructor_name, batch_size=500):
+        """
+        Issue certificates to the whole eligible cohort of a course, inserted
+        batch_size at a time. Returns (issued documents, skipped count); users
+        certified concurrently are skipped by the unique index.
+        """
+        assessment_ids = [str(assessment['_id'])
+                          for assessment in mongo.db.assessments.find({'courseId': course_id}, {'_id': 1})]
+        cohort = Certificate.find_eligible_cohort(course_id, assessment_ids)
+
+        # Mongo keeps milliseconds; truncating here keeps PDF cache keys identical after a re-read
+        now = datetime.utcnow()
+        issue_date = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+        issued, skipped = [], 0
+        for start in range(0, len(cohort), batch_size):
+            documents = [
+                Certificate(
+                    userId=member['userId'],
+                    courseId=course_id,
+                    courseTitle=course_title,
+                    userName=member['userName'],
+                    instructorName=instructor_name,
+                    completionDate=issue_date
+                ).to_document()
+                for member in cohort[start:start + batch_size]
+            ]
+            rejected = Certificate.insert_many(documents)
+            skipped += len(rejected)
+            issued.extend(document for position, document in enumerate(documents) if position not in rejected)
+        return issued, skipped
+
+    @staticmethod
+    def make_user_course_unique(db=None):
+        """
+        Upgrade step for databases created with a non-unique
+        userId_1_courseId_1: keep the earliest certificate of every
+        (userId, courseId), delete the rest, and rebuild the index as unique.
+        Returns the number of certificates deleted.
+        """
+        db = mongo.db if db is None else db
+        certificates = db.certificates
+        duplicates = certificates.aggregate([
+            {'$sort': {'issueDate': 1, '_id': 1}},
+            {'$group': {'_id': {'userId': '$userId', 'courseId': '$courseId'},
+                        'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        for group in duplicates:
+            removed += certificates.delete_many({'_id': {'$in': group['ids'][1:]}}).deleted_count
+
+        existing = certificates.index_information().get(USER_COURSE_INDEX)
+        if existing is not None and not existing.get('unique'):
+            certificates.drop_index(USER_COURSE_INDEX)
+        declared = next(index for index in Certificate.INDEXES if index.document['name'] == USER_COURSE_INDEX)
+        certificates.create_indexes([declared])
+        return removed
+
     @staticmethod
     def verify_certificate(certificate_id=None, verification_code=None):
         """Verify certificate authenticity"""
         if certificate_id:
-            cert = Certificate.find_by_certificate_id(certificate_id)
+            cert = Certificate.find_for_verification('certificateId', certificate_id)
         elif verification_code:
-            cert = Certificate.find_by_verification_code(verification_code)
+            cert = Certificate.find_for_verification('verificationCode', verification_code)
         else:
             return False, "No certificate ID or verification code provided"
         
         if cert:
-            return True, {
-                'valid': True,
-                'userName': cert.get('userName'),
-                'courseTitle': cert.get('courseTitle'),
-                'issueDate': cert.get('issueDate'),
-                'certificateId': cert.get('certificateId')
-            }
+            return True, Certificate.verification_summary(cert)
         
         return False, "Certificate not found or invalid"
 
+    @staticmethod
+    def find_for_verification(field, value):
+        """Certificate by certificateId or verificationCode, with only the fields verification shows"""
+        return mongo.db.certificates.find_one({field: value}, VERIFICATION_PROJECTION)
+
+    @staticmethod
+    def verification_summary(cert):
+        return {
+            'valid': True,
+            'userName': cert.get('userName'),
+            'courseTitle': cert.get('courseTitle'),
+            'issueDate': cert.get('issueDate'),
+            'certificateId': cert.get('certificateId')
+        }
+
+    @staticmethod
+    def find_for_export(filter_query, fields, limit):
+        """Get certificates for bulk export, oldest first, with only the given fields"""
+        projection = {field: 1 for field in fields}
+        return list(mongo.db.certificates.find(filter_query, projection).sort('issueDate', 1).limit(limit))
+
     @staticmethod
     def find_all(filter_query=None):
         if filter_query is None:
@@ -1,7 +1,17 @@
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
 from extensions import mongo
+from utils.pagination import keyset_page, approximate_total, DEFAULT_PAGE_SIZE
 
 class Course:
+    COLLECTION = 'courses'
+    INDEXES = [
+        IndexModel([('instructor', ASCENDING)], name='instructor_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'instructor': 'instructor-id'}},
+    ]
+
     def __init__(self, title, description, category, instructor, price):
         self.title = title
         self.description = description
@@ -20,12 +30,35 @@ class Course:
             'isPublished': self.isPublished
         }
         result = mongo.db.courses.insert_one(course_data)
+        Course.bump_cache_version()
         return str(result.inserted_id)
 
     @staticmethod
     def find_by_id(course_id):
         return mongo.db.courses.find_one({'_id': ObjectId(course_id)})
 
+    @staticmethod
+    def cache_version():
+        """Version stamp of the course catalog; bumped by every course write"""
+        doc = mongo.db.cache_versions.find_one({'_id': 'courses'})
+        return doc['version'] if doc else 0
+
+    @staticmethod
+    def bump_cache_version(db=None):
+        """Invalidate cached catalog responses in every worker; call after any course write"""
+        db = mongo.db if db is None else db
+        db.cache_versions.update_one({'_id': 'courses'}, {'$inc': {'version': 1}}, upsert=True)
+
+    @staticmethod
+    def find_page(after=None, limit=DEFAULT_PAGE_SIZE, include_modules=False):
+        """Get one keyset page of the catalog, without modules/lessons by default"""
+        projection = None if include_modules else {'modules': 0}
+        return keyset_page(mongo.db.courses, {}, after=after, limit=limit, projection=projection)
+
+    @staticmethod
+    def approximate_count():
+        return approximate_total(mongo.db.courses, {})
+
     @staticmethod
     def find_all(filter_query=None):
         if filter_query is None:
@@ -1,32 +1,126 @@
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timezone
+from pymongo import IndexModel, UpdateOne, ASCENDING, DESCENDING
 from extensions import mongo
 
 class Message:
     """Model for individual messages"""
+
+    COLLECTION = 'messages'
+    INDEXES = [
+        IndexModel([('conversation_id', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)],
+                   name='conversation_id_1_timestamp_1__id_1'),
+        IndexModel([('recipient_id', ASCENDING), ('is_read', ASCENDING), ('conversation_id', ASCENDING)],
+                   name='recipient_id_1_is_read_1_conversation_id_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'conversation_id': ObjectId()}, 'sort': [('timestamp', DESCENDING), ('_id', DESCENDING)]},
+        {'filter': {'conversation_id': ObjectId(), 'timestamp': {'$gt': datetime(2000, 1, 1)}},
+         'sort': [('timestamp', ASCENDING), ('_id', ASCENDING)]},
+        {'filter': {'recipient_id': ObjectId(), 'is_read': False}},
+        {'filter': {'conversation_id': ObjectId(), 'recipient_id': ObjectId(), 'is_read': False}},
+    ]
     
     @staticmethod
-    def create_message(sender_id, recipient_id, conversation_id, text):
-        """Create a new message"""
-        message_data = {
+    def new_message_document(sender_id, recipient_id, conversation_id, text):
+        """Document stored for a new message"""
+        now = datetime.utcnow()
+        return {
             'sender_id': ObjectId(sender_id),
             'recipient_id': ObjectId(recipient_id),
             'conversation_id': ObjectId(conversation_id),
             'text': text,
-            'timestamp': datetime.utcnow(),
+            'timestamp': now,
             'is_read': False,
-            'created_at': datetime.utcnow()
+            'created_at': now
         }
+    
+    @staticmethod
+    def create_message(sender_id, recipient_id, conversation_id, text):
+        """Create a new message"""
+        message_data = Message.new_message_document(sender_id, recipient_id, conversation_id, text)
         result = mongo.db.messages.insert_one(message_data)
         return str(result.inserted_id)
     
     @staticmethod
-    def get_conversation_messages(conversation_id, limit=100):
-        """Get all messages in a conversation"""
-        messages = mongo.db.messages.find({
-            'conversation_id': ObjectId(conversation_id)
-        }).sort('timestamp', 1).limit(limit)
-        return list(messages)
+    def get_conversation_messages(conversation_id, limit=50, before=None, since=None):
+        """
+        Get one page of messages in a conversation, oldest first.
+
+        By default the most recent page is returned. `before` (message id or
+        ISO timestamp) pages back through older messages; `since` returns
+        only messages newer than the given one, for incremental refresh.
+        Returns (messages, has_more).
+        """
+        keyset = None
+        if since:
+            keyset = Message._keyset_filter(conversation_id, since, '$gt')
+        elif before:
+            keyset = Message._keyset_filter(conversation_id, before, '$lt')
+
+        query, sort = Message.page_query(conversation_id, keyset, newest_first=not since)
+        messages = list(mongo.db.messages.find(query).sort(sort).limit(limit + 1))
+        return Message.finish_page(messages, limit, newest_first=not since)
+    
+    @staticmethod
+    def page_query(conversation_id, keyset=None, newest_first=True):
+        """Filter and sort for one page of a conversation; fetch limit + 1 documents"""
+        query = {'conversation_id': ObjectId(conversation_id)}
+        if keyset:
+            query.update(keyset)
+        direction = -1 if newest_first else 1
+        return query, [('timestamp', direction), ('_id', direction)]
+    
+    @staticmethod
+    def finish_page(messages, limit, newest_first=True):
+        """Trim a limit + 1 fetch to (messages oldest first, has_more)"""
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if newest_first:
+            messages.reverse()
+        return messages, has_more
+    
+    @staticmethod
+    def _keyset_filter(conversation_id, position, op):
+        """
+        Build a (timestamp, _id) keyset condition from a message id or an
+        ISO timestamp. Raises ValueError if the position cannot be resolved.
+        """
+        cursor = Message.parse_cursor(position)
+        if isinstance(cursor, datetime):
+            return Message.keyset_condition(op, cursor)
+
+        anchor = mongo.db.messages.find_one(Message.anchor_query(conversation_id, cursor), {'timestamp': 1})
+        if not anchor:
+            raise ValueError('Unknown message cursor')
+        return Message.keyset_condition(op, anchor['timestamp'], anchor['_id'])
+    
+    @staticmethod
+    def parse_cursor(position):
+        """ObjectId for a message id, naive UTC datetime for an ISO timestamp"""
+        if ObjectId.is_valid(position):
+            return ObjectId(position)
+        try:
+            timestamp = datetime.fromisoformat(position.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError('Cursor must be a message id or ISO timestamp')
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return timestamp
+    
+    @staticmethod
+    def anchor_query(conversation_id, message_id):
+        return {'_id': message_id, 'conversation_id': ObjectId(conversation_id)}
+    
+    @staticmethod
+    def keyset_condition(op, timestamp, message_id=None):
+        """Messages strictly before ('$lt') or after ('$gt') a (timestamp, _id) position"""
+        if message_id is None:
+            return {'timestamp': {op: timestamp}}
+        return {'$or': [
+            {'timestamp': {op: timestamp}},
+            {'timestamp': timestamp, '_id': {op: message_id}}
+        ]}
     
     @staticmethod
     def mark_as_read(message_id):
@@ -40,48 +134,70 @@ class Message:
     def mark_conversation_as_read(conversation_id, user_id):
         """Mark all messages in a conversation as read for a specific user"""
         mongo.db.messages.update_many(
-            {
-                'conversation_id': ObjectId(conversation_id),
-                'recipient_id': ObjectId(user_id),
-                'is_read': False
-            },
+            Message.unread_filter(user_id, conversation_id),
             {'$set': {'is_read': True}}
         )
     
+    @staticmethod
+    def unread_filter(user_id, conversation_id=None):
+        """Unread messages addressed to a user, optionally within one conversation"""
+        query = {'recipient_id': ObjectId(user_id), 'is_read': False}
+        if conversation_id is not None:
+            query['conversation_id'] = ObjectId(conversation_id)
+        return query
+    
     @staticmethod
     def get_unread_count(user_id):
         """Get count of unread messages for a user"""
-        count = mongo.db.messages.count_documents({
-            'recipient_id': ObjectId(user_id),
-            'is_read': False
-        })
+        count = mongo.db.messages.count_documents(Message.unread_filter(user_id))
         return count
 
 
+# User fields copied onto conversations so the inbox needs no user lookups
+PROFILE_FIELDS = ('fullName', 'avatar', 'role')
+
+
 class Conversation:
     """Model for conversations between users"""
+
+    COLLECTION = 'conversations'
+    INDEXES = [
+        IndexModel([('participants', ASCENDING), ('last_message_time', DESCENDING)],
+                   name='participants_1_last_message_time_-1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'participants': ObjectId()}, 'sort': [('last_message_time', DESCENDING)]},
+        {'filter': {'participants': {'$all': [ObjectId(), ObjectId()]}}},
+    ]
     
     @staticmethod
     def create_conversation(participant_ids, created_by):
         """Create a new conversation"""
         # Check if conversation already exists between these participants
-        existing = mongo.db.conversations.find_one({
-            'participants': {'$all': [ObjectId(pid) for pid in participant_ids]}
-        })
+        existing = mongo.db.conversations.find_one(Conversation.existing_conversation_filter(participant_ids))
         
         if existing:
             return str(existing['_id'])
         
-        conversation_data = {
+        conversation_data = Conversation.new_conversation_document(
+            participant_ids, created_by, Conversation.build_participant_profiles(participant_ids)
+        )
+        result = mongo.db.conversations.insert_one(conversation_data)
+        return str(result.inserted_id)
+    
+    @staticmethod
+    def new_conversation_document(participant_ids, created_by, participant_profiles):
+        """Document stored for a new conversation"""
+        now = datetime.utcnow()
+        return {
             'participants': [ObjectId(pid) for pid in participant_ids],
+            'participant_profiles': participant_profiles,
             'created_by': ObjectId(created_by),
-            'created_at': datetime.utcnow(),
+            'created_at': now,
             'last_message': None,
-            'last_message_time': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'last_message_time': now,
+            'updated_at': now
         }
-        result = mongo.db.conversations.insert_one(conversation_data)
-        return str(result.inserted_id)
     
     @staticmethod
     def get_user_conversations(user_id):
@@ -91,6 +207,123 @@ class Conversation:
         }).sort('last_message_time', -1)
         return list(conversations)
     
+    @staticmethod
+    def get_inbox(user_id):
+        """
+        Get all conversations for a user with unread counts and participant
+        profiles in a single aggregation.
+
+        Profiles come from the denormalized participant_profiles field; only
+        conversations created before it existed fall back to a $lookup on
+        users, and are backfilled so the next load skips it.
+        """
+        conversations = []
+        backfill = []
+        for conv in mongo.db.conversations.aggregate(Conversation.inbox_pipeline(user_id)):
+            update = Conversation.fill_missing_profiles(conv)
+            if update is not None:
+                backfill.append(update)
+            conversations.append(conv)
+
+        if backfill:
+            mongo.db.conversations.bulk_write(backfill, ordered=False)
+
+        return conversations
+    
+    @staticmethod
+    def inbox_pipeline(user_id):
+        """Aggregation behind get_inbox"""
+        user_oid = ObjectId(user_id)
+        return [
+            {'$match': {'participants': user_oid}},
+            {'$sort': {'last_message_time': -1}},
+            {'$lookup': {
+                'from': 'messages',
+                'let': {'conversationId': '$_id'},
+                'pipeline': [
+                    {'$match': {
+                        'recipient_id': user_oid,
+                        'is_read': False,
+                        '$expr': {'$eq': ['$conversation_id', '$$conversationId']}
+                    }},
+                    {'$group': {'_id': None, 'count': {'$sum': 1}}}
+                ],
+                'as': 'unread'
+            }},
+            {'$addFields': {
+                'missing_profiles': {
+                    '$cond': [{'$ifNull': ['$participant_profiles', False]}, [], '$participants']
+                }
+            }},
+            {'$lookup': {
+                'from': 'users',
+                'localField': 'missing_profiles',
+                'foreignField': '_id',
+                'pipeline': [{'$project': {field: 1 for field in PROFILE_FIELDS}}],
+                'as': 'looked_up_profiles'
+            }},
+            {'$addFields': {
+                'unread_count': {'$ifNull': [{'$arrayElemAt': ['$unread.count', 0]}, 0]}
+            }},
+            {'$project': {'unread': 0, 'missing_profiles': 0}}
+        ]
+    
+    @staticmethod
+    def fill_missing_profiles(conv):
+        """
+        Move looked-up profiles of a legacy inbox row into participant_profiles.
+        Returns the UpdateOne that backfills it, or None if nothing was missing.
+        """
+        looked_up = conv.pop('looked_up_profiles', [])
+        if 'participant_profiles' in conv:
+            return None
+        conv['participant_profiles'] = [Conversation._profile(user) for user in looked_up]
+        return UpdateOne(
+            {'_id': conv['_id']},
+            {'$set': {'participant_profiles': conv['participant_profiles']}}
+        )
+    
+    @staticmethod
+    def build_participant_profiles(participant_ids):
+        """Fetch the display fields of every participant in one query"""
+        projection = {field: 1 for field in PROFILE_FIELDS}
+        users = mongo.db.users.find({'_id': {'$in': [ObjectId(pid) for pid in participant_ids]}}, projection)
+        return [Conversation._profile(user) for user in users]
+    
+    @staticmethod
+    def existing_conversation_filter(participant_ids):
+        return {'participants': {'$all': [ObjectId(pid) for pid in participant_ids]}}
+    
+    @staticmethod
+    def _profile(user):
+        profile = {'_id': user['_id']}
+        for field in PROFILE_FIELDS:
+            if field in user:
+                profile[field] = user[field]
+        return profile
+    
+    @staticmethod
+    def get_participant_profile(conversation, participant_id):
+        """Get a participant's denormalized profile from a conversation document"""
+        for profile in conversation.get('participant_profiles', []):
+            if str(profile['_id']) == str(participant_id):
+                return profile
+        return None
+    
+    @staticmethod
+    def refresh_participant_profile(user_id, user_fields):
+        """Propagate changed display fields of a user to their conversations"""
+        updates = {f'participant_profiles.$[profile].{field}': value
+                   for field, value in user_fields.items() if field in PROFILE_FIELDS}
+        if not updates:
+            return
+        user_oid = ObjectId(user_id)
+        mongo.db.conversations.update_many(
+            {'participants': user_oid},
+            {'$set': updates},
+            array_filters=[{'profile._id': user_oid}]
+        )
+    
     @staticmethod
     def get_conversation_by_id(conversation_id):
         """Get a specific conversation"""
@@ -101,29 +334,25 @@ class Conversation:
         """Update the last message and timestamp for a conversation"""
         mongo.db.conversations.update_one(
             {'_id': ObjectId(conversation_id)},
-            {
-                '$set': {
-                    'last_message': message_text,
-                    'last_message_time': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-            }
+            Conversation.last_message_update(message_text)
         )
     
+    @staticmethod
+    def last_message_update(message_text):
+        now = datetime.utcnow()
+        return {'$set': {'last_message': message_text, 'last_message_time': now, 'updated_at': now}}
+    
     @staticmethod
     def get_unread_count_by_conversation(conversation_id, user_id):
         """Get unread message count for a specific conversation"""
-        count = mongo.db.messages.count_documents({
-            'conversation_id': ObjectId(conversation_id),
-            'recipient_id': ObjectId(user_id),
-            'is_read': False
-        })
+        count = mongo.db.messages.count_documents(Message.unread_filter(user_id, conversation_id))
         return count
     
     @staticmethod
-    def get_other_participant(conversation_id, current_user_id):
+    def get_other_participant(conversation_id, current_user_id, conversation=None):
         """Get the other participant in a conversation"""
-        conversation = Conversation.get_conversation_by_id(conversation_id)
+        if conversation is None:
+            conversation = Conversation.get_conversation_by_id(conversation_id)
         if not conversation:
             return None
         
@@ -0,0 +1,99 @@
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
+from extensions import mongo
+from datetime import datetime, timedelta
+
+ACTIVE_STATUSES = ['queued', 'running']
+
+class RegradeJob:
+    """
+    Re-scoring of an assessment's stored results after its grading fields
+    changed. Jobs live in Mongo so any worker process can pick them up and a
+    job interrupted by a restart resumes after its last checkpoint.
+    """
+    COLLECTION = 'regrade_jobs'
+    INDEXES = [
+        IndexModel([('status', ASCENDING), ('createdAt', ASCENDING)], name='status_1_createdAt_1'),
+        IndexModel([('assessmentId', ASCENDING), ('createdAt', DESCENDING)], name='assessmentId_1_createdAt_-1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'status': 'queued'}, 'sort': [('createdAt', ASCENDING)]},
+        {'filter': {'assessmentId': 'assessment-id'}, 'sort': [('createdAt', DESCENDING)]},
+    ]
+
+    @staticmethod
+    def enqueue(assessment_id, reason=None):
+        """Queue a job for an assessment, superseding any queued or running one"""
+        now = datetime.utcnow()
+        mongo.db.regrade_jobs.update_many(
+            {'assessmentId': assessment_id, 'status': {'$in': ACTIVE_STATUSES}},
+            {'$set': {'status': 'superseded', 'finishedAt': now, 'updatedAt': now}}
+        )
+        job = {
+            'assessmentId': assessment_id,
+            'status': 'queued',
+            'reason': reason,
+            'lastResultId': None,
+            'processed': 0,
+            'changed': 0,
+            'total': None,
+            'owner': None,
+            'createdAt': now,
+            'updatedAt': now,
+            'heartbeatAt': None,
+            'finishedAt': None,
+            'error': None
+        }
+        result = mongo.db.regrade_jobs.insert_one(job)
+        return str(result.inserted_id)
+
+    @staticmethod
+    def claim(owner, stale_after_seconds):
+        """
+        Take the oldest queued job, or a running one whose worker stopped
+        sending heartbeats; returns it or None.
+        """
+        now = datetime.utcnow()
+        for query in ({'status': 'queued'},
+                      {'status': 'running', 'heartbeatAt': {'$lt': now - timedelta(seconds=stale_after_seconds)}}):
+            job = mongo.db.regrade_jobs.find_one_and_update(
+                query,
+                {'$set': {'status': 'running', 'owner': owner, 'heartbeatAt': now, 'updatedAt': now},
+                 # Kept from the first claim when a job is resumed
+                 '$min': {'startedAt': now}},
+                sort=[('createdAt', ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                return job
+        return None
+
+    @staticmethod
+    def checkpoint(job_id, owner, update):
+        """
+        Record progress of a running job. Returns False when the job is no
+        longer ours (superseded, or taken over), so the worker stops.
+        """
+        now = datetime.utcnow()
+        update = dict(update)
+        update.setdefault('$set', {}).update({'heartbeatAt': now, 'updatedAt': now})
+        result = mongo.db.regrade_jobs.update_one(
+            {'_id': ObjectId(job_id), 'status': 'running', 'owner': owner}, update)
+        return result.matched_count > 0
+
+    @staticmethod
+    def finish(job_id, owner, status, error=None):
+        now = datetime.utcnow()
+        mongo.db.regrade_jobs.update_one(
+            {'_id': ObjectId(job_id), 'status': 'running', 'owner': owner},
+            {'$set': {'status': status, 'error': error, 'finishedAt': now, 'updatedAt': now}}
+        )
+
+    @staticmethod
+    def latest_for(assessment_id):
+        jobs = mongo.db.regrade_jobs.find({'assessmentId': assessment_id}).sort('createdAt', DESCENDING).limit(1)
+        return next(iter(jobs), None)
+
+    @staticmethod
+    def find_by_id(job_id):
+        return mongo.db.regrade_jobs.find_one({'_id': ObjectId(job_id)})
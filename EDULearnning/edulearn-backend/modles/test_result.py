@@ -1,9 +1,36 @@
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 from extensions import mongo
+from modles.assessment_progress import AssessmentProgress, CourseProgress
 from datetime import datetime
 
+DUPLICATE_KEY = 11000
+
 class TestResult:
-    def __init__(self, userId, assessmentId, courseId, answers, score, passed, timeSpent=None):
+    COLLECTION = 'test_results'
+    INDEXES = [
+        IndexModel([('userId', ASCENDING), ('assessmentId', ASCENDING), ('score', DESCENDING)],
+                   name='userId_1_assessmentId_1_score_-1'),
+        IndexModel([('userId', ASCENDING), ('assessmentId', ASCENDING), ('attemptDate', DESCENDING)],
+                   name='userId_1_assessmentId_1_attemptDate_-1'),
+        IndexModel([('userId', ASCENDING), ('courseId', ASCENDING), ('attemptDate', DESCENDING)],
+                   name='userId_1_courseId_1_attemptDate_-1'),
+        # Streaming one assessment's results in _id order (re-grade jobs)
+        IndexModel([('assessmentId', ASCENDING), ('_id', ASCENDING)], name='assessmentId_1__id_1'),
+        # Client-supplied keys of batched submissions; a retried attempt is stored once per user
+        IndexModel([('userId', ASCENDING), ('idempotencyKey', ASCENDING)], name='userId_1_idempotencyKey_1',
+                   unique=True, partialFilterExpression={'idempotencyKey': {'$exists': True}}),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'userId': 'user-id', 'assessmentId': 'assessment-id'}, 'sort': [('score', DESCENDING)]},
+        {'filter': {'userId': 'user-id', 'assessmentId': 'assessment-id'}, 'sort': [('attemptDate', DESCENDING)]},
+        {'filter': {'userId': 'user-id', 'courseId': 'course-id'}, 'sort': [('attemptDate', DESCENDING)]},
+        {'filter': {'userId': 'user-id', 'idempotencyKey': {'$in': ['key-1', 'key-2']}}},
+        {'filter': {'assessmentId': 'assessment-id'}, 'sort': [('_id', ASCENDING)]},
+    ]
+
+    def __init__(self, userId, assessmentId, courseId, answers, score, passed, timeSpent=None, idempotencyKey=None):
         self.userId = userId
         self.assessmentId = assessmentId
         self.courseId = courseId
@@ -12,8 +39,9 @@ class TestResult:
         self.passed = passed  # Boolean
         self.timeSpent = timeSpent  # Time spent in minutes
         self.attemptDate = datetime.utcnow()
+        self.idempotencyKey = idempotencyKey
 
-    def save(self):
+    def to_document(self):
         result_data = {
             'userId': self.userId,
             'assessmentId': self.assessmentId,
@@ -24,9 +52,43 @@ class TestResult:
             'timeSpent': self.timeSpent,
             'attemptDate': self.attemptDate
         }
-        result = mongo.db.test_results.insert_one(result_data)
+        # Only set when given, so the partial unique index ignores other attempts
+        if self.idempotencyKey is not None:
+            result_data['idempotencyKey'] = self.idempotencyKey
+        return result_data
+
+    def save(self):
+        result = mongo.db.test_results.insert_one(self.to_document())
         return str(result.inserted_id)
 
+    @staticmethod
+    def insert_many(documents):
+        """
+        Insert result documents in one unordered batch. Returns the positions
+        that were rejected as duplicates of an existing idempotency key; every
+        other document has its _id set.
+        """
+        if not documents:
+            return set()
+        try:
+            mongo.db.test_results.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != DUPLICATE_KEY for error in errors):
+                raise
+            return {error['index'] for error in errors}
+        return set()
+
+    @staticmethod
+    def find_by_idempotency_keys(user_id, keys):
+        """Stored attempts of a user by idempotency key: {key: result}"""
+        if not keys:
+            return {}
+        return {result['idempotencyKey']: result for result in mongo.db.test_results.find({
+            'userId': user_id,
+            'idempotencyKey': {'$in': list(keys)}
+        })}
+
     @staticmethod
     def find_by_id(result_id):
         try:
@@ -60,47 +122,36 @@ class TestResult:
 
     @staticmethod
     def check_all_assessments_passed(user_id, course_id):
-        """Check if user has passed all assessments for a course"""
-        from modles.assessment import Assessment
-        
-        # Get all assessments for the course
-        assessments = Assessment.find_by_course(course_id)
-        
-        if not assessments:
-            return True  # No assessments required
-        
-        # Check if user has passed each assessment
-        for assessment in assessments:
-            assessment_id = str(assessment['_id'])
-            best_result = TestResult.get_best_score(user_id, assessment_id)
-            
-            if not best_result or not best_result.get('passed', False):
-                return False
-        
-        return True
+        """Check if user has passed all assessments for a course, from the course progress rollup"""
+        assessment_ids = {str(assessment['_id'])
+                          for assessment in mongo.db.assessments.find({'courseId': course_id}, {'_id': 1})}
+
+        # No assessments means nothing is required
+        return assessment_ids <= CourseProgress.passed_ids(user_id, course_id)
 
     @staticmethod
     def get_course_assessment_summary(user_id, course_id):
-        """Get summary of all assessment results for a course"""
-        from modles.assessment import Assessment
-        
-        assessments = Assessment.find_by_course(course_id)
+        """
+        Get summary of all assessment results for a course: the course's
+        assessments joined to the user's materialized progress on each.
+        """
+        assessments = mongo.db.assessments.find(
+            {'courseId': course_id}, {'title': 1, 'type': 1, 'passingScore': 1}).sort('_id', 1)
+        progress = AssessmentProgress.find_by_user_and_course(user_id, course_id)
+
         summary = []
-        
         for assessment in assessments:
-            assessment_id = str(assessment['_id'])
-            best_result = TestResult.get_best_score(user_id, assessment_id)
-            
+            stats = progress.get(str(assessment['_id']), {})
             summary.append({
-                'assessmentId': assessment_id,
+                'assessmentId': str(assessment['_id']),
                 'assessmentTitle': assessment.get('title'),
                 'type': assessment.get('type'),
                 'passingScore': assessment.get('passingScore'),
-                'bestScore': best_result.get('score') if best_result else None,
-                'passed': best_result.get('passed') if best_result else False,
-                'attempts': len(TestResult.find_by_user_and_assessment(user_id, assessment_id))
+                'bestScore': stats.get('bestScore'),
+                'passed': stats.get('passed', False),
+                'attempts': stats.get('attempts', 0)
             })
-        
+
         return summary
 
     @staticmethod
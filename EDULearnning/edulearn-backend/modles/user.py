@@ -1,12 +1,34 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
+from datetime import datetime, timedelta
+from pymongo import IndexModel, ASCENDING
 from extensions import mongo
+from utils.pagination import keyset_page, approximate_total, DEFAULT_PAGE_SIZE
+from utils.passwords import password_hasher
+from utils.search_keys import search_keys, search_filters, rank_results
 
 class User:
+    COLLECTION = 'users'
+    INDEXES = [
+        IndexModel([('email', ASCENDING)], name='email_1', unique=True),
+        IndexModel([('role', ASCENDING), ('_id', ASCENDING)], name='role_1__id_1'),
+        # Multikey index of normalized name words and email, see utils/search_keys.py
+        IndexModel([('searchKeys', ASCENDING)], name='searchKeys_1'),
+    ]
+    QUERY_SHAPES = [
+        {'filter': {'email': 'user@example.com'}},
+        {'filter': {'role': 'student'}, 'sort': [('_id', ASCENDING)]},
+        {'filter': {'searchKeys': {'$all': ['emma']}}},
+        {'filter': {'searchKeys': {'$elemMatch': {'$gte': 'em', '$lt': 'en'}}}},
+    ]
+    # Roles an account can have; the per-role stats counters are kept for these only
+    ROLES = ('student', 'teacher', 'admin')
+    # Fields returned by user search
+    SEARCH_PROJECTION = {'fullName': 1, 'email': 1, 'role': 1, 'avatar': 1}
+
     def __init__(self, fullName, email, password, role='student'):
         self.fullName = fullName
         self.email = email
-        self.password = generate_password_hash(password)
+        self.password = User.hash_password(password)
         self.role = role
         self.isVerified = False
         self.createdAt = None
@@ -26,7 +48,8 @@ class User:
             'isVerified': self.isVerified,
             'createdAt': self.createdAt,
             'updatedAt': self.updatedAt,
-            'lastLogin': self.lastLogin
+            'lastLogin': self.lastLogin,
+            'searchKeys': search_keys(self.fullName, self.email)
         }
         # Add teacher-specific fields if they exist
         if self.subject:
@@ -37,6 +60,7 @@ class User:
             user_data['experience'] = self.experience
 
         result = mongo.db.users.insert_one(user_data)
+        User.record_stats_change(None, User.stats_state(user_data))
         return str(result.inserted_id)
 
     @staticmethod
@@ -44,13 +68,138 @@ class User:
         return mongo.db.users.find_one({'email': email})
 
     @staticmethod
-    def find_by_id(user_id):
-        return mongo.db.users.find_one({'_id': ObjectId(user_id)})
+    def find_by_id(user_id, projection=None):
+        return mongo.db.users.find_one({'_id': ObjectId(user_id)}, projection)
+
+    @staticmethod
+    def hash_password(password):
+        # Runs on the bounded hashing pool; raises PasswordHasherBusy when saturated
+        return password_hasher.hash(password)
 
     @staticmethod
     def verify_password(stored_password, provided_password):
-        return check_password_hash(stored_password, provided_password)
+        return password_hasher.verify(stored_password, provided_password)
+
+    @staticmethod
+    def password_needs_rehash(stored_password):
+        return password_hasher.needs_rehash(stored_password)
+
+    @staticmethod
+    def find_page(filter_query=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """Get one keyset page of users (without password hashes)"""
+        return keyset_page(mongo.db.users, filter_query or {}, after=after, limit=limit,
+                           projection={'password': 0})
+
+    @staticmethod
+    def count(filter_query=None):
+        return mongo.db.users.count_documents(filter_query or {})
+
+    @staticmethod
+    def approximate_count(filter_query=None):
+        return approximate_total(mongo.db.users, filter_query or {})
+
+    @staticmethod
+    def search(search_query, exclude_id=None, limit=10):
+        """Users matching a search box entry, exact word matches first"""
+        filters = User.search_filters(search_query, exclude_id)
+        if filters is None:
+            return []
+        exact, prefix = (list(mongo.db.users.find(query, User.SEARCH_PROJECTION).limit(limit))
+                         for query in filters)
+        return rank_results(exact, prefix, limit)
+
+    @staticmethod
+    def search_filters(search_query, exclude_id=None):
+        """(exact, prefix) index-backed filters for a search, or None if it has no words"""
+        filters = search_filters(search_query)
+        if filters is None or exclude_id is None:
+            return filters
+        return tuple(dict(query, _id={'$ne': ObjectId(exclude_id)}) for query in filters)
+
+    @staticmethod
+    def with_search_keys(update_data, current):
+        """update_data plus recomputed search keys when the name or email changes"""
+        if 'fullName' not in update_data and 'email' not in update_data:
+            return update_data
+        return dict(update_data, searchKeys=search_keys(update_data.get('fullName', current.get('fullName')),
+                                                        update_data.get('email', current.get('email'))))
 
     @staticmethod
     def update_by_id(user_id, update_data):
-        mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update_data})
+        from utils.identity import identity_cache
+        # Fields derived data depends on: search keys and the stats counters
+        current = None
+        if update_data.keys() & {'fullName', 'email', 'role', 'isActive'}:
+            current = mongo.db.users.find_one({'_id': ObjectId(user_id)},
+                                              {'fullName': 1, 'email': 1, 'role': 1, 'isActive': 1})
+        update_data = User.with_search_keys(update_data, current or {})
+        result = mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update_data})
+        identity_cache.invalidate(user_id)
+        if current is not None and result.modified_count:
+            User.record_stats_change(User.stats_state(current), User.stats_state(dict(current, **update_data)))
+        return result
+
+    @staticmethod
+    def stats_pipeline():
+        """Total, active and per-role user counts in a single pass over the collection"""
+        return [{'$facet': {
+            'total': [{'$count': 'n'}],
+            'active': [{'$match': {'isActive': {'$ne': False}}}, {'$count': 'n'}],
+            'roles': [{'$group': {'_id': '$role', 'n': {'$sum': 1}}}]
+        }}]
+
+    @staticmethod
+    def compute_stats():
+        facets = next(mongo.db.users.aggregate(User.stats_pipeline()))
+        first = lambda rows: rows[0]['n'] if rows else 0
+        return {
+            'total': first(facets['total']),
+            'active': first(facets['active']),
+            'roles': {row['_id']: row['n'] for row in facets['roles'] if row['_id'] in User.ROLES}
+        }
+
+    @staticmethod
+    def get_stats(max_age_seconds):
+        """
+        The materialized counters document (stats/users), recounted when it is
+        missing or was last reconciled more than max_age_seconds ago.
+        """
+        stats = mongo.db.stats.find_one({'_id': 'users'})
+        if stats is None or stats['reconciledAt'] < datetime.utcnow() - timedelta(seconds=max_age_seconds):
+            stats = User.reconcile_stats()
+        return stats
+
+    @staticmethod
+    def reconcile_stats():
+        """Overwrite the counters with real counts, correcting any drift"""
+        now = datetime.utcnow()
+        stats = dict(User.compute_stats(), _id='users', reconciledAt=now, updatedAt=now)
+        mongo.db.stats.replace_one({'_id': 'users'}, stats, upsert=True)
+        return stats
+
+    @staticmethod
+    def stats_state(user):
+        """What a user contributes to the counters: (role, active)"""
+        return user.get('role'), user.get('isActive', True) is not False
+
+    @staticmethod
+    def record_stats_change(before, after):
+        """
+        Apply one user's change from state before to after (None when the
+        user did not or no longer exists) to the counters. Without a counters
+        document nothing is written; the next read counts from scratch.
+        """
+        if before == after:
+            return
+        inc = {}
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            role, active = state
+            # Unknown roles (legacy data) only count towards total/active; never used as a field path
+            roles = (f'roles.{role}',) if role in User.ROLES else ()
+            for field in ('total',) + roles + (('active',) if active else ()):
+                inc[field] = inc.get(field, 0) + sign
+        inc = {field: amount for field, amount in inc.items() if amount}
+        if inc:
+            mongo.db.stats.update_one({'_id': 'users'}, {'$inc': inc, '$set': {'updatedAt': datetime.utcnow()}})
@@ -1,30 +1,27 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, Response, current_app
 from modles.user import User
+from modles.message import Conversation
+from middleware.auth_middleware import admin_required
+from utils.identity import identity_cache
+from utils.passwords import password_hasher
+from utils.metrics import collect_metrics, CONTENT_TYPE
+from utils.pagination import parse_limit, InvalidCursorError
 from bson import ObjectId
-from functools import wraps
 
 admin = Blueprint('admin', __name__)
 
-def admin_required(fn):
-    """Decorator to check if user is admin"""
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.find_by_id(user_id)
-        if not user or user.get('role') != 'admin':
-            return jsonify({'message': 'Admin access required'}), 403
-        return fn(*args, **kwargs)
-    return wrapper
-
 @admin.route('/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    """Get all users with pagination and filtering"""
+    """
+    Get users with keyset pagination and filtering.
+
+    Pass pagination.nextCursor back as `after` for the next page; add
+    total=approx for an approximate total without a full count.
+    """
     try:
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 10))
+        after = request.args.get('after')
+        limit = parse_limit(request.args.get('limit'), default=10)
         role_filter = request.args.get('role')
         search = request.args.get('search')
 
@@ -33,14 +30,18 @@ def get_all_users():
         if role_filter:
             query['role'] = role_filter
         if search:
-            query['$or'] = [
-                {'fullName': {'$regex': search, '$options': 'i'}},
-                {'email': {'$regex': search, '$options': 'i'}}
-            ]
+            # Prefix match on the indexed search keys (name words, email)
+            filters = User.search_filters(search)
+            if filters is None:
+                query['searchKeys'] = {'$in': []}
+            else:
+                query.update(filters[1])
 
         # Get users with pagination
-        users = User.find_all(query, skip=(page-1)*limit, limit=limit)
-        total = User.count(query)
+        try:
+            users, next_cursor = User.find_page(query, after=after, limit=limit)
+        except InvalidCursorError as e:
+            return jsonify({'message': str(e)}), 400
 
         # Format response
         user_list = []
@@ -55,14 +56,17 @@ def get_all_users():
                 'isActive': user.get('isActive', True)
             })
 
+        pagination = {
+            'limit': limit,
+            'nextCursor': next_cursor,
+            'hasMore': next_cursor is not None
+        }
+        if request.args.get('total') == 'approx':
+            pagination['total'], pagination['totalExact'] = User.approximate_count(query)
+
         return jsonify({
             'users': user_list,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total': total,
-                'pages': (total + limit - 1) // limit
-            }
+            'pagination': pagination
         }), 200
 
     except Exception as e:
@@ -106,6 +110,12 @@ def update_user(user_id):
         if not update_data:
             return jsonify({'message': 'No valid fields to update'}), 400
 
+        if 'role' in update_data and update_data['role'] not in User.ROLES:
+            return jsonify({'message': f"role must be one of: {', '.join(User.ROLES)}"}), 400
+
+        if 'isActive' in update_data and not isinstance(update_data['isActive'], bool):
+            return jsonify({'message': 'isActive must be true or false'}), 400
+
         # Check if email is being changed and if it's already taken
         if 'email' in update_data:
             existing_user = User.find_by_email(update_data['email'])
@@ -116,6 +126,8 @@ def update_user(user_id):
         if result.modified_count == 0:
             return jsonify({'message': 'User not found or no changes made'}), 404
 
+        Conversation.refresh_participant_profile(user_id, update_data)
+
         return jsonify({'message': 'User updated successfully'}), 200
 
     except Exception as e:
@@ -136,23 +148,45 @@ def delete_user(user_id):
     except Exception as e:
         return jsonify({'message': f'Error deleting user: {str(e)}'}), 500
 
+@admin.route('/identity-cache', methods=['GET'])
+@admin_required
+def get_identity_cache_stats():
+    """Get hit/miss counters of this worker's identity cache"""
+    return jsonify(identity_cache.stats()), 200
+
+@admin.route('/password-hashing', methods=['GET'])
+@admin_required
+def get_password_hashing_stats():
+    """Get queue/run time metrics of this worker's password hashing pool"""
+    return jsonify(password_hasher.stats()), 200
+
+@admin.route('/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    """Per-endpoint latency and Mongo command metrics in Prometheus text format"""
+    return Response(collect_metrics(current_app), content_type=CONTENT_TYPE)
+
 @admin.route('/stats', methods=['GET'])
 @admin_required
 def get_admin_stats():
-    """Get admin dashboard statistics"""
+    """
+    Get admin dashboard statistics from the incrementally maintained
+    counters document; refresh=true recounts it first.
+    """
     try:
-        total_users = User.count({})
-        active_users = User.count({'isActive': True})
-        students = User.count({'role': 'student'})
-        teachers = User.count({'role': 'teacher'})
-        admins = User.count({'role': 'admin'})
+        if request.args.get('refresh') == 'true':
+            stats = User.reconcile_stats()
+        else:
+            stats = User.get_stats(current_app.config['USER_STATS_RECONCILE_SECONDS'])
+        roles = stats.get('roles', {})
 
         return jsonify({
-            'totalUsers': total_users,
-            'activeUsers': active_users,
-            'students': students,
-            'teachers': teachers,
-            'admins': admins
+            'totalUsers': stats['total'],
+            'activeUsers': stats['active'],
+            'students': roles.get('student', 0),
+            'teachers': roles.get('teacher', 0),
+            'admins': roles.get('admin', 0),
+            'reconciledAt': stats['reconciledAt'].isoformat()
         }), 200
 
     except Exception as e:
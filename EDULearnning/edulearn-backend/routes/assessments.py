@@ -3,6 +3,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from modles.assessment import Assessment
 from modles.course import Course
 from utils.serializers import serialize_list, to_str_id
+from utils.regrade import enqueue_regrade, format_job
+from modles.regrade_job import RegradeJob
 from bson import ObjectId
 
 assessments = Blueprint('assessments', __name__)
@@ -122,13 +124,43 @@ def update_assessment(assessment_id):
         success = Assessment.update_by_id(assessment_id, update_data)
         
         if success:
-            return jsonify({'message': 'Assessment updated successfully'}), 200
+            response = {'message': 'Assessment updated successfully'}
+            # Stored scores depend on these; re-score them in the background
+            grading_fields = [field for field in ('questions', 'passingScore')
+                              if field in update_data and update_data[field] != assessment.get(field)]
+            if grading_fields:
+                response['regradeJobId'] = enqueue_regrade(assessment_id, reason=','.join(grading_fields))
+            return jsonify(response), 200
         else:
             return jsonify({'message': 'No changes made'}), 200
             
     except Exception as e:
         return jsonify({'message': f'Error updating assessment: {str(e)}'}), 500
 
+@assessments.route('/<assessment_id>/regrade', methods=['GET'])
+@jwt_required()
+def get_regrade_status(assessment_id):
+    """Get progress of the latest re-grade job of an assessment (instructor only)"""
+    try:
+        user_id = get_jwt_identity()
+
+        assessment = Assessment.find_by_id(assessment_id)
+        if not assessment:
+            return jsonify({'message': 'Assessment not found'}), 404
+
+        course = Course.find_by_id(assessment['courseId'])
+        if not course or course.get('instructor') != user_id:
+            return jsonify({'message': 'Only course instructor can view re-grade jobs'}), 403
+
+        job = RegradeJob.latest_for(assessment_id)
+        if not job:
+            return jsonify({'message': 'No re-grade job for this assessment'}), 404
+
+        return jsonify(format_job(job)), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Error fetching re-grade status: {str(e)}'}), 500
+
 @assessments.route('/<assessment_id>', methods=['DELETE'])
 @jwt_required()
 def delete_assessment(assessment_id):
@@ -76,7 +76,11 @@ def login():
     user = User.find_by_email(email)
     if user and User.verify_password(user['password'], password):
         from datetime import datetime
-        User.update_by_id(str(user['_id']), {'lastLogin': datetime.utcnow()})
+        update_data = {'lastLogin': datetime.utcnow()}
+        # Transparently upgrade hashes made with outdated algorithm/cost settings
+        if User.password_needs_rehash(user['password']):
+            update_data['password'] = User.hash_password(password)
+        User.update_by_id(str(user['_id']), update_data)
         access_token = create_access_token(identity=str(user['_id']))
         return jsonify({'token': access_token, 'user': {'_id': str(user['_id']), 'fullName': user['fullName'], 'email': user['email'], 'role': user['role']}}), 200
 
@@ -1,14 +1,34 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from modles.certificate import Certificate
 from modles.course import Course
 from modles.user import User
 from utils.serializers import serialize_list, to_str_id
-import io
+from utils.pdf_cache import RenderedFileCache
+from utils.zipstream import stream_zip
+from utils.identity import resolve_identity
+from utils.certificate_pdf import generate_certificate_pdf, render_certificate_pdf_bytes, render_merged_certificate_pdf
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import threading
+import os
+import tempfile
 from datetime import datetime
 
 certificates = Blueprint('certificates', __name__)
 
+# Bump whenever utils.certificate_pdf changes its output; cached PDFs and
+# ETags of the previous layout are then ignored automatically.
+CERTIFICATE_TEMPLATE_VERSION = 1
+
+# Certificate fields that end up in the rendered PDF
+PDF_FIELDS = ('certificateId', 'verificationCode', 'userName', 'courseTitle', 'instructorName', 'issueDate')
+
+# Process pool for bulk exports, created on first use in each worker
+_export_pool = None
+_export_pool_size = 0
+_export_pool_lock = threading.Lock()
+
 @certificates.route('/generate', methods=['POST'])
 @jwt_required()
 def generate_certificate():
@@ -51,6 +71,7 @@ def generate_certificate():
         
         # Get the generated certificate
         certificate = Certificate.find_by_id(cert_id)
+        current_app.extensions['certificate_verifier'].add(certificate)
         
         return jsonify({
             '_id': cert_id,
@@ -61,6 +82,56 @@ def generate_certificate():
     except Exception as e:
         return jsonify({'message': f'Error generating certificate: {str(e)}'}), 500
 
+@certificates.route('/course/<course_id>/issue', methods=['POST'])
+@jwt_required()
+def issue_course_certificates(course_id):
+    """
+    Issue certificates to every eligible student of a course at once (admin
+    or course instructor); their PDFs are pre-rendered in the background.
+    """
+    try:
+        user_id = get_jwt_identity()
+        
+        try:
+            course = Course.find_by_id(course_id)
+        except Exception:
+            course = None
+        if not course:
+            return jsonify({'message': 'Course not found'}), 404
+        
+        identity = resolve_identity(user_id)
+        is_admin = bool(identity and identity['role'] == 'admin' and identity['isActive'])
+        if not is_admin and course.get('instructor') != user_id:
+            return jsonify({'message': 'Admin or course instructor access required'}), 403
+        
+        instructor = User.find_by_id(course.get('instructor'))
+        instructor_name = instructor.get('fullName', 'Instructor') if instructor else 'Instructor'
+        
+        issued, skipped = Certificate.issue_for_course(
+            course_id=course_id,
+            course_title=course.get('title', 'Course'),
+            instructor_name=instructor_name,
+            batch_size=current_app.config['CERTIFICATE_ISSUE_BATCH_SIZE']
+        )
+        verifier = current_app.extensions['certificate_verifier']
+        for certificate in issued:
+            verifier.add(certificate)
+        prerendering = prerender_certificate_pdfs(issued)
+        
+        return jsonify({
+            'courseId': course_id,
+            'issued': len(issued),
+            'skipped': skipped,
+            'certificates': [{'_id': str(certificate['_id']),
+                              'userId': certificate['userId'],
+                              'certificateId': certificate['certificateId']} for certificate in issued],
+            'prerendering': prerendering,
+            'message': f'{len(issued)} certificate(s) issued'
+        }), 201 if issued else 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Error issuing certificates: {str(e)}'}), 500
+
 @certificates.route('/user/<user_id>', methods=['GET'])
 @jwt_required()
 def get_user_certificates(user_id):
@@ -103,15 +174,20 @@ def verify_certificate():
         if not certificate_id and not verification_code:
             return jsonify({'message': 'Certificate ID or verification code is required'}), 400
         
-        valid, result = Certificate.verify_certificate(
-            certificate_id=certificate_id,
-            verification_code=verification_code
-        )
+        if not isinstance(certificate_id or verification_code, str):
+            return jsonify({'message': 'Certificate ID and verification code must be strings'}), 400
+        
+        # Bloom filter and recent-result cache in front of Mongo; values missing from the filter are rejected without a query
+        verifier = current_app.extensions['certificate_verifier']
+        if certificate_id:
+            result = verifier.verify('certificateId', certificate_id)
+        else:
+            result = verifier.verify('verificationCode', verification_code)
         
-        if valid:
+        if result:
             return jsonify(result), 200
         else:
-            return jsonify({'valid': False, 'message': result}), 404
+            return jsonify({'valid': False, 'message': 'Certificate not found or invalid'}), 404
             
     except Exception as e:
         return jsonify({'message': f'Error verifying certificate: {str(e)}'}), 500
@@ -149,130 +225,207 @@ def download_certificate_pdf(cert_id):
         if certificate.get('userId') != user_id:
             return jsonify({'message': 'Unauthorized'}), 403
         
-        # Generate PDF
-        pdf_buffer = generate_certificate_pdf(certificate)
+        # Certificates never change, so the cache key doubles as a strong ETag
+        cache = get_certificate_pdf_cache()
+        key = certificate_pdf_key(cache, certificate)
+        if key in request.if_none_match:
+            response = current_app.response_class(status=304)
+            response.set_etag(key)
+            return response
+        
+        pdf_path = cache.get_or_render(key, lambda: generate_certificate_pdf(certificate).getvalue())
         
         # Return PDF file
-        return send_file(
-            pdf_buffer,
+        response = send_file(
+            pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f"certificate_{certificate.get('certificateId')}.pdf"
+            download_name=f"certificate_{certificate.get('certificateId')}.pdf",
+            etag=key,
+            conditional=False
         )
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
         
     except Exception as e:
         return jsonify({'message': f'Error downloading certificate: {str(e)}'}), 500
 
-def generate_certificate_pdf(certificate):
-    """Generate PDF certificate using reportlab"""
+def get_certificate_pdf_cache():
+    return RenderedFileCache(current_app.config['CERTIFICATE_PDF_CACHE_DIR'], CERTIFICATE_TEMPLATE_VERSION)
+
+def certificate_pdf_key(cache, certificate):
+    return cache.key_for({field: certificate.get(field) for field in PDF_FIELDS})
+
+@certificates.route('/export', methods=['GET'])
+@jwt_required()
+def export_certificates():
+    """
+    Export certificates as a streamed ZIP of PDFs rendered in parallel, or one
+    merged PDF with format=pdf (rendered serially). Filters: courseId, userId, from/to (ISO dates, on issueDate).
+    Admins can export anything; instructors only their own course.
+    """
     try:
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib.units import inch
-        from reportlab.pdfgen import canvas
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.platypus import Paragraph
-        
-        # Create PDF buffer
-        buffer = io.BytesIO()
-        
-        # Create PDF with landscape orientation
-        c = canvas.Canvas(buffer, pagesize=landscape(letter))
-        width, height = landscape(letter)
-        
-        # Draw border
-        c.setStrokeColor(colors.HexColor('#4a6bdf'))
-        c.setLineWidth(3)
-        c.rect(0.5*inch, 0.5*inch, width-1*inch, height-1*inch)
-        
-        # Draw inner border
-        c.setLineWidth(1)
-        c.rect(0.6*inch, 0.6*inch, width-1.2*inch, height-1.2*inch)
-        
-        # Title
-        c.setFont("Helvetica-Bold", 36)
-        c.setFillColor(colors.HexColor('#4a6bdf'))
-        c.drawCentredString(width/2, height-1.5*inch, "CERTIFICATE OF COMPLETION")
-        
-        # Subtitle
-        c.setFont("Helvetica", 14)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width/2, height-2*inch, "This is to certify that")
-        
-        # Student name
-        c.setFont("Helvetica-Bold", 28)
-        c.setFillColor(colors.HexColor('#333333'))
-        c.drawCentredString(width/2, height-2.7*inch, certificate.get('userName', 'Student'))
-        
-        # Course completion text
-        c.setFont("Helvetica", 14)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width/2, height-3.3*inch, "has successfully completed the course")
-        
-        # Course title
-        c.setFont("Helvetica-Bold", 20)
-        c.setFillColor(colors.HexColor('#4a6bdf'))
-        c.drawCentredString(width/2, height-3.9*inch, certificate.get('courseTitle', 'Course'))
-        
-        # Date
-        issue_date = certificate.get('issueDate')
-        if isinstance(issue_date, datetime):
-            date_str = issue_date.strftime('%B %d, %Y')
-        else:
-            date_str = datetime.utcnow().strftime('%B %d, %Y')
-        
-        c.setFont("Helvetica", 12)
-        c.setFillColor(colors.black)
-        c.drawCentredString(width/2, height-4.5*inch, f"Issued on {date_str}")
-        
-        # Instructor signature line
-        c.setFont("Helvetica", 11)
-        c.line(1.5*inch, 1.5*inch, 3.5*inch, 1.5*inch)
-        c.drawCentredString(2.5*inch, 1.2*inch, certificate.get('instructorName', 'Instructor'))
-        c.drawCentredString(2.5*inch, 1*inch, "Instructor")
-        
-        # Certificate ID
-        c.drawCentredString(width-2.5*inch, 1.2*inch, f"Certificate ID: {certificate.get('certificateId', 'N/A')}")
-        c.drawCentredString(width-2.5*inch, 1*inch, f"Verification: {certificate.get('verificationCode', 'N/A')}")
-        
-        # Seal/Logo placeholder
-        c.setFillColor(colors.HexColor('#4a6bdf'))
-        c.circle(width-2.5*inch, height-1.5*inch, 0.5*inch, fill=1)
-        c.setFillColor(colors.white)
-        c.setFont("Helvetica-Bold", 10)
-        c.drawCentredString(width-2.5*inch, height-1.5*inch, "EDULearn")
-        
-        # Save PDF
-        c.save()
-        
-        # Reset buffer position
-        buffer.seek(0)
-        return buffer
-        
-    except ImportError:
-        # If reportlab is not installed, return a simple text-based PDF
-        return generate_simple_pdf(certificate)
+        user_id = get_jwt_identity()
+        course_id = request.args.get('courseId')
+        filter_user_id = request.args.get('userId')
+        output_format = request.args.get('format', 'zip')
+        
+        if output_format not in ('zip', 'pdf'):
+            return jsonify({'message': 'format must be "zip" or "pdf"'}), 400
+        
+        identity = resolve_identity(user_id)
+        is_admin = bool(identity and identity['role'] == 'admin' and identity['isActive'])
+        if not is_admin:
+            try:
+                course = Course.find_by_id(course_id) if course_id else None
+            except Exception:
+                course = None
+            if not course or course.get('instructor') != user_id:
+                return jsonify({'message': 'Admin or course instructor access required'}), 403
+        
+        query = {}
+        if course_id:
+            query['courseId'] = course_id
+        if filter_user_id:
+            query['userId'] = filter_user_id
+        try:
+            date_range = {}
+            if request.args.get('from'):
+                date_range['$gte'] = datetime.fromisoformat(request.args['from'])
+            if request.args.get('to'):
+                date_range['$lt'] = datetime.fromisoformat(request.args['to'])
+        except ValueError:
+            return jsonify({'message': 'from/to must be ISO dates'}), 400
+        if date_range:
+            query['issueDate'] = date_range
+        
+        max_certificates = current_app.config['CERTIFICATE_EXPORT_MAX']
+        certificates_list = Certificate.find_for_export(query, PDF_FIELDS, limit=max_certificates + 1)
+        if not certificates_list:
+            return jsonify({'message': 'No certificates match the filter'}), 404
+        if len(certificates_list) > max_certificates:
+            return jsonify({'message': f'More than {max_certificates} certificates match; narrow the filter'}), 400
+        
+        pool = get_export_pool()
+        
+        if output_format == 'pdf':
+            # One canvas can only be drawn by one process, so the merged PDF is
+            # rendered serially by a single pool worker; use the ZIP for speed
+            fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+            os.close(fd)
+            try:
+                pool.submit(render_merged_certificate_pdf, certificates_list, pdf_path).result()
+            except Exception:
+                os.remove(pdf_path)
+                raise
+            response = send_file(pdf_path, mimetype='application/pdf', as_attachment=True,
+                                 download_name='certificates.pdf')
+            response.call_on_close(lambda: os.remove(pdf_path))
+            return response
+        
+        cache = get_certificate_pdf_cache()
+        pdfs = iter_certificate_pdfs(certificates_list, cache, pool)
+        
+        def generate():
+            try:
+                yield from stream_zip(
+                    (f"certificate_{certificate.get('certificateId')}.pdf", data) for certificate, data in pdfs
+                )
+            finally:
+                # Runs when the client goes away too; stops the renders still queued
+                pdfs.close()
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=certificates.zip'}
+        )
+        
+    except Exception as e:
+        return jsonify({'message': f'Error exporting certificates: {str(e)}'}), 500
+
+def get_export_pool():
+    """Process pool used to render certificates in parallel"""
+    global _export_pool, _export_pool_size
+    with _export_pool_lock:
+        if _export_pool is None:
+            _export_pool_size = current_app.config.get('CERTIFICATE_EXPORT_WORKERS') or os.cpu_count() or 1
+            # spawn, not fork: the parent holds Mongo client threads
+            _export_pool = ProcessPoolExecutor(max_workers=_export_pool_size,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _export_pool
 
-def generate_simple_pdf(certificate):
-    """Generate a simple PDF if reportlab is not available"""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter, landscape
+def iter_certificate_pdfs(certificates_list, cache, pool):
+    """
+    Yield (certificate, pdf bytes) as each PDF becomes available.
+
+    Cached PDFs are read from disk; the rest are rendered in the pool with a
+    bounded number in flight, so memory stays flat however many are exported.
+    Closing the generator early (a client disconnecting mid-download) cancels
+    the renders that have not started.
+    """
+    to_render = []
+    cached = []
+    for certificate in certificates_list:
+        key = certificate_pdf_key(cache, certificate)
+        path = cache.path_for(key)
+        if os.path.isfile(path):
+            cached.append((certificate, path))
+        else:
+            to_render.append((certificate, key))
+    
+    max_in_flight = _export_pool_size * 4
+    pending = {}
+    render_queue = iter(to_render)
     
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=landscape(letter))
-    width, height = landscape(letter)
+    def submit_more():
+        while len(pending) < max_in_flight:
+            item = next(render_queue, None)
+            if item is None:
+                return
+            pending[pool.submit(render_certificate_pdf_bytes, item[0])] = item
     
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width/2, height-100, "CERTIFICATE OF COMPLETION")
+    try:
+        # Start rendering before reading cached files so both overlap
+        submit_more()
+        for certificate, path in cached:
+            with open(path, 'rb') as f:
+                yield certificate, f.read()
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                certificate, key = pending.pop(future)
+                data = future.result()
+                cache.get_or_render(key, lambda: data)
+                yield certificate, data
+            submit_more()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def prerender_certificate_pdfs(certificates_list):
+    """
+    Render certificates into the PDF cache on a background thread, through
+    the export pool. Returns False when there is nothing to do or it is off.
+    """
+    if not certificates_list or not current_app.config.get('CERTIFICATE_PRERENDER', True):
+        return False
+    certificates_list = [{field: certificate.get(field) for field in PDF_FIELDS} for certificate in certificates_list]
+    cache = get_certificate_pdf_cache()
+    pool = get_export_pool()
+    logger = current_app.logger
     
-    c.setFont("Helvetica", 16)
-    c.drawCentredString(width/2, height-200, certificate.get('userName', 'Student'))
-    c.drawCentredString(width/2, height-250, certificate.get('courseTitle', 'Course'))
-    c.drawCentredString(width/2, height-300, f"Certificate ID: {certificate.get('certificateId', 'N/A')}")
+    def run():
+        try:
+            for _ in iter_certificate_pdfs(certificates_list, cache, pool):
+                pass
+        except Exception as e:
+            # Downloads render on demand anyway
+            logger.warning('Certificate pre-rendering failed: %s', e)
     
-    c.save()
-    buffer.seek(0)
-    return buffer
+    threading.Thread(target=run, name='certificate-prerender', daemon=True).start()
+    return True
 
 @certificates.route('/all', methods=['GET'])
 @jwt_required()
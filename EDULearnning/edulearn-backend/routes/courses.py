@@ -1,15 +1,46 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from modles.course import Course
 from utils.serializers import serialize_list, to_str_id
+from utils.pagination import parse_limit, InvalidCursorError
+from utils.response_cache import VersionedResponseCache
 from bson import ObjectId
 
 courses = Blueprint('courses', __name__)
 
+# Serialized catalog/detail responses, dropped whenever Course.cache_version changes.
+# Other workers notice a bump within CATALOG_VERSION_TTL seconds.
+CATALOG_VERSION_TTL = 1.0
+catalog_cache = VersionedResponseCache(Course.cache_version, version_ttl=CATALOG_VERSION_TTL)
+
 @courses.route('/', methods=['GET'])
 def list_courses():
-    docs = Course.find_all()
-    return jsonify(serialize_list(docs)), 200
+    """
+    List one page of the catalog.
+
+    Query args: after (cursor from X-Next-Cursor), limit, include=modules,
+    total=approx (adds X-Total-Count).
+    """
+    after = request.args.get('after')
+    limit = parse_limit(request.args.get('limit'))
+    include_modules = request.args.get('include') == 'modules'
+    with_total = request.args.get('total') == 'approx'
+
+    def compute():
+        docs, next_cursor = Course.find_page(after=after, limit=limit, include_modules=include_modules)
+        headers = {}
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        if with_total:
+            total, _exact = Course.approximate_count()
+            headers['X-Total-Count'] = str(total)
+        return to_json_bytes(serialize_list(docs)), headers
+
+    try:
+        entry = catalog_cache.get_or_compute(('list', after, limit, include_modules, with_total), compute)
+    except InvalidCursorError as e:
+        return jsonify({'message': str(e)}), 400
+    return cached_response(entry)
 
 @courses.route('/', methods=['POST'])
 @jwt_required()
@@ -26,6 +57,7 @@ def create_course():
 
     course = Course(title, description, category, instructor, price)
     course_id = course.save()
+    catalog_cache.expire_version()
     return jsonify({'_id': course_id, 'title': title, 'instructor': instructor}), 201
 
 @courses.route('/my', methods=['GET'])
@@ -37,13 +69,19 @@ def get_my_courses():
 
 @courses.route('/<course_id>', methods=['GET'])
 def get_course(course_id):
-    try:
-        doc = Course.find_by_id(course_id)
-    except Exception:
-        doc = None
-    if not doc:
+    def compute():
+        try:
+            doc = Course.find_by_id(course_id)
+        except Exception:
+            doc = None
+        if not doc:
+            return None
+        return to_json_bytes(to_str_id(doc)), {}
+
+    entry = catalog_cache.get_or_compute(('course', course_id), compute)
+    if entry is None:
         return jsonify({'message': 'Course not found'}), 404
-    return jsonify(to_str_id(doc)), 200
+    return cached_response(entry)
 
 @courses.route('/user', methods=['GET'])
 @jwt_required()
@@ -52,3 +90,13 @@ def get_user_courses():
     docs = Course.find_all()
     return jsonify(serialize_list(docs)), 200
 
+def to_json_bytes(data):
+    return current_app.json.dumps(data).encode('utf-8')
+
+def cached_response(entry):
+    """Build a response from a cache entry, answering If-None-Match with 304"""
+    body, headers, etag = entry
+    response = current_app.response_class(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
@@ -1,10 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
 from modles.message import Message, Conversation
 from modles.user import User
 from utils.serializers import serialize_doc
+from utils.pagination import parse_limit
+from utils.message_bus import message_bus, format_sse
+import queue
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Maximum users returned by /users/search
+SEARCH_LIMIT = 10
 
 messages = Blueprint('messages', __name__)
 
@@ -16,46 +25,14 @@ def get_conversations():
     try:
         current_user_id = get_jwt_identity()
         
-        # Get all conversations
-        conversations = Conversation.get_user_conversations(current_user_id)
+        # Conversations with unread counts and participant profiles in one query
+        conversations = Conversation.get_inbox(current_user_id)
         
         result = []
         for conv in conversations:
-            # Get the other participant
-            other_participant_id = Conversation.get_other_participant(
-                str(conv['_id']), 
-                current_user_id
-            )
-            
-            if not other_participant_id:
-                continue
-            
-            # Get other participant details
-            other_user = User.find_by_id(str(other_participant_id))
-            if not other_user:
-                continue
-            
-            # Get unread count
-            unread_count = Conversation.get_unread_count_by_conversation(
-                str(conv['_id']), 
-                current_user_id
-            )
-            
-            # Format last message time
-            last_message_time = conv.get('last_message_time')
-            time_ago = format_time_ago(last_message_time) if last_message_time else 'No messages'
-            
-            result.append({
-                'id': str(conv['_id']),
-                'name': other_user.get('fullName', 'Unknown User'),
-                'avatar': other_user.get('avatar', 'https://via.placeholder.com/40'),
-                'status': 'Online',  # Can be enhanced with real-time status
-                'unread': unread_count,
-                'lastMessageTime': time_ago,
-                'lastMessage': conv.get('last_message', 'No messages yet'),
-                'participantId': str(other_participant_id),
-                'participantRole': other_user.get('role', 'student')
-            })
+            formatted = format_conversation(conv, current_user_id)
+            if formatted:
+                result.append(formatted)
         
         return jsonify({
             'success': True,
@@ -72,9 +49,17 @@ def get_conversations():
 @messages.route('/conversation/<conversation_id>', methods=['GET'])
 @jwt_required()
 def get_conversation_messages(conversation_id):
-    """Get all messages in a conversation"""
+    """
+    Get messages in a conversation, most recent page first.
+
+    Query args: before=<message id|ISO time> to scroll back,
+    since=<message id|ISO time> to fetch only newer messages, limit.
+    """
     try:
         current_user_id = get_jwt_identity()
+        before = request.args.get('before')
+        since = request.args.get('since')
+        limit = parse_limit(request.args.get('limit'), default=50)
         
         # Verify user is part of the conversation
         conversation = Conversation.get_conversation_by_id(conversation_id)
@@ -92,42 +77,43 @@ def get_conversation_messages(conversation_id):
             }), 403
         
         # Get messages
-        messages_list = Message.get_conversation_messages(conversation_id)
+        try:
+            messages_list, has_more = Message.get_conversation_messages(
+                conversation_id, limit=limit, before=before, since=since
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         
-        # Mark messages as read
-        Message.mark_conversation_as_read(conversation_id, current_user_id)
+        # Mark messages as read (scrolling back only shows already-seen history)
+        if not before:
+            Message.mark_conversation_as_read(conversation_id, current_user_id)
+            if message_bus.has_subscribers(current_user_id):
+                message_bus.publish(current_user_id, 'unread', {
+                    'unreadCount': Message.get_unread_count(current_user_id)
+                })
         
         # Format messages
-        formatted_messages = []
-        for msg in messages_list:
-            sender_id = str(msg.get('sender_id'))
-            formatted_messages.append({
-                'id': str(msg['_id']),
-                'sender': 'user' if sender_id == current_user_id else 'recipient',
-                'senderId': sender_id,
-                'text': msg.get('text', ''),
-                'time': msg.get('timestamp').strftime('%I:%M %p') if msg.get('timestamp') else '',
-                'date': format_message_date(msg.get('timestamp')) if msg.get('timestamp') else 'Today',
-                'isRead': msg.get('is_read', False)
-            })
+        formatted_messages = [format_message(msg, current_user_id) for msg in messages_list]
         
         # Get other participant info
         other_participant_id = Conversation.get_other_participant(
             conversation_id, 
-            current_user_id
+            current_user_id,
+            conversation=conversation
         )
-        other_user = User.find_by_id(str(other_participant_id)) if other_participant_id else None
+        other_user = None
+        if other_participant_id:
+            other_user = (Conversation.get_participant_profile(conversation, other_participant_id)
+                          or User.find_by_id(str(other_participant_id)))
         
         return jsonify({
             'success': True,
             'messages': formatted_messages,
-            'participant': {
-                'id': str(other_participant_id) if other_participant_id else None,
-                'name': other_user.get('fullName', 'Unknown User') if other_user else 'Unknown User',
-                'avatar': other_user.get('avatar', 'https://via.placeholder.com/40') if other_user else 'https://via.placeholder.com/40',
-                'status': 'Online',
-                'role': other_user.get('role', 'student') if other_user else 'student'
-            }
+            'hasMore': has_more,
+            'participant': format_participant(other_participant_id, other_user)
         }), 200
         
     except Exception as e:
@@ -196,18 +182,14 @@ def send_message():
         # Get the created message
         message = mongo.db.messages.find_one({'_id': ObjectId(message_id)})
         
+        # With a change stream every worker publishes from the stream instead
+        if not current_app.config.get('MESSAGE_CHANGE_STREAM'):
+            publish_new_message(message)
+        
         return jsonify({
             'success': True,
             'message': 'Message sent successfully',
-            'data': {
-                'id': str(message['_id']),
-                'sender': 'user',
-                'senderId': current_user_id,
-                'text': message.get('text', ''),
-                'time': message.get('timestamp').strftime('%I:%M %p') if message.get('timestamp') else '',
-                'date': format_message_date(message.get('timestamp')) if message.get('timestamp') else 'Today',
-                'isRead': False
-            }
+            'data': format_message(message, current_user_id)
         }), 201
         
     except Exception as e:
@@ -251,12 +233,7 @@ def create_conversation():
             'success': True,
             'message': 'Conversation created successfully',
             'conversationId': conversation_id,
-            'participant': {
-                'id': recipient_id,
-                'name': recipient.get('fullName', 'Unknown User'),
-                'avatar': recipient.get('avatar', 'https://via.placeholder.com/40'),
-                'role': recipient.get('role', 'student')
-            }
+            'participant': format_recipient(recipient_id, recipient)
         }), 201
         
     except Exception as e:
@@ -286,6 +263,40 @@ def get_unread_count():
         }), 500
 
 
+@messages.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """
+    Server-Sent Events stream of new messages and unread count changes.
+
+    EventSource cannot set headers, so the token may also be passed as
+    ?jwt=<token>. Events: 'message' ({conversationId, message}) and
+    'unread' ({unreadCount}); the current unread count is sent on connect.
+    """
+    current_user_id = get_jwt_identity()
+    events = message_bus.subscribe(current_user_id)
+    initial_unread = Message.get_unread_count(current_user_id)
+
+    def generate():
+        try:
+            yield format_sse('unread', {'unreadCount': initial_unread})
+            while True:
+                try:
+                    event, data = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event, data)
+        finally:
+            message_bus.unsubscribe(current_user_id, events)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @messages.route('/users/search', methods=['GET'])
 @jwt_required()
 def search_users():
@@ -301,24 +312,9 @@ def search_users():
             }), 400
         
         # Search for users by name or email
-        from extensions import mongo
-        users = mongo.db.users.find({
-            '_id': {'$ne': ObjectId(current_user_id)},
-            '$or': [
-                {'fullName': {'$regex': search_query, '$options': 'i'}},
-                {'email': {'$regex': search_query, '$options': 'i'}}
-            ]
-        }).limit(10)
+        users = User.search(search_query, exclude_id=current_user_id, limit=SEARCH_LIMIT)
         
-        result = []
-        for user in users:
-            result.append({
-                'id': str(user['_id']),
-                'name': user.get('fullName', 'Unknown User'),
-                'email': user.get('email', ''),
-                'role': user.get('role', 'student'),
-                'avatar': user.get('avatar', 'https://via.placeholder.com/40')
-            })
+        result = [format_search_user(user) for user in users]
         
         return jsonify({
             'success': True,
@@ -332,7 +328,101 @@ def search_users():
         }), 500
 
 
-# Helper functions
+# Helper functions (also used by asgi_messages.py, so both apps answer with the same shapes)
+def format_conversation(conv, current_user_id):
+    """Inbox entry for a conversation from get_inbox, or None if the other participant is unknown"""
+    other_participant_id = Conversation.get_other_participant(
+        str(conv['_id']),
+        current_user_id,
+        conversation=conv
+    )
+    if not other_participant_id:
+        return None
+    
+    other_user = Conversation.get_participant_profile(conv, other_participant_id)
+    if not other_user:
+        return None
+    
+    last_message_time = conv.get('last_message_time')
+    time_ago = format_time_ago(last_message_time) if last_message_time else 'No messages'
+    
+    return {
+        'id': str(conv['_id']),
+        'name': other_user.get('fullName', 'Unknown User'),
+        'avatar': other_user.get('avatar', 'https://via.placeholder.com/40'),
+        'status': 'Online',  # Can be enhanced with real-time status
+        'unread': conv.get('unread_count', 0),
+        'lastMessageTime': time_ago,
+        'lastMessage': conv.get('last_message', 'No messages yet'),
+        'participantId': str(other_participant_id),
+        'participantRole': other_user.get('role', 'student')
+    }
+
+
+def format_participant(participant_id, user):
+    """The other participant as shown above a conversation"""
+    return {
+        'id': str(participant_id) if participant_id else None,
+        'name': user.get('fullName', 'Unknown User') if user else 'Unknown User',
+        'avatar': user.get('avatar', 'https://via.placeholder.com/40') if user else 'https://via.placeholder.com/40',
+        'status': 'Online',
+        'role': user.get('role', 'student') if user else 'student'
+    }
+
+
+def format_recipient(recipient_id, recipient):
+    """The recipient of a newly created conversation"""
+    return {
+        'id': recipient_id,
+        'name': recipient.get('fullName', 'Unknown User'),
+        'avatar': recipient.get('avatar', 'https://via.placeholder.com/40'),
+        'role': recipient.get('role', 'student')
+    }
+
+
+def format_search_user(user):
+    return {
+        'id': str(user['_id']),
+        'name': user.get('fullName', 'Unknown User'),
+        'email': user.get('email', ''),
+        'role': user.get('role', 'student'),
+        'avatar': user.get('avatar', 'https://via.placeholder.com/40')
+    }
+
+
+def format_message(msg, current_user_id):
+    """Format a message document as seen by current_user_id"""
+    sender_id = str(msg.get('sender_id'))
+    return {
+        'id': str(msg['_id']),
+        'sender': 'user' if sender_id == current_user_id else 'recipient',
+        'senderId': sender_id,
+        'text': msg.get('text', ''),
+        'time': msg.get('timestamp').strftime('%I:%M %p') if msg.get('timestamp') else '',
+        'date': format_message_date(msg.get('timestamp')) if msg.get('timestamp') else 'Today',
+        'isRead': msg.get('is_read', False)
+    }
+
+
+def format_message_event(message):
+    """Payload of the 'message' stream event, as seen by the recipient"""
+    return {
+        'conversationId': str(message['conversation_id']),
+        'message': format_message(message, str(message['recipient_id']))
+    }
+
+
+def publish_new_message(message):
+    """Push a new message and the recipient's unread count to their open streams"""
+    recipient_id = str(message['recipient_id'])
+    if not message_bus.has_subscribers(recipient_id):
+        return
+    message_bus.publish(recipient_id, 'message', format_message_event(message))
+    message_bus.publish(recipient_id, 'unread', {
+        'unreadCount': Message.get_unread_count(recipient_id)
+    })
+
+
 def format_time_ago(timestamp):
     """Format timestamp to relative time"""
     if not timestamp:
@@ -377,5 +467,5 @@ def format_message_date(timestamp):
         return timestamp.strftime('%b %d, %Y')
 
 
-# Import mongo for search_users function
+# Import mongo for direct message lookups
 from extensions import mongo
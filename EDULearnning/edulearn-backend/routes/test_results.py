@@ -1,12 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from modles.test_result import TestResult
 from modles.assessment import Assessment
+from modles.assessment_progress import AssessmentProgress
 from utils.serializers import serialize_list, to_str_id
+from utils.grading import AnswerKey, grade_submissions
+from bson import ObjectId
 from datetime import datetime
 
 test_results = Blueprint('test_results', __name__)
 
+# Attempts accepted by one /submit-batch request
+MAX_BATCH_ATTEMPTS = 100
+
+def maintain_progress(update, *args, **kwargs):
+    """
+    Apply a progress update after the attempt or grade itself was stored.
+    Failures are logged rather than returned: the write already succeeded,
+    and `flask progress rebuild` repairs the projection.
+    """
+    try:
+        update(*args, **kwargs)
+    except Exception as e:
+        current_app.logger.error('Progress update failed, run flask progress rebuild: %s', e)
+
 @test_results.route('/submit', methods=['POST'])
 @jwt_required()
 def submit_test():
@@ -32,11 +49,7 @@ def submit_test():
         
         # Calculate score for MCQ
         if assessment['type'] == 'mcq':
-            score, passed = calculate_mcq_score(
-                assessment['questions'],
-                user_answers,
-                assessment['passingScore']
-            )
+            score, passed = grade_submissions(assessment, [user_answers])[0]
         else:
             # For assignments, score will be set by instructor later
             score = 0
@@ -54,6 +67,7 @@ def submit_test():
         )
         
         result_id = test_result.save()
+        maintain_progress(AssessmentProgress.record_attempts, [test_result.to_document()])
         
         return jsonify({
             '_id': result_id,
@@ -66,34 +80,141 @@ def submit_test():
     except Exception as e:
         return jsonify({'message': f'Error submitting test: {str(e)}'}), 500
 
+@test_results.route('/submit-batch', methods=['POST'])
+@jwt_required()
+def submit_test_batch():
+    """
+    Submit attempts queued by an offline or flaky client in one request.
+
+    Body: {"attempts": [{"assessmentId", "answers", "timeSpent"?, "idempotencyKey"?}]}.
+    Assessments are loaded with one $in query, MCQ attempts are graded per
+    assessment in one batch and stored with one insert_many. An attempt whose
+    idempotencyKey is already stored is answered from the stored result.
+    Returns one entry per attempt, in order, with status created, duplicate
+    or error.
+    """
+    try:
+        data = request.get_json() or {}
+        user_id = get_jwt_identity()
+
+        attempts = data.get('attempts')
+        if not isinstance(attempts, list) or not attempts:
+            return jsonify({'message': 'attempts must be a non-empty list'}), 400
+        if len(attempts) > MAX_BATCH_ATTEMPTS:
+            return jsonify({'message': f'At most {MAX_BATCH_ATTEMPTS} attempts per batch'}), 400
+
+        results = [None] * len(attempts)
+        valid = []
+        for index, attempt in enumerate(attempts):
+            error = validate_attempt(attempt)
+            if error:
+                results[index] = {'status': 'error', 'message': error}
+            else:
+                valid.append(index)
+
+        keys = {attempts[index]['idempotencyKey'] for index in valid if 'idempotencyKey' in attempts[index]}
+        stored = TestResult.find_by_idempotency_keys(user_id, keys)
+        assessments = Assessment.find_by_ids({attempts[index]['assessmentId'] for index in valid})
+
+        # Attempts to grade, per assessment; repeats of a key within the batch follow the first one
+        to_grade = {}
+        first_with_key = {}
+        repeats = {}
+        for index in valid:
+            attempt = attempts[index]
+            key = attempt.get('idempotencyKey')
+            assessment = assessments.get(attempt['assessmentId'])
+            if key in stored:
+                results[index] = format_batch_result('duplicate', stored[key], assessment)
+            elif assessment is None:
+                results[index] = {'status': 'error', 'message': 'Assessment not found'}
+            elif key is not None and key in first_with_key:
+                repeats[index] = first_with_key[key]
+            elif assessment['type'] == 'mcq' and not all(isinstance(answer, dict) for answer in attempt['answers']):
+                results[index] = {'status': 'error', 'message': 'Each answer must be an object'}
+            else:
+                if key is not None:
+                    first_with_key[key] = index
+                to_grade.setdefault(attempt['assessmentId'], []).append(index)
+
+        pending = []
+        for assessment_id, indices in to_grade.items():
+            assessment = assessments[assessment_id]
+            if assessment['type'] == 'mcq':
+                graded = grade_submissions(assessment, [attempts[index]['answers'] for index in indices])
+            else:
+                # For assignments, score will be set by instructor later
+                graded = [(0, False)] * len(indices)
+            for index, (score, passed) in zip(indices, graded):
+                attempt = attempts[index]
+                pending.append((index, TestResult(
+                    userId=user_id,
+                    assessmentId=attempt['assessmentId'],
+                    courseId=assessment['courseId'],
+                    answers=attempt['answers'],
+                    score=score,
+                    passed=passed,
+                    timeSpent=attempt.get('timeSpent'),
+                    idempotencyKey=attempt.get('idempotencyKey')
+                ).to_document()))
+
+        rejected = TestResult.insert_many([document for _, document in pending])
+        if rejected:
+            # Stored by a concurrent retry between our lookup and insert
+            stored = TestResult.find_by_idempotency_keys(
+                user_id, {pending[position][1]['idempotencyKey'] for position in rejected})
+        for position, (index, document) in enumerate(pending):
+            assessment = assessments[document['assessmentId']]
+            if position in rejected:
+                results[index] = format_batch_result('duplicate', stored[document['idempotencyKey']], assessment)
+            else:
+                results[index] = format_batch_result('created', document, assessment)
+        maintain_progress(AssessmentProgress.record_attempts,
+                          [document for position, (_, document) in enumerate(pending) if position not in rejected])
+        for index, first in repeats.items():
+            results[index] = dict(results[first], status='duplicate')
+
+        for index, result in enumerate(results):
+            result['index'] = index
+            if isinstance(attempts[index], dict) and 'idempotencyKey' in attempts[index]:
+                result['idempotencyKey'] = attempts[index]['idempotencyKey']
+
+        counts = {status: sum(1 for result in results if result['status'] == status)
+                  for status in ('created', 'duplicate', 'error')}
+        return jsonify({'results': results, **counts}), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Error submitting tests: {str(e)}'}), 500
+
+def validate_attempt(attempt):
+    """Error message for a malformed batch attempt, or None"""
+    if not isinstance(attempt, dict):
+        return 'Attempt must be an object'
+    for field in ('assessmentId', 'answers'):
+        if field not in attempt:
+            return f'{field} is required'
+    if not isinstance(attempt['assessmentId'], str) or not ObjectId.is_valid(attempt['assessmentId']):
+        return 'Invalid assessmentId'
+    if not isinstance(attempt['answers'], list):
+        return 'answers must be a list'
+    key = attempt.get('idempotencyKey')
+    if 'idempotencyKey' in attempt and (not isinstance(key, str) or not key or len(key) > 128):
+        return 'idempotencyKey must be a non-empty string of at most 128 characters'
+    return None
+
+def format_batch_result(status, result, assessment):
+    return {
+        'status': status,
+        '_id': str(result['_id']),
+        'assessmentId': result['assessmentId'],
+        'score': result['score'],
+        'passed': result['passed'],
+        'passingScore': assessment['passingScore'] if assessment else None
+    }
+
 def calculate_mcq_score(questions, user_answers, passing_score):
-    """Calculate score for MCQ assessment"""
-    if not questions or not user_answers:
-        return 0, False
-    
-    total_questions = len(questions)
-    correct_answers = 0
-    
-    # Create a map of question IDs to correct answers
-    correct_answer_map = {}
-    for question in questions:
-        question_id = str(question.get('id') or question.get('_id', ''))
-        correct_answer_map[question_id] = question.get('correctAnswer')
-    
-    # Check user answers
-    for answer in user_answers:
-        question_id = str(answer.get('questionId', ''))
-        user_answer = answer.get('answer')
-        
-        if question_id in correct_answer_map:
-            if user_answer == correct_answer_map[question_id]:
-                correct_answers += 1
-    
-    # Calculate percentage score
-    score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-    passed = score >= passing_score
-    
-    return round(score, 2), passed
+    """Calculate score for MCQ assessment (uncached; submissions use the compiled key cache)"""
+    return AnswerKey(questions).grade([user_answers], passing_score)[0]
 
 @test_results.route('/user/<user_id>/course/<course_id>', methods=['GET'])
 @jwt_required()
@@ -251,6 +372,13 @@ def grade_assignment(result_id):
             {'_id': ObjectId(result_id)},
             {'$set': update_data}
         )
+
+        # A strictly higher grade folds in as a candidate best attempt; anything else is recomputed from the attempts
+        if score > result.get('score', 0) and (passed or not result.get('passed')):
+            maintain_progress(AssessmentProgress.record_attempts, [dict(result, score=score, passed=passed)],
+                              count_attempts=False)
+        else:
+            maintain_progress(AssessmentProgress.refresh, result['assessmentId'], [result['userId']])
         
         return jsonify({
             'message': 'Assignment graded successfully',
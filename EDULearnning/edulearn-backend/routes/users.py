@@ -1,8 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from modles.user import User
-from extensions import mongo
-from bson import ObjectId
+from modles.message import Conversation
 from utils.serializers import to_str_id
 
 users = Blueprint('users', __name__)
@@ -36,8 +35,9 @@ def update_user():
     if not updates:
         return jsonify({'message': 'No valid fields to update'}), 400
 
-    result = mongo.db.users.update_one({'_id': ObjectId(current_user_id)}, {'$set': updates})
+    result = User.update_by_id(current_user_id, updates)
     if result.matched_count:
+        Conversation.refresh_participant_profile(current_user_id, updates)
         updated = User.find_by_id(current_user_id)
         return jsonify(to_str_id(updated)), 200
 
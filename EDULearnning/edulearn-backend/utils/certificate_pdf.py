@@ -0,0 +1,142 @@
+"""
+Certificate PDF rendering. Kept free of Flask and app imports: these
+functions run in the spawned export pool processes, which import only this
+module (and reportlab) to unpickle the tasks.
+"""
+import io
+from datetime import datetime
+
+
+def generate_certificate_pdf(certificate):
+    """Generate PDF certificate using reportlab"""
+    try:
+        from reportlab.lib.pagesizes import letter, landscape
+        from reportlab.pdfgen import canvas
+        
+        # Create PDF buffer
+        buffer = io.BytesIO()
+        
+        # Create PDF with landscape orientation
+        c = canvas.Canvas(buffer, pagesize=landscape(letter))
+        draw_certificate_page(c, certificate)
+        
+        # Save PDF
+        c.save()
+        
+        # Reset buffer position
+        buffer.seek(0)
+        return buffer
+        
+    except ImportError:
+        # If reportlab is not installed, return a simple text-based PDF
+        return generate_simple_pdf(certificate)
+
+
+def draw_certificate_page(c, certificate):
+    """Draw one certificate on the current page of a landscape letter canvas"""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    
+    width, height = landscape(letter)
+    
+    # Draw border
+    c.setStrokeColor(colors.HexColor('#4a6bdf'))
+    c.setLineWidth(3)
+    c.rect(0.5*inch, 0.5*inch, width-1*inch, height-1*inch)
+    
+    # Draw inner border
+    c.setLineWidth(1)
+    c.rect(0.6*inch, 0.6*inch, width-1.2*inch, height-1.2*inch)
+    
+    # Title
+    c.setFont("Helvetica-Bold", 36)
+    c.setFillColor(colors.HexColor('#4a6bdf'))
+    c.drawCentredString(width/2, height-1.5*inch, "CERTIFICATE OF COMPLETION")
+    
+    # Subtitle
+    c.setFont("Helvetica", 14)
+    c.setFillColor(colors.black)
+    c.drawCentredString(width/2, height-2*inch, "This is to certify that")
+    
+    # Student name
+    c.setFont("Helvetica-Bold", 28)
+    c.setFillColor(colors.HexColor('#333333'))
+    c.drawCentredString(width/2, height-2.7*inch, certificate.get('userName', 'Student'))
+    
+    # Course completion text
+    c.setFont("Helvetica", 14)
+    c.setFillColor(colors.black)
+    c.drawCentredString(width/2, height-3.3*inch, "has successfully completed the course")
+    
+    # Course title
+    c.setFont("Helvetica-Bold", 20)
+    c.setFillColor(colors.HexColor('#4a6bdf'))
+    c.drawCentredString(width/2, height-3.9*inch, certificate.get('courseTitle', 'Course'))
+    
+    # Date
+    issue_date = certificate.get('issueDate')
+    if isinstance(issue_date, datetime):
+        date_str = issue_date.strftime('%B %d, %Y')
+    else:
+        date_str = datetime.utcnow().strftime('%B %d, %Y')
+    
+    c.setFont("Helvetica", 12)
+    c.setFillColor(colors.black)
+    c.drawCentredString(width/2, height-4.5*inch, f"Issued on {date_str}")
+    
+    # Instructor signature line
+    c.setFont("Helvetica", 11)
+    c.line(1.5*inch, 1.5*inch, 3.5*inch, 1.5*inch)
+    c.drawCentredString(2.5*inch, 1.2*inch, certificate.get('instructorName', 'Instructor'))
+    c.drawCentredString(2.5*inch, 1*inch, "Instructor")
+    
+    # Certificate ID
+    c.drawCentredString(width-2.5*inch, 1.2*inch, f"Certificate ID: {certificate.get('certificateId', 'N/A')}")
+    c.drawCentredString(width-2.5*inch, 1*inch, f"Verification: {certificate.get('verificationCode', 'N/A')}")
+    
+    # Seal/Logo placeholder
+    c.setFillColor(colors.HexColor('#4a6bdf'))
+    c.circle(width-2.5*inch, height-1.5*inch, 0.5*inch, fill=1)
+    c.setFillColor(colors.white)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(width-2.5*inch, height-1.5*inch, "EDULearn")
+
+
+def generate_simple_pdf(certificate):
+    """Generate a simple PDF if reportlab is not available"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter, landscape
+    
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=landscape(letter))
+    width, height = landscape(letter)
+    
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(width/2, height-100, "CERTIFICATE OF COMPLETION")
+    
+    c.setFont("Helvetica", 16)
+    c.drawCentredString(width/2, height-200, certificate.get('userName', 'Student'))
+    c.drawCentredString(width/2, height-250, certificate.get('courseTitle', 'Course'))
+    c.drawCentredString(width/2, height-300, f"Certificate ID: {certificate.get('certificateId', 'N/A')}")
+    
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def render_certificate_pdf_bytes(certificate):
+    """Pool task: render one certificate and return the PDF bytes"""
+    return generate_certificate_pdf(certificate).getvalue()
+
+
+def render_merged_certificate_pdf(certificates_list, path):
+    """Pool task: render every certificate as a page of one PDF at path"""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.pdfgen import canvas
+    
+    c = canvas.Canvas(path, pagesize=landscape(letter))
+    for certificate in certificates_list:
+        draw_certificate_page(c, certificate)
+        c.showPage()
+    c.save()
@@ -0,0 +1,228 @@
+from bson import ObjectId
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import math
+import os
+import threading
+import time
+
+from utils.metrics import metrics_registry
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+DEFAULT_CACHE_SIZE = 10000
+# The filter is sized for at least this many values, and for twice the
+# current count, so it is not rebuilt on every few issuances
+MIN_CAPACITY = 100000
+# Incremental syncs look this far behind the last one, for clock skew between
+# the processes that generate certificate ObjectIds
+SYNC_OVERLAP_SECONDS = 60
+
+# Values are namespaced so a code is never taken for an id and vice versa
+FIELDS = {'certificateId': 'id:', 'verificationCode': 'code:'}
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings: no false negatives, and false
+    positives at about the configured rate while it holds at most capacity
+    values. Bit positions come from one blake2b digest (double hashing).
+    """
+
+    def __init__(self, capacity, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        positions = self._positions(value)
+        # Syncs overlap, so values come back; count each (apparently) new one once
+        if all(self.bits[position >> 3] & (1 << (position & 7)) for position in positions):
+            return
+        for position in positions:
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def is_full(self):
+        return self.count > self.capacity
+
+
+class CertificateVerifier:
+    """
+    Per-process front of POST /api/certificates/verify.
+
+    A Bloom filter of every issued certificateId and verificationCode answers
+    unknown values without a Mongo round trip, and a small LRU keeps the
+    summaries of recently verified certificates. Certificates issued by this
+    process are added as they are saved; those issued by other processes are
+    picked up by an incremental sync that the background thread runs every
+    sync_interval seconds, so a miss is answered from the filter alone. The
+    filter is rebuilt on the same thread every rebuild_interval seconds, or
+    sooner once it is full.
+    """
+
+    def __init__(self, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE, cache_size=DEFAULT_CACHE_SIZE,
+                 sync_interval=1, rebuild_interval=3600):
+        self.false_positive_rate = false_positive_rate
+        self.cache_size = cache_size
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._filter = None
+        self._synced_at = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._rebuild_requested = threading.Event()
+        self._pid = None
+
+    def start(self, app):
+        """Build the filter on a background thread, once per process (also after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._filter = None
+        threading.Thread(target=self._loop, args=(app,), name='certificate-verifier', daemon=True).start()
+
+    def _loop(self, app):
+        rebuilt_at = None
+        while True:
+            try:
+                with app.app_context():
+                    if (rebuilt_at is None or self._rebuild_requested.is_set()
+                            or time.monotonic() - rebuilt_at >= self.rebuild_interval):
+                        self._rebuild_requested.clear()
+                        self.rebuild()
+                        rebuilt_at = time.monotonic()
+                    else:
+                        self.sync()
+            except Exception as e:
+                app.logger.warning('Certificate filter refresh failed: %s', e)
+            self._rebuild_requested.wait(self.sync_interval)
+
+    def rebuild(self):
+        """Load every issued id and code into a new filter, then swap it in"""
+        from extensions import mongo
+
+        started = datetime.utcnow()
+        certificates = mongo.db.certificates
+        capacity = max(certificates.estimated_document_count() * 2 * len(FIELDS), MIN_CAPACITY)
+        bloom = BloomFilter(capacity, self.false_positive_rate)
+        for certificate in certificates.find({}, {'_id': 0, **{field: 1 for field in FIELDS}}):
+            self._add_to(bloom, certificate)
+        # Catch what was issued while the collection was being read
+        self._sync_into(bloom, started)
+        with self._lock:
+            self._filter = bloom
+            # Cached false positives may have been issued elsewhere since
+            self._cache.clear()
+        return bloom.count
+
+    def sync(self):
+        """Add certificates issued since the last sync, by any process, to the current filter"""
+        if self._filter is not None:
+            self._sync_into(self._filter, datetime.utcnow())
+
+    def add(self, certificate):
+        """Record a certificate issued by this process"""
+        with self._lock:
+            bloom = self._filter
+            for field in FIELDS:
+                self._cache.pop((field, certificate.get(field)), None)
+        if bloom is not None:
+            self._add_to(bloom, certificate)
+            if bloom.is_full():
+                self._rebuild_requested.set()
+
+    def verify(self, field, value):
+        """
+        Summary of the certificate whose field equals value, or None.
+        Every call counts one outcome in edulearn_certificate_verifications_total.
+        """
+        from modles.certificate import Certificate
+
+        key = (field, value)
+        with self._lock:
+            cached = key in self._cache
+            if cached:
+                self._cache.move_to_end(key)
+                summary = self._cache[key]
+            bloom = self._filter
+        if cached:
+            self._count('cache_hit')
+            return summary
+
+        if bloom is not None and FIELDS[field] + value not in bloom:
+            self._count('rejected')
+            return None
+
+        certificate = Certificate.find_for_verification(field, value)
+        summary = Certificate.verification_summary(certificate) if certificate else None
+        if bloom is None:
+            # Filter still loading (or turned off)
+            self._count('unfiltered')
+        else:
+            self._count('db_hit' if certificate else 'false_positive')
+        # Misses are only cached as false positives; the filter answers the others
+        if summary is not None or bloom is not None:
+            self._remember(key, summary)
+        return summary
+
+    def _sync_into(self, bloom, now):
+        from extensions import mongo
+
+        since = (self._synced_at or now) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        query = {'_id': {'$gte': ObjectId.from_datetime(since)}}
+        current = bloom is self._filter
+        for certificate in mongo.db.certificates.find(query, {'_id': 0, **{field: 1 for field in FIELDS}}):
+            if current:
+                self.add(certificate)
+            else:
+                self._add_to(bloom, certificate)
+        self._synced_at = now
+
+    def _add_to(self, bloom, certificate):
+        for field, prefix in FIELDS.items():
+            if certificate.get(field):
+                bloom.add(prefix + certificate[field])
+
+    def _remember(self, key, summary):
+        with self._lock:
+            self._cache[key] = summary
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count(self, outcome):
+        metrics_registry.inc('edulearn_certificate_verifications_total', (outcome,))
+
+
+def configure_certificate_verifier(app):
+    """
+    Create the verifier from the CERTIFICATE_VERIFY_* settings; with the
+    filter on, it is built in the background from the first request.
+    """
+    verifier = CertificateVerifier(
+        false_positive_rate=app.config.get('CERTIFICATE_VERIFY_FALSE_POSITIVE_RATE', DEFAULT_FALSE_POSITIVE_RATE),
+        cache_size=app.config.get('CERTIFICATE_VERIFY_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+        sync_interval=app.config.get('CERTIFICATE_VERIFY_SYNC_SECONDS', 1),
+        rebuild_interval=app.config.get('CERTIFICATE_VERIFY_REBUILD_SECONDS', 3600)
+    )
+    app.extensions['certificate_verifier'] = verifier
+
+    if app.config.get('CERTIFICATE_VERIFY_FILTER', True):
+        @app.before_request
+        def start_certificate_verifier():
+            verifier.start(app)
+
+    return verifier
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_SIZE = 1024
+
+# Answer codes that never match a compiled key: unknown/unhashable answers,
+# and keys that can only be compared in Python (list/dict correctAnswer)
+NO_MATCH = -1
+LOOSE_KEY = -2
+
+
+def question_key(question):
+    return str(question.get('id') or question.get('_id', ''))
+
+
+class AnswerKey:
+    """
+    Compiled answer key of an MCQ assessment.
+
+    Question ids are mapped to dense indices and correct answers to integer
+    codes, so grading is an array comparison. Two values get the same code
+    exactly when they compare equal in Python (dict lookup: 1, 1.0 and True
+    share one), which keeps results identical to comparing answers one by one.
+    """
+
+    def __init__(self, questions):
+        questions = questions or []
+        self.total = len(questions)
+        self.index = {}
+        answers = {}
+        for question in questions:
+            # Later questions with the same id replace earlier ones
+            self.index.setdefault(question_key(question), len(self.index))
+            answers[self.index[question_key(question)]] = question.get('correctAnswer')
+
+        self.codes = {}
+        self.loose = {}
+        self.key_codes = np.full(len(self.index), LOOSE_KEY, dtype=np.int64)
+        for position, answer in answers.items():
+            try:
+                self.key_codes[position] = self.codes.setdefault(answer, len(self.codes))
+            except TypeError:
+                self.loose[position] = answer
+
+    def _encode(self, user_answers):
+        """(question index, answer code) arrays of one submission; -1 index for unknown questions"""
+        positions, codes, loose_hits = [], [], 0
+        for answer in user_answers:
+            position = self.index.get(str(answer.get('questionId', '')), NO_MATCH)
+            value = answer.get('answer')
+            if position in self.loose:
+                loose_hits += value == self.loose[position]
+                position = NO_MATCH
+            try:
+                code = self.codes.get(value, NO_MATCH)
+            except TypeError:
+                code = NO_MATCH
+            positions.append(position)
+            codes.append(code)
+        return positions, codes, loose_hits
+
+    def count_correct(self, submissions):
+        """Correct answers of every submission (a list of answer lists), in one comparison"""
+        owners, positions, codes = [], [], []
+        extra = np.zeros(len(submissions), dtype=np.int64)
+        for number, user_answers in enumerate(submissions):
+            if not user_answers:
+                continue
+            submission_positions, submission_codes, extra[number] = self._encode(user_answers)
+            owners.extend([number] * len(submission_positions))
+            positions.extend(submission_positions)
+            codes.extend(submission_codes)
+        if not positions:
+            return extra
+
+        positions = np.asarray(positions, dtype=np.int64)
+        codes = np.asarray(codes, dtype=np.int64)
+        known = positions >= 0
+        correct = np.zeros(len(positions), dtype=bool)
+        correct[known] = self.key_codes[positions[known]] == codes[known]
+        return np.bincount(np.asarray(owners, dtype=np.int64)[correct], minlength=len(submissions)) + extra
+
+    def grade(self, submissions, passing_score):
+        """
+        [(score, passed)] for a batch of submissions, with the arithmetic of
+        the original per-answer grading: percentage of all questions, pass
+        decided on the unrounded score, score rounded to 2 decimals.
+        """
+        if not self.total:
+            return [(0, False)] * len(submissions)
+        scores = self.count_correct(submissions) / self.total * 100
+        graded = []
+        for user_answers, score in zip(submissions, scores.tolist()):
+            if not user_answers:
+                graded.append((0, False))
+            else:
+                graded.append((round(score, 2), score >= passing_score))
+        return graded
+
+
+class AnswerKeyCache:
+    """Per-process LRU of compiled answer keys, keyed on assessment id and updatedAt"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, assessment):
+        key = str(assessment['_id'])
+        version = assessment.get('updatedAt')
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        compiled = AnswerKey(assessment.get('questions'))
+        with self._lock:
+            self._entries[key] = (version, compiled)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+answer_keys = AnswerKeyCache()
+
+
+def grade_submissions(assessment, submissions):
+    """Grade a batch of answer lists against an MCQ assessment's cached key"""
+    return answer_keys.get(assessment).grade(submissions, assessment['passingScore'])
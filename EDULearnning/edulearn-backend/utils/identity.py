@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_SIZE = 10000
+
+_MISSING = object()
+
+
+class IdentityCache:
+    """
+    Per-process TTL/LRU cache of {user_id: {'role', 'isActive'}}.
+
+    Used by the admin decorators so role checks don't cost a users lookup on
+    every request. Entries are dropped on writes through User.update_by_id;
+    the TTL bounds staleness for writes made by other worker processes.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the cached identity (None for unknown users) or _MISSING"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return _MISSING
+
+    def set(self, user_id, identity):
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, identity)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'maxSize': self.max_size, 'ttl': self.ttl}
+
+
+identity_cache = IdentityCache()
+
+
+def configure_identity_cache(app):
+    """Apply IDENTITY_CACHE_TTL / IDENTITY_CACHE_SIZE from the app config"""
+    identity_cache.ttl = app.config.get('IDENTITY_CACHE_TTL', DEFAULT_TTL_SECONDS)
+    identity_cache.max_size = app.config.get('IDENTITY_CACHE_SIZE', DEFAULT_MAX_SIZE)
+    identity_cache.clear()
+
+
+def resolve_identity(user_id):
+    """Get {'role', 'isActive'} for a user, or None if the user doesn't exist"""
+    identity = identity_cache.get(user_id)
+    if identity is not _MISSING:
+        return identity
+
+    from modles.user import User
+    try:
+        user = User.find_by_id(user_id, projection={'role': 1, 'isActive': 1})
+    except Exception:
+        user = None
+    identity = None
+    if user:
+        identity = {'role': user.get('role'), 'isActive': user.get('isActive', True)}
+    identity_cache.set(user_id, identity)
+    return identity
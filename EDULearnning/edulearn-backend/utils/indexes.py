@@ -0,0 +1,178 @@
+import click
+
+# Index options that change index behaviour; anything else (v, ns, background)
+# is ignored when comparing a declared index with the one on the server.
+COMPARED_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds', 'collation')
+
+
+class IndexConflictError(Exception):
+    """Raised when an existing index clashes with a declared one"""
+
+
+def index_models():
+    """Return every model class that declares indexes"""
+    from modles.user import User
+    from modles.course import Course
+    from modles.assessment import Assessment
+    from modles.test_result import TestResult
+    from modles.certificate import Certificate
+    from modles.message import Message, Conversation
+    from modles.regrade_job import RegradeJob
+    from modles.assessment_progress import AssessmentProgress, CourseProgress
+
+    return [User, Course, Assessment, TestResult, Certificate, Message, Conversation, RegradeJob,
+            AssessmentProgress, CourseProgress]
+
+
+def _key_of(spec):
+    return tuple((field, direction) for field, direction in spec['key'].items())
+
+
+def _options_of(spec):
+    return {opt: spec[opt] for opt in COMPARED_OPTIONS if opt in spec}
+
+
+def reconcile_indexes(db, models=None, create=True):
+    """
+    Compare declared indexes against the server and create the missing ones.
+
+    Returns a report per collection with the 'created', 'missing' (when
+    create=False), 'extra' and 'conflicts' index names. Raises
+    IndexConflictError if any declared index clashes with an existing one,
+    after reporting every collection so the whole picture is visible.
+    """
+    report = {}
+    conflicts = []
+
+    for model in models or index_models():
+        collection = db[model.COLLECTION]
+        existing = collection.index_information()
+        existing_by_key = {}
+        for name, info in existing.items():
+            info = dict(info, name=name, key=dict(info['key']))
+            existing_by_key[_key_of(info)] = info
+
+        entry = report.setdefault(model.COLLECTION, {
+            'created': [], 'missing': [], 'extra': [], 'conflicts': []
+        })
+        declared_keys = set()
+        to_create = []
+
+        for index in model.INDEXES:
+            spec = index.document
+            key = _key_of(spec)
+            declared_keys.add(key)
+            current = existing_by_key.get(key)
+
+            if current is None:
+                same_name = existing.get(spec['name'])
+                if same_name is not None:
+                    entry['conflicts'].append(spec['name'])
+                    conflicts.append(f"{model.COLLECTION}.{spec['name']}: name already used with key {same_name['key']}")
+                else:
+                    to_create.append(spec)
+                continue
+
+            if current['name'] != spec['name'] or _options_of(current) != _options_of(spec):
+                entry['conflicts'].append(spec['name'])
+                conflicts.append(
+                    f"{model.COLLECTION}.{spec['name']}: exists as {current['name']} "
+                    f"with options {_options_of(current)}, declared {_options_of(spec)}"
+                )
+
+        for key, info in existing_by_key.items():
+            if info['name'] != '_id_' and key not in declared_keys:
+                entry['extra'].append(info['name'])
+
+        for spec in to_create:
+            if create:
+                options = {k: v for k, v in spec.items() if k != 'key'}
+                collection.create_index(list(spec['key'].items()), background=True, **options)
+                entry['created'].append(spec['name'])
+            else:
+                entry['missing'].append(spec['name'])
+
+    if conflicts:
+        raise IndexConflictError('Index conflicts found:\n  ' + '\n  '.join(conflicts))
+
+    return report
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        yield plan['stage']
+    for child_key in ('inputStage', 'queryPlan'):
+        if child_key in plan:
+            yield from _plan_stages(plan[child_key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+def audit_query_plans(db, models=None):
+    """
+    Explain every declared query shape and return one finding per shape,
+    flagged with collscan=True when the winning plan scans the collection.
+    """
+    findings = []
+    for model in models or index_models():
+        collection = db[model.COLLECTION]
+        for shape in model.QUERY_SHAPES:
+            cursor = collection.find(shape['filter'])
+            if shape.get('sort'):
+                cursor = cursor.sort(shape['sort'])
+            explain = cursor.explain()
+            winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+            stages = list(_plan_stages(winning_plan))
+            findings.append({
+                'collection': model.COLLECTION,
+                'filter': shape['filter'],
+                'sort': shape.get('sort'),
+                'stages': stages,
+                'collscan': 'COLLSCAN' in stages
+            })
+    return findings
+
+
+def register_index_commands(app):
+    """Attach the `flask indexes sync|audit` commands to the app"""
+    from extensions import mongo
+
+    @app.cli.group('indexes')
+    def indexes_cli():
+        """Manage MongoDB indexes declared on the models"""
+
+    @indexes_cli.command('sync')
+    @click.option('--dry-run', is_flag=True, help='Only report missing indexes')
+    def sync_command(dry_run):
+        """Create missing indexes, report extra ones and fail on conflicts"""
+        try:
+            report = reconcile_indexes(mongo.db, create=not dry_run)
+        except IndexConflictError as e:
+            raise click.ClickException(str(e))
+        for collection, entry in report.items():
+            for status in ('created', 'missing', 'extra'):
+                for name in entry[status]:
+                    click.echo(f"{collection}: {status} {name}")
+        click.echo('Indexes reconciled')
+
+    @indexes_cli.command('unique-certificates')
+    def unique_certificates_command():
+        """Remove duplicate (userId, courseId) certificates and make userId_1_courseId_1 unique"""
+        from modles.certificate import Certificate
+        removed = Certificate.make_user_course_unique(mongo.db)
+        click.echo(f'{removed} duplicate certificates removed; userId_1_courseId_1 is unique')
+
+    @indexes_cli.command('audit')
+    def audit_command():
+        """Explain every model query shape and flag collection scans"""
+        findings = audit_query_plans(mongo.db)
+        scans = [f for f in findings if f['collscan']]
+        for finding in findings:
+            status = 'COLLSCAN' if finding['collscan'] else 'ok'
+            click.echo(f"{finding['collection']} {finding['filter']} sort={finding['sort']}: "
+                       f"{status} ({' > '.join(finding['stages'])})")
+        if scans:
+            raise click.ClickException(f'{len(scans)} query shape(s) use a collection scan')
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import queue
+import threading
+
+# Events buffered per connection before new ones are dropped; a client that
+# falls this far behind resyncs from the REST endpoints when it reconnects.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class MessageBus:
+    """In-process pub/sub of per-user events for the messaging stream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        """Register a connection for a user and return its event queue"""
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(str(user_id), set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self._subscribers.get(str(user_id))
+            if queues is None:
+                return
+            queues.discard(q)
+            if not queues:
+                del self._subscribers[str(user_id)]
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return str(user_id) in self._subscribers
+
+    def publish(self, user_id, event, data):
+        """Send an event to every open connection of a user"""
+        with self._lock:
+            queues = list(self._subscribers.get(str(user_id), ()))
+        for q in queues:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+
+class AsyncMessageBus:
+    """
+    MessageBus for the ASGI messaging app: asyncio queues, used from one event loop.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        q = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(str(user_id), set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        queues = self._subscribers.get(str(user_id))
+        if queues is None:
+            return
+        queues.discard(q)
+        if not queues:
+            del self._subscribers[str(user_id)]
+
+    def has_subscribers(self, user_id):
+        return str(user_id) in self._subscribers
+
+    def publish(self, user_id, event, data):
+        for q in list(self._subscribers.get(str(user_id), ())):
+            try:
+                q.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass
+
+
+def format_sse(event, data):
+    """Serialize one event in text/event-stream format"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def start_change_stream_listener(app, collection_name, on_insert):
+    """
+    Watch inserts on a collection and hand each new document to on_insert.
+
+    Used so every worker process sees messages sent through any other
+    worker; requires MongoDB running as a replica set.
+    """
+    from extensions import mongo
+
+    def listen():
+        with app.app_context():
+            pipeline = [{'$match': {'operationType': 'insert'}}]
+            resume_token = None
+            while True:
+                try:
+                    with mongo.db[collection_name].watch(pipeline, resume_after=resume_token) as stream:
+                        for change in stream:
+                            resume_token = stream.resume_token
+                            on_insert(change['fullDocument'])
+                except Exception as e:
+                    app.logger.warning('Change stream on %s interrupted: %s', collection_name, e)
+                    threading.Event().wait(5)
+
+    thread = threading.Thread(target=listen, name=f'{collection_name}-change-stream', daemon=True)
+    thread.start()
+    return thread
+
+
+async def watch_inserts(collection, on_insert, logger):
+    """
+    Async counterpart of start_change_stream_listener for a Motor collection;
+    run it as a task, on_insert is awaited for every new document.
+    """
+    pipeline = [{'$match': {'operationType': 'insert'}}]
+    resume_token = None
+    while True:
+        try:
+            async with collection.watch(pipeline, resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    await on_insert(change['fullDocument'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning('Change stream on %s interrupted: %s', collection.name, e)
+            await asyncio.sleep(5)
+
+
+# Shared bus for the whole process
+message_bus = MessageBus()
@@ -0,0 +1,267 @@
+from contextvars import ContextVar
+from flask import g, request
+from pymongo import monitoring
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Mongo commands issued outside a request (startup, background threads)
+BACKGROUND = 'background'
+
+# name -> (type, help, label names, buckets)
+METRICS = {
+    'edulearn_http_requests_total': (
+        'counter', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status'), None),
+    'edulearn_http_request_duration_seconds': (
+        'histogram', 'Time to produce the response (streamed bodies excluded)', ('endpoint',), LATENCY_BUCKETS),
+    'edulearn_http_response_size_bytes': (
+        'histogram', 'Response body size, when known up front', ('endpoint',), SIZE_BUCKETS),
+    'edulearn_http_request_mongo_commands': (
+        'histogram', 'Mongo commands issued per request', ('endpoint',), COMMAND_COUNT_BUCKETS),
+    'edulearn_mongo_commands_total': (
+        'counter', 'Mongo commands by endpoint, collection and command', ('endpoint', 'collection', 'command'), None),
+    'edulearn_mongo_command_failures_total': (
+        'counter', 'Failed Mongo commands', ('endpoint', 'collection', 'command'), None),
+    'edulearn_mongo_command_duration_seconds': (
+        'histogram', 'Mongo command round-trip time', ('endpoint', 'collection', 'command'), MONGO_BUCKETS),
+    'edulearn_certificate_verifications_total': (
+        'counter', 'Certificate verifications by outcome (cache_hit, db_hit, rejected, false_positive, unfiltered)',
+        ('outcome',), None),
+}
+
+
+class MetricsRegistry:
+    """
+    Per-process counters and histograms, keyed by metric name and label values.
+
+    Histograms are stored as [per-bucket counts (+Inf last), sum, count] so
+    snapshots from several worker processes can be merged by adding them up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in METRICS}
+        self._flusher_pid = None
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        with self._lock:
+            state = self._values[name].get(labels)
+            if state is None:
+                state = self._values[name][labels] = [[0] * (len(buckets) + 1), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            else:
+                state[0][-1] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: [[list(labels), value if METRICS[name][0] == 'counter' else [list(value[0]), value[1], value[2]]]
+                           for labels, value in series.items()]
+                    for name, series in self._values.items()}
+
+    def flush(self, directory):
+        """Write this worker's snapshot to <directory>/metrics-<pid>.json"""
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+
+    def start_flusher(self, directory, interval):
+        """Flush periodically from a daemon thread; once per process (also after a fork)"""
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush(directory)
+                except OSError:
+                    pass
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+
+def merge_snapshots(snapshots):
+    """Add up snapshots of several workers into {name: {labels: value}}"""
+    merged = {name: {} for name in METRICS}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in merged:
+                continue
+            for labels, value in series:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+                if current is None:
+                    merged[name][labels] = value
+                elif METRICS[name][0] == 'counter':
+                    merged[name][labels] = current + value
+                else:
+                    merged[name][labels] = [[a + b for a, b in zip(current[0], value[0])],
+                                            current[1] + value[1], current[2] + value[2]]
+    return merged
+
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    escaped = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                       for k, v in pairs)
+    return '{' + escaped + '}' if escaped else ''
+
+
+def render_prometheus(merged, workers=1):
+    """Prometheus text exposition format of merged metrics"""
+    lines = ['# HELP edulearn_metrics_workers Worker processes included in these metrics',
+             '# TYPE edulearn_metrics_workers gauge',
+             f'edulearn_metrics_workers {workers}']
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if kind == 'counter':
+                lines.append(f'{name}{_label_text(label_names, labels)} {value}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_label_text(label_names, labels, ("le", bound))} {cumulative}')
+            lines.append(f'{name}_sum{_label_text(label_names, labels)} {total}')
+            lines.append(f'{name}_count{_label_text(label_names, labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class _RequestStats:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.commands = 0
+
+
+# Stats of the request being handled in this thread/context
+_current_request = ContextVar('metrics_request', default=None)
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Counts and times every Mongo command, attributed to the Flask endpoint that issued it"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        stats = _current_request.get()
+        endpoint = stats.endpoint if stats else BACKGROUND
+        if stats:
+            stats.commands += 1
+        command = event.command
+        collection = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (endpoint, collection, event.command_name)
+
+    def _finish(self, event, failed):
+        with self._lock:
+            labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels is None:
+            return
+        self.registry.inc('edulearn_mongo_commands_total', labels)
+        if failed:
+            self.registry.inc('edulearn_mongo_command_failures_total', labels)
+        self.registry.observe('edulearn_mongo_command_duration_seconds', labels, event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+metrics_registry = MetricsRegistry()
+
+
+def configure_metrics(app):
+    """
+    Install request hooks and return the pymongo event listeners to pass to
+    the Mongo client (empty when METRICS_ENABLED is off).
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return []
+
+    directory = app.config.get('METRICS_DIR')
+    interval = app.config.get('METRICS_FLUSH_SECONDS', 10)
+
+    @app.before_request
+    def start_request_metrics():
+        if directory:
+            metrics_registry.start_flusher(directory, interval)
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        g._metrics_started = time.perf_counter()
+        g._metrics_stats = _RequestStats(endpoint)
+        g._metrics_token = _current_request.set(g._metrics_stats)
+
+    @app.after_request
+    def record_request_metrics(response):
+        stats = g.pop('_metrics_stats', None)
+        if stats is None:
+            return response
+        endpoint = (stats.endpoint,)
+        metrics_registry.inc('edulearn_http_requests_total', (stats.endpoint, request.method, str(response.status_code)))
+        metrics_registry.observe('edulearn_http_request_duration_seconds', endpoint,
+                                 time.perf_counter() - g._metrics_started)
+        if response.content_length is not None:
+            metrics_registry.observe('edulearn_http_response_size_bytes', endpoint, response.content_length)
+        metrics_registry.observe('edulearn_http_request_mongo_commands', endpoint, stats.commands)
+        return response
+
+    @app.teardown_request
+    def reset_request_metrics(_exc):
+        token = g.pop('_metrics_token', None)
+        if token is not None:
+            try:
+                _current_request.reset(token)
+            except ValueError:
+                # Torn down from another context (e.g. a streamed response); just clear it
+                _current_request.set(None)
+
+    return [CommandMetricsListener(metrics_registry)]
+
+
+def collect_metrics(app):
+    """Prometheus text for this worker, or for every worker sharing METRICS_DIR"""
+    directory = app.config.get('METRICS_DIR')
+    if not directory:
+        return render_prometheus(merge_snapshots([metrics_registry.snapshot()]))
+
+    metrics_registry.flush(directory)
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return render_prometheus(merge_snapshots(snapshots), workers=len(snapshots))
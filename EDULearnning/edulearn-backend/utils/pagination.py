@@ -0,0 +1,71 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Filtered approximate totals stop counting here so they stay cheap
+APPROX_COUNT_CAP = 10000
+
+
+class InvalidCursorError(ValueError):
+    """Raised when an `after` token cannot be decoded"""
+
+
+def encode_cursor(doc_id):
+    """Encode the sort key of the last returned document as an opaque token"""
+    payload = json.dumps({'id': str(doc_id)}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode an `after` token back into the ObjectId it points at"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return ObjectId(payload['id'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursorError('Invalid pagination cursor')
+
+
+def parse_limit(raw_limit, default=DEFAULT_PAGE_SIZE):
+    """Parse a `limit` query argument, clamped to [1, MAX_PAGE_SIZE]"""
+    try:
+        limit = int(raw_limit) if raw_limit is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(collection, query, after=None, limit=DEFAULT_PAGE_SIZE, projection=None):
+    """
+    Fetch one page of `query` ordered by _id, starting after the `after` token.
+
+    Returns (docs, next_cursor); next_cursor is None on the last page. One
+    extra document is fetched to know whether another page exists, so no
+    count is needed.
+    """
+    page_query = dict(query)
+    if after:
+        page_query['_id'] = {'$gt': decode_cursor(after)}
+
+    docs = list(collection.find(page_query, projection).sort('_id', 1).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1]['_id'])
+    return docs, next_cursor
+
+
+def approximate_total(collection, query):
+    """
+    Cheap total for pagination UIs.
+
+    Unfiltered collections use the collection metadata count; filtered ones
+    are counted up to APPROX_COUNT_CAP. Returns (total, exact).
+    """
+    if not query:
+        return collection.estimated_document_count(), False
+    total = collection.count_documents(query, limit=APPROX_COUNT_CAP)
+    return total, total < APPROX_COUNT_CAP
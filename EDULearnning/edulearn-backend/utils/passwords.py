@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE = 64
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing/verification on a bounded thread pool.
+
+    The KDFs release the GIL, so a fixed number of workers caps how much CPU
+    a login storm can take while the other request threads keep serving
+    cheap endpoints. Requests beyond workers + max_queue are rejected
+    immediately instead of piling up.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configure(method, workers, max_queue)
+
+    def configure(self, method, workers, max_queue):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self.method = method
+            self.workers = workers
+            self.max_queue = max_queue
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            self._slots = threading.BoundedSemaphore(workers + max_queue)
+            self._method_prefix = None
+            self._stats = {
+                'completed': 0, 'rejected': 0,
+                'queueTimeTotal': 0.0, 'queueTimeMax': 0.0,
+                'runTimeTotal': 0.0, 'runTimeMax': 0.0
+            }
+
+    def _run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusy('Too many concurrent password operations, please retry')
+
+        submitted = time.monotonic()
+
+        def task():
+            started = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                finished = time.monotonic()
+                self._record(started - submitted, finished - started)
+
+        try:
+            return self._executor.submit(task).result()
+        finally:
+            self._slots.release()
+
+    def _record(self, queue_time, run_time):
+        with self._lock:
+            stats = self._stats
+            stats['completed'] += 1
+            stats['queueTimeTotal'] += queue_time
+            stats['queueTimeMax'] = max(stats['queueTimeMax'], queue_time)
+            stats['runTimeTotal'] += run_time
+            stats['runTimeMax'] = max(stats['runTimeMax'], run_time)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True when a stored hash was made with other parameters than the configured ones"""
+        if self._method_prefix is None:
+            # Werkzeug expands defaults (e.g. 'scrypt' -> 'scrypt:32768:8:1'); learn the full form once
+            self._method_prefix = self.hash('').split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._method_prefix
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['completed'] or 1
+        stats['queueTimeAvg'] = stats['queueTimeTotal'] / completed
+        stats['runTimeAvg'] = stats['runTimeTotal'] / completed
+        stats.update({'method': self.method, 'workers': self.workers, 'maxQueue': self.max_queue})
+        return stats
+
+
+password_hasher = PasswordHasher()
+
+
+def configure_password_hasher(app):
+    """Apply PASSWORD_HASH_* settings from the app config"""
+    password_hasher.configure(
+        app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS),
+        app.config.get('PASSWORD_HASH_MAX_QUEUE', DEFAULT_MAX_QUEUE)
+    )
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+class RenderedFileCache:
+    """
+    Content-addressed on-disk cache for rendered documents.
+
+    Keys are hashes of everything that affects the output (template version
+    plus the rendered fields), so a changed template or document simply maps
+    to a new file. Files live under <directory>/v<version>/ so stale versions
+    can be removed with a plain directory delete.
+    """
+
+    def __init__(self, directory, version, suffix='.pdf'):
+        self.directory = directory
+        self.version = version
+        self.suffix = suffix
+
+    def key_for(self, fields):
+        payload = json.dumps({'version': self.version, 'fields': fields}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f'v{self.version}', key[:2], key + self.suffix)
+
+    def get_or_render(self, key, render):
+        """Return the path of the cached file, calling render() -> bytes on a miss"""
+        path = self.path_for(key)
+        if os.path.isfile(path):
+            return path
+
+        data = render()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
@@ -0,0 +1,143 @@
+from contextvars import ContextVar
+from flask import current_app, g, request
+from pymongo import monitoring
+import os
+import traceback
+
+# Commands that never come from handler code looping over results
+IGNORED_COMMANDS = {'getMore', 'killCursors', 'endSessions', 'hello', 'isMaster', 'ismaster', 'ping',
+                    'saslStart', 'saslContinue', 'buildInfo', 'abortTransaction', 'commitTransaction'}
+
+# Where the query filter lives in each command
+FILTER_FIELDS = {'find': 'filter', 'count': 'query', 'distinct': 'query', 'findAndModify': 'query'}
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class NPlusOneQueryError(RuntimeError):
+    """Raised at the end of a request that repeated a query shape (N_PLUS_ONE_MODE=raise)"""
+
+
+def shape_of(value):
+    """Structure of a query with every literal replaced by its type name"""
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{key}: {shape_of(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        # $in lists, $and/$or clauses: the shape of distinct members, not their number
+        members = []
+        for item in value:
+            member = shape_of(item)
+            if member not in members:
+                members.append(member)
+        return '[' + ', '.join(members) + ']'
+    return '?' if value is None else type(value).__name__
+
+
+def command_fingerprint(command_name, command):
+    """(command, collection, filter shape) identifying queries that only differ in their values"""
+    collection = command.get(command_name)
+    if command_name == 'aggregate':
+        shape = shape_of(command.get('pipeline', []))
+    elif command_name in ('update', 'delete'):
+        statements = command.get('updates' if command_name == 'update' else 'deletes') or [{}]
+        shape = shape_of([statement.get('q', {}) for statement in statements])
+    elif command_name == 'insert':
+        shape = ''
+    else:
+        shape = shape_of(command.get(FILTER_FIELDS.get(command_name, 'filter'), {}))
+    return command_name, collection if isinstance(collection, str) else '', shape
+
+
+def _call_site():
+    """Innermost frame of the application's own code that issued the command"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if (filename.startswith(BACKEND_DIR + os.sep) and filename != os.path.abspath(__file__)
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, BACKEND_DIR)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class _RequestQueries:
+    def __init__(self):
+        # fingerprint -> [count, first call site]
+        self.shapes = {}
+
+
+# Queries of the request being handled in this thread/context
+_current_queries = ContextVar('n_plus_one_request', default=None)
+
+
+class NPlusOneListener(monitoring.CommandListener):
+    """Fingerprints every command issued inside a request"""
+
+    def started(self, event):
+        queries = _current_queries.get()
+        if queries is None or event.command_name in IGNORED_COMMANDS:
+            return
+        fingerprint = command_fingerprint(event.command_name, event.command)
+        entry = queries.shapes.get(fingerprint)
+        if entry is None:
+            queries.shapes[fingerprint] = [1, _call_site()]
+        else:
+            entry[0] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def repeated_queries(queries, threshold):
+    """Fingerprints issued more than threshold times, most repeated first"""
+    repeated = [(count, fingerprint, call_site)
+                for fingerprint, (count, call_site) in queries.shapes.items() if count > threshold]
+    return sorted(repeated, key=lambda item: -item[0])
+
+
+def configure_query_detector(app):
+    """
+    Install request hooks and return the pymongo event listeners for the
+    N+1 detector (empty unless N_PLUS_ONE_MODE is 'warn' or 'raise').
+    """
+    mode = app.config.get('N_PLUS_ONE_MODE', 'off')
+    if mode not in ('warn', 'raise'):
+        return []
+    threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+
+    @app.before_request
+    def start_query_detector():
+        g._n_plus_one = _RequestQueries()
+        g._n_plus_one_token = _current_queries.set(g._n_plus_one)
+
+    @app.after_request
+    def check_query_detector(response):
+        queries = g.pop('_n_plus_one', None)
+        if queries is None:
+            return response
+        repeated = repeated_queries(queries, threshold)
+        if not repeated:
+            return response
+
+        view = current_app.view_functions.get(request.endpoint)
+        handler = f'{view.__module__}.{view.__name__}' if view else request.endpoint
+        lines = [f'{count}x {command} {collection} {shape} at {call_site}'
+                 for count, (command, collection, shape), call_site in repeated]
+        message = f'Repeated queries in {handler} ({request.method} {request.path}): ' + '; '.join(lines)
+        if mode == 'raise':
+            raise NPlusOneQueryError(message)
+        current_app.logger.warning(message)
+        return response
+
+    @app.teardown_request
+    def reset_query_detector(_exc):
+        g.pop('_n_plus_one', None)
+        token = g.pop('_n_plus_one_token', None)
+        if token is not None:
+            try:
+                _current_queries.reset(token)
+            except ValueError:
+                _current_queries.set(None)
+
+    return [NPlusOneListener()]
@@ -0,0 +1,245 @@
+from pymongo import UpdateOne
+from datetime import datetime
+import click
+import os
+import socket
+import threading
+import time
+
+from utils.grading import grade_submissions
+
+
+def regrade_operations(assessment, results):
+    """
+    UpdateOne operations for the results whose score or passed flag changes,
+    and their users. Each one only applies while the result still has the
+    score and passed flag that were read, so it never overwrites a newer grade.
+    """
+    now = datetime.utcnow()
+    if assessment['type'] == 'mcq':
+        graded = grade_submissions(assessment, [result.get('answers') for result in results])
+    else:
+        # Assignments keep the instructor's score; only graded ones can pass
+        graded = [(result.get('score'), 'gradedAt' in result and result.get('score', 0) >= assessment['passingScore'])
+                  for result in results]
+
+    operations, user_ids = [], set()
+    for result, (score, passed) in zip(results, graded):
+        if result.get('score') != score or result.get('passed') != passed:
+            operations.append(UpdateOne({'_id': result['_id'], 'score': result.get('score'),
+                                         'passed': result.get('passed')},
+                                        {'$set': {'score': score, 'passed': passed, 'regradedAt': now}}))
+            user_ids.add(result.get('userId'))
+    return operations, user_ids
+
+
+class RegradeWorker:
+    """
+    Background thread that drains the regrade_jobs queue of this process.
+
+    A job streams the assessment's results in _id order, re-scores each batch
+    with the compiled answer key and writes the changes with bulk_write in
+    small chunks, pausing between them so live traffic keeps priority. After
+    every batch it checkpoints the last _id, so a job picked up again (after
+    a crash, via a stale heartbeat) continues where it stopped.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get('REGRADE_BATCH_SIZE', 500)
+        self.write_chunk = app.config.get('REGRADE_WRITE_CHUNK', 100)
+        self.throttle = app.config.get('REGRADE_THROTTLE_SECONDS', 0.05)
+        self.poll_interval = app.config.get('REGRADE_POLL_SECONDS', 5)
+        self.stale_after = app.config.get('REGRADE_STALE_SECONDS', 60)
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread once per process (also after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name='regrade-worker', daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception as e:
+                self.app.logger.warning('Regrade worker error: %s', e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def drain(self):
+        """Run jobs until none is waiting; returns how many were run"""
+        from modles.regrade_job import RegradeJob
+
+        owner = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        count = 0
+        while True:
+            job = RegradeJob.claim(owner, self.stale_after)
+            if job is None:
+                return count
+            try:
+                self.run(job, owner)
+            except Exception as e:
+                self.app.logger.exception('Regrade job %s failed', job['_id'])
+                RegradeJob.finish(str(job['_id']), owner, 'failed', error=str(e))
+            count += 1
+
+    def run(self, job, owner):
+        from extensions import mongo
+        from modles.assessment import Assessment
+        from modles.assessment_progress import AssessmentProgress
+        from modles.regrade_job import RegradeJob
+
+        job_id = str(job['_id'])
+        assessment = Assessment.find_by_id(job['assessmentId'])
+        if assessment is None:
+            RegradeJob.finish(job_id, owner, 'failed', error='Assessment not found')
+            return
+
+        results = mongo.db.test_results
+        if job.get('total') is None:
+            total = results.count_documents({'assessmentId': job['assessmentId']})
+            if not RegradeJob.checkpoint(job_id, owner, {'$set': {'total': total}}):
+                return
+
+        last_id = job.get('lastResultId')
+        while True:
+            query = {'assessmentId': job['assessmentId']}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(results.find(query, {'userId': 1, 'answers': 1, 'score': 1, 'passed': 1, 'gradedAt': 1})
+                         .sort('_id', 1).limit(self.batch_size))
+            if not batch:
+                RegradeJob.finish(job_id, owner, 'done')
+                return
+
+            operations, user_ids = regrade_operations(assessment, batch)
+            changed = 0
+            for start in range(0, len(operations), self.write_chunk):
+                # A superseded job must not write results scored with the old key
+                if not RegradeJob.checkpoint(job_id, owner, {}):
+                    return
+                changed += results.bulk_write(operations[start:start + self.write_chunk],
+                                              ordered=False).modified_count
+                if self.throttle:
+                    time.sleep(self.throttle)
+            # Best scores and the course rollups of the affected users
+            AssessmentProgress.refresh(job['assessmentId'], user_ids)
+
+            last_id = batch[-1]['_id']
+            if not RegradeJob.checkpoint(job_id, owner, {'$set': {'lastResultId': last_id},
+                                                          '$inc': {'processed': len(batch),
+                                                                   'changed': changed}}):
+                # Superseded by a newer change to the assessment, or taken over
+                return
+
+
+def configure_regrade_worker(app):
+    """Create the worker; with REGRADE_WORKER on it starts with the first request"""
+    worker = RegradeWorker(app)
+    app.extensions['regrade_worker'] = worker
+
+    if app.config.get('REGRADE_WORKER', True):
+        @app.before_request
+        def start_regrade_worker():
+            worker.start()
+
+    return worker
+
+
+def enqueue_regrade(assessment_id, reason=None):
+    """Queue a re-grade of an assessment's results and wake this process's worker"""
+    from flask import current_app
+    from modles.regrade_job import RegradeJob
+
+    job_id = RegradeJob.enqueue(assessment_id, reason=reason)
+    worker = current_app.extensions.get('regrade_worker')
+    if worker is not None and current_app.config.get('REGRADE_WORKER', True):
+        worker.start()
+        worker.wake()
+    return job_id
+
+
+def format_job(job):
+    total = job.get('total')
+    return {
+        'jobId': str(job['_id']),
+        'assessmentId': job['assessmentId'],
+        'status': job['status'],
+        'reason': job.get('reason'),
+        'processed': job.get('processed', 0),
+        'changed': job.get('changed', 0),
+        'total': total,
+        'progress': round(min(job.get('processed', 0) / total, 1.0) * 100, 1) if total else None,
+        'createdAt': job['createdAt'].isoformat(),
+        'startedAt': job['startedAt'].isoformat() if job.get('startedAt') else None,
+        'finishedAt': job['finishedAt'].isoformat() if job.get('finishedAt') else None,
+        'error': job.get('error')
+    }
+
+
+def register_progress_commands(app):
+    """Attach `flask progress rebuild` to the app"""
+
+    @app.cli.group('progress')
+    def progress_cli():
+        """Materialized per-user assessment progress"""
+
+    @progress_cli.command('rebuild')
+    def rebuild_command():
+        """Regenerate user_assessment_progress and user_course_progress from test_results"""
+        from modles.assessment_progress import AssessmentProgress
+        click.echo(f'{AssessmentProgress.rebuild()} progress documents written')
+
+
+def register_regrade_commands(app):
+    """Attach the `flask regrade enqueue|retry|run|status` commands to the app"""
+    from extensions import mongo
+
+    @app.cli.group('regrade')
+    def regrade_cli():
+        """Re-score stored test results after an assessment changed"""
+
+    @regrade_cli.command('enqueue')
+    @click.argument('assessment_id')
+    def enqueue_command(assessment_id):
+        """Queue a re-grade of one assessment"""
+        from modles.regrade_job import RegradeJob
+        click.echo(f'Queued job {RegradeJob.enqueue(assessment_id, reason="manual")}')
+
+    @regrade_cli.command('retry')
+    @click.argument('job_id')
+    def retry_command(job_id):
+        """Queue a failed job again; it continues after its last checkpoint"""
+        from bson import ObjectId
+        result = mongo.db.regrade_jobs.update_one({'_id': ObjectId(job_id), 'status': 'failed'},
+                                                  {'$set': {'status': 'queued', 'error': None}})
+        if not result.modified_count:
+            raise click.ClickException('No failed job with that id')
+        click.echo('Job queued')
+
+    @regrade_cli.command('run')
+    def run_command():
+        """Run waiting jobs in the foreground, then exit"""
+        count = app.extensions['regrade_worker'].drain()
+        click.echo(f'{count} job(s) run')
+
+    @regrade_cli.command('status')
+    @click.argument('assessment_id')
+    def status_command(assessment_id):
+        """Show the latest job of an assessment"""
+        from modles.regrade_job import RegradeJob
+        job = RegradeJob.latest_for(assessment_id)
+        if job is None:
+            raise click.ClickException('No regrade job for that assessment')
+        for key, value in format_job(job).items():
+            click.echo(f'{key}: {value}')
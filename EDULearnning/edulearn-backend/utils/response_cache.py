@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+
+class _Flight:
+    """A computation in progress that other requests for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class VersionedResponseCache:
+    """
+    Per-process cache of serialized response bodies, invalidated by a version stamp.
+
+    version_source() returns the current version (e.g. a counter in Mongo that
+    every write bumps); it is re-read at most every version_ttl seconds, and
+    entries of older versions are dropped as soon as a new one is seen. A
+    miss is computed by a single request while concurrent requests for the
+    same key wait for its result.
+    """
+
+    def __init__(self, version_source, version_ttl=1.0, max_entries=1024):
+        self.version_source = version_source
+        self.version_ttl = version_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._version = None
+        self._version_checked_at = 0.0
+
+    def current_version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_ttl:
+            version = self.version_source()
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                self._version_checked_at = now
+        return self._version
+
+    def expire_version(self):
+        """Force the next lookup to re-read the version (call after a local write)"""
+        self._version_checked_at = 0.0
+
+    def get_or_compute(self, key, compute):
+        """
+        Return (body, headers, etag) for key, calling compute() -> (body, headers)
+        on a miss. If compute returns None nothing is cached and None is returned.
+        """
+        full_key = (self.current_version(), key)
+
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            flight = self._inflight.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[full_key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            computed = compute()
+            if computed is not None:
+                body, headers = computed
+                entry = (body, headers, hashlib.sha256(body).hexdigest()[:32])
+                with self._lock:
+                    # Don't store results computed against a version that has since changed
+                    if full_key[0] == self._version:
+                        self._entries[full_key] = entry
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+                flight.result = entry
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'version': self._version}
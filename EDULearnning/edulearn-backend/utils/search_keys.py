@@ -0,0 +1,120 @@
+from pymongo import UpdateOne
+import click
+import re
+import unicodedata
+
+# Field holding the normalized keys of a user, indexed by User.INDEXES
+SEARCH_KEYS_FIELD = 'searchKeys'
+
+# Tokens of a search beyond this many are ignored
+MAX_QUERY_TOKENS = 4
+
+WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Lowercase with accents removed, so 'José' and 'jose' share keys"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold().strip()
+
+
+def search_keys(full_name, email):
+    """Keys a user is found by: every name word, the email and its local part"""
+    keys = set(WORD.findall(normalize(full_name)))
+    email = normalize(email)
+    if email:
+        keys.add(email)
+        keys.add(email.split('@', 1)[0])
+    return sorted(keys)
+
+
+def query_tokens(search_query):
+    """
+    Words of a search box entry. A word containing '@' is kept whole as an
+    email prefix; anything else is split like names are.
+    """
+    tokens = []
+    for part in normalize(search_query).split():
+        for token in ([part] if '@' in part else WORD.findall(part)):
+            if token not in tokens:
+                tokens.append(token)
+    return tokens[:MAX_QUERY_TOKENS]
+
+
+def prefix_condition(token):
+    """
+    Keys starting with token. $elemMatch makes one key satisfy both bounds
+    (a bare range on an array may be met by two different keys) and keeps
+    the index scan to that range.
+    """
+    return {'$elemMatch': {'$gte': token, '$lt': token[:-1] + chr(ord(token[-1]) + 1)}}
+
+
+def search_filters(search_query):
+    """
+    (exact, prefix) filters for a search, or None if it has no searchable
+    words. Every word has to match one of the user's keys: exact as a whole
+    key, prefix as its beginning.
+    """
+    tokens = query_tokens(search_query)
+    if not tokens:
+        return None
+    exact = {SEARCH_KEYS_FIELD: {'$all': tokens}}
+    conditions = [{SEARCH_KEYS_FIELD: prefix_condition(token)} for token in tokens]
+    prefix = conditions[0] if len(conditions) == 1 else {'$and': conditions}
+    return exact, prefix
+
+
+def rank_results(exact, prefix, limit):
+    """Exact key matches first, then prefix matches, each by name"""
+    by_name = lambda user: (normalize(user.get('fullName')), str(user['_id']))
+    ranked, seen = [], set()
+    for user in sorted(exact, key=by_name) + sorted(prefix, key=by_name):
+        if user['_id'] not in seen:
+            seen.add(user['_id'])
+            ranked.append(user)
+    return ranked[:limit]
+
+
+def backfill_search_keys(collection, batch_size=1000, recompute=False, progress=None):
+    """
+    Write search keys of existing users in _id order, one bulk_write per
+    batch. Without recompute only users lacking keys are touched, so an
+    interrupted run just continues where it stopped.
+    """
+    query = {} if recompute else {SEARCH_KEYS_FIELD: {'$exists': False}}
+    last_id = None
+    updated = 0
+    while True:
+        batch_query = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+        batch = list(collection.find(batch_query, {'fullName': 1, 'email': 1})
+                     .sort('_id', 1).limit(batch_size))
+        if not batch:
+            return updated
+        collection.bulk_write([
+            UpdateOne({'_id': user['_id']},
+                      {'$set': {SEARCH_KEYS_FIELD: search_keys(user.get('fullName'), user.get('email'))}})
+            for user in batch
+        ], ordered=False)
+        updated += len(batch)
+        last_id = batch[-1]['_id']
+        if progress:
+            progress(updated)
+
+
+def register_search_commands(app):
+    """Attach `flask users backfill-search-keys` to the app"""
+    from extensions import mongo
+
+    @app.cli.group('users')
+    def users_cli():
+        """Maintenance of the users collection"""
+
+    @users_cli.command('backfill-search-keys')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--all', 'recompute', is_flag=True, help='Recompute keys of every user, not only missing ones')
+    def backfill_command(batch_size, recompute):
+        """Add normalized search keys to existing users"""
+        updated = backfill_search_keys(mongo.db.users, batch_size=batch_size, recompute=recompute,
+                                       progress=lambda n: click.echo(f'{n} users updated'))
+        click.echo(f'Search keys written for {updated} users')
@@ -0,0 +1,203 @@
+from flask import current_app, send_file
+from werkzeug.security import safe_join
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+# Types worth compressing; images, fonts and archives are already compressed
+COMPRESSIBLE_PREFIXES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Preference order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+
+# File name suffix of each variant in cache_dir (after the content hash)
+SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+LONG_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+# Relative asset references in pages: src/href attributes and module import specifiers
+ASSET_REFERENCE = re.compile(rb'''((?:src|href)\s*=\s*["']|\bfrom\s*["']|\bimport\s*\(\s*["'])([^"'?#:$\s]+)(?=["'])''')
+
+
+class StaticEntry:
+    def __init__(self, rel_path, mimetype, etag, mtime):
+        self.rel_path = rel_path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+        # encoding ('identity', 'gzip', 'br') -> (bytes or None, path on disk)
+        self.variants = {}
+
+    def etag_for(self, encoding):
+        """Strong ETag of one variant; each Content-Encoding is a different representation"""
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+
+class StaticManifest:
+    """
+    In-memory manifest of the frontend files, built once at startup.
+
+    Every file gets a content hash (used as ETag and fingerprint) and, for
+    text types, gzip/brotli variants computed ahead of time. HTML pages are
+    loaded last with their references to other files rewritten to
+    ?v=<hash> URLs, which are served as immutable. Variants are
+    written to cache_dir so they can be sent with sendfile or handed to a
+    front proxy via X-Accel-Redirect; small ones are also kept in memory.
+    cache_dir is keyed by content hash, so variants compressed by an earlier
+    process (or another worker) are reused instead of compressed again.
+    """
+
+    def __init__(self, root, cache_dir, exclude_dirs=(), memory_max_bytes=256 * 1024,
+                 accel_redirect_prefix=None, check_mtime=False):
+        self.root = os.path.abspath(root)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.exclude_dirs = {os.path.abspath(d) for d in exclude_dirs}
+        self.memory_max_bytes = memory_max_bytes
+        self.accel_redirect_prefix = accel_redirect_prefix
+        self.check_mtime = check_mtime
+        self.entries = {}
+
+    def build(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames
+                           if not d.startswith('.') and d != '__pycache__'
+                           and os.path.join(dirpath, d) not in self.exclude_dirs]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                rel_path = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/')
+                entries[rel_path] = None
+        # Pages last, so the files they reference are already hashed
+        for rel_path in sorted(entries, key=self._is_page):
+            entries[rel_path] = self._load(rel_path, entries)
+        self.entries = entries
+        return self
+
+    @staticmethod
+    def _is_page(rel_path):
+        return mimetypes.guess_type(rel_path)[0] == 'text/html'
+
+    def _fingerprint_references(self, rel_path, data, entries):
+        """Page bytes with each reference to a non-page manifest file given its ?v=<hash>"""
+        base = posixpath.dirname(rel_path)
+
+        def replace(match):
+            target = posixpath.normpath(posixpath.join(base, match.group(2).decode()))
+            entry = entries.get(target)
+            if entry is None or self._is_page(target):
+                return match.group(0)
+            return match.group(0) + b'?v=' + entry.etag.encode()
+
+        return ASSET_REFERENCE.sub(replace, data)
+
+    def _load(self, rel_path, entries):
+        full_path = os.path.join(self.root, rel_path)
+        with open(full_path, 'rb') as f:
+            data = f.read()
+
+        mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        if mimetype == 'text/html':
+            data = self._fingerprint_references(rel_path, data, entries)
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        entry = StaticEntry(rel_path, mimetype, etag, os.path.getmtime(full_path))
+
+        compressors = {'identity': lambda: data}
+        if mimetype.startswith(COMPRESSIBLE_PREFIXES):
+            compressors['gzip'] = lambda: gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                compressors['br'] = lambda: brotli.compress(data, quality=11)
+
+        for encoding, compress in compressors.items():
+            disk_path = os.path.join(self.cache_dir, etag + SUFFIXES[encoding])
+            payload = data if encoding == 'identity' else None
+            try:
+                size = os.path.getsize(disk_path)
+            except OSError:
+                payload = compress()
+                size = len(payload)
+                # Stored even when it doesn't pay off, so the next start knows not to retry
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, disk_path)
+            if encoding != 'identity' and size >= len(data):
+                continue
+            if size > self.memory_max_bytes:
+                payload = None
+            elif payload is None:
+                with open(disk_path, 'rb') as f:
+                    payload = f.read()
+            entry.variants[encoding] = (payload, disk_path)
+        return entry
+
+    def lookup(self, rel_path):
+        entry = self.entries.get(rel_path)
+        if entry is not None and self.check_mtime:
+            full_path = os.path.join(self.root, rel_path)
+            if not os.path.isfile(full_path):
+                self.entries.pop(rel_path, None)
+                return None
+            if os.path.getmtime(full_path) != entry.mtime:
+                entry = self.entries[rel_path] = self._load(rel_path, self.entries)
+        elif entry is None and self.check_mtime:
+            full_path = safe_join(self.root, rel_path)
+            if full_path and os.path.isfile(full_path) and not self._excluded(full_path):
+                entry = self.entries[rel_path] = self._load(rel_path, self.entries)
+        return entry
+
+    def _excluded(self, full_path):
+        return any(full_path.startswith(d + os.sep) for d in self.exclude_dirs)
+
+    def serve(self, rel_path, request):
+        """Response for a frontend file, or None if it isn't in the manifest"""
+        entry = self.lookup(rel_path)
+        if entry is None:
+            return None
+
+        # A ?v=<hash> fingerprint that matches the content may be cached forever
+        fingerprinted = request.args.get('v') == entry.etag
+        cache_control = LONG_CACHE if fingerprinted else REVALIDATE
+
+        encoding = 'identity'
+        for candidate in ENCODINGS:
+            if candidate in entry.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        etag = entry.etag_for(encoding)
+
+        # Any variant's ETag means the client has this content
+        if any(entry.etag_for(variant) in request.if_none_match for variant in entry.variants):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            response.vary.add('Accept-Encoding')
+            return response
+
+        payload, disk_path = entry.variants[encoding]
+
+        if self.accel_redirect_prefix:
+            response = current_app.response_class(mimetype=entry.mimetype)
+            response.headers['X-Accel-Redirect'] = self.accel_redirect_prefix + os.path.basename(disk_path)
+        elif payload is not None:
+            response = current_app.response_class(payload, mimetype=entry.mimetype)
+        else:
+            response = send_file(disk_path, mimetype=entry.mimetype, conditional=False, etag=False)
+
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
@@ -0,0 +1,41 @@
+import io
+import zipfile
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file object that hands written bytes back in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    Yield a ZIP archive chunk by chunk from an iterable of (name, bytes).
+
+    Each entry is emitted as soon as it is written, so only one entry is
+    held in memory at a time. Stored (uncompressed) by default because the
+    entries are usually already-compressed PDFs.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
@@ -38,8 +38,27 @@ export const authAPI = {
 
 // Course API Calls
 export const courseAPI = {
+  // One catalog page; the cursor for the next one is in the X-Next-Cursor header
+  getCoursesPage: async (after = null, limit = 100) => {
+    const params = new URLSearchParams({ limit });
+    if (after) params.set('after', after);
+    return fetch(`${API_BASE_URL}/courses?${params}`);
+  },
+
+  // Every course, following X-Next-Cursor; resolves to a Response like fetch does
   getAllCourses: async () => {
-    return fetch(`${API_BASE_URL}/courses`);
+    const courses = [];
+    let after = null;
+    do {
+      const res = await courseAPI.getCoursesPage(after);
+      if (!res.ok) return res;
+      courses.push(...await res.json());
+      after = res.headers.get('X-Next-Cursor');
+    } while (after);
+    return new Response(JSON.stringify(courses), {
+      status: 200,
+      headers: { 'Content-Type': 'application/json' }
+    });
   },
   
   getCourseById: async (id) => {
@@ -144,6 +163,19 @@ export const testResultAPI = {
     });
   },
   
+  // Submit queued attempts in one request: [{ assessmentId, answers, timeSpent, idempotencyKey }]
+  // Reusing an attempt's idempotencyKey on retry returns the stored result instead of a new attempt
+  submitBatch: async (attempts, token) => {
+    return fetch(`${API_BASE_URL}/test-results/submit-batch`, {
+      method: 'POST',
+      headers: { 
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`
+      },
+      body: JSON.stringify({ attempts })
+    });
+  },
+  
   // Get user's test results for a course
   getUserCourseResults: async (userId, courseId, token) => {
     return fetch(`${API_BASE_URL}/test-results/user/${userId}/course/${courseId}`, {
@@ -206,6 +238,16 @@ export const certificateAPI = {
     });
   },
   
+  // Issue certificates to every eligible student of a course (instructor/admin)
+  issueCourseCertificates: async (courseId, token) => {
+    return fetch(`${API_BASE_URL}/certificates/course/${courseId}/issue`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+  },
+
   // Get user's certificates
   getUserCertificates: async (userId, token) => {
     return fetch(`${API_BASE_URL}/certificates/user/${userId}`, {
@@ -319,13 +361,20 @@ export const messageAPI = {
     });
   },
 
-  // Get messages in a specific conversation
-  getConversationMessages: async (conversationId, token) => {
-    return fetch(`${API_BASE_URL}/messages/conversation/${conversationId}`, {
+  // Get messages in a specific conversation (latest page by default;
+  // options.before / options.since page back or fetch only newer messages)
+  getConversationMessages: async (conversationId, token, options = {}) => {
+    const queryParams = new URLSearchParams(options);
+    return fetch(`${API_BASE_URL}/messages/conversation/${conversationId}?${queryParams}`, {
       headers: { 'Authorization': `Bearer ${token}` }
     });
   },
 
+  // Open the live event stream ('message' and 'unread' events)
+  openStream: (token) => {
+    return new EventSource(`${API_BASE_URL}/messages/stream?jwt=${encodeURIComponent(token)}`);
+  },
+
   // Send a new message
   sendMessage: async (messageData, token) => {
     return fetch(`${API_BASE_URL}/messages/send`, {